@@ -1,22 +1,110 @@
-from dash import Dash, html, dcc, Input, Output, State, no_update
+from datetime import date
+from collections import OrderedDict
+import hashlib
+import json
+import threading
+import uuid
+
+from dash import Dash, html, dcc, dash_table, Input, Output, State, MATCH, Patch, no_update
 import dash_bootstrap_components as dbc
+from flask import jsonify, request
+import numpy as np
+import plotly.graph_objects as go
 import pandas as pd
-import pyodbc
 from conexion_bd import (
+    COLUMNAS_POSICIONES,
     crear_usuario,
     verificar_credenciales,
-    asignar_ubicacion,
-    liberar_ubicacion,
-    obtener_opciones_disponibles,
-    obtener_todas_las_posiciones,
-    ingresar_pallet,
-    conectar_bd    
+    contadores_consultas,
+    estado_disyuntor
+)
+from cache_almacen import obtener_snapshot, obtener_opciones, obtener_tipos_almacen, desactualizado_desde
+from operaciones import ingresar, asignar, liberar, liberar_lote, resultado
+from movimientos import historial_pallet, movimientos_rack_dia
+import perfilador
+import calentamiento
+import consistencia
+import diario_escaneos
+from ocupacion import utilizacion, formatear_utilizacion
+from pronostico import VENTANA_HORAS, TTL_TASAS, pronosticar, describir_horas
+from indice_busqueda import buscar
+from envejecimiento import (
+    RANGOS_DIAS,
+    COLOR_LIBRE,
+    calcular_envejecimiento,
+    matrices_envejecimiento,
+    resumen_envejecimiento
 )
 
 # --- Inicialización de la Aplicación ---
-app = Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP], suppress_callback_exceptions=True)
+# compress=True activa Flask-Compress: negocia br/gzip para las respuestas de los
+# callbacks (_dash-update-component) y los recursos estáticos.
+app = Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP], suppress_callback_exceptions=True, compress=True)
+
+# Perfilador opcional por petición (PERFILADOR=1, o la cabecera "X-Perfilar: 1" con PERFILADOR_CABECERA=1)
+perfilador.instalar(app.server)
+
+# Conexiones iniciales y cachés en segundo plano; /ready responde 503 hasta terminar
+calentamiento.iniciar()
+
+# Revisión periódica de ubicaciones, asignacion_pallet y status_ubicacion
+consistencia.iniciar()
+
+
+def dataframe_posiciones(posiciones):
+    """DataFrame de posiciones armado directamente desde las columnas del snapshot."""
+    return pd.DataFrame(dict(zip(COLUMNAS_POSICIONES, posiciones.columnas)))
+
+
+def aviso_desactualizado(tipo_almacen):
+    """Aviso para las vistas cuando se muestran posiciones leídas antes de perder la conexión."""
+    desde = desactualizado_desde(tipo_almacen)
+    if desde is None:
+        return None
+    return dbc.Alert(
+        f"Sin conexión con la base de datos: se muestran las posiciones de las {desde:%H:%M:%S}. "
+        "La vista se actualizará sola cuando la base vuelva a responder.",
+        color="warning",
+    )
+
+
+MENSAJE_SIN_CONEXION = "Sin conexión con la base de datos. Se reintentará automáticamente."
+
+
+def aviso_sin_conexion(error):
+    """Aviso para las vistas cuando la base no responde y todavía no hay posiciones leídas."""
+    print(f"Sin conexión con la base de datos: {error}")
+    return dbc.Alert(MENSAJE_SIN_CONEXION, color="danger")
 
 # --- Layouts ---
+def selector_tipo_almacen(id_selector):
+    """
+    Dropdown para elegir la cámara (tipo_almacen) que muestran las vistas. Si la base
+    no responde y todavía no se leyeron las cámaras, se muestra vacío con un aviso.
+    """
+    aviso = None
+    try:
+        tipos = obtener_tipos_almacen()
+    except ConnectionError as e:
+        tipos = []
+        aviso = dbc.Alert(
+            "Sin conexión con la base de datos: no se pudieron leer las cámaras. Recargue la página en unos minutos.",
+            color="danger",
+        )
+        print(f"Sin conexión con la base de datos al leer las cámaras: {e}")
+    return html.Div([
+        aviso,
+        dcc.Dropdown(
+            id=id_selector,
+            options=[{"label": t, "value": t} for t in tipos],
+            value=tipos[0] if tipos else None,
+            clearable=False,
+            placeholder="Seleccione Tipo de Almacén",
+            style={"marginBottom": "20px"},
+        ),
+    ])
+
+
 def sidebar():
     return dbc.Col(
         dbc.Nav(
@@ -26,6 +114,7 @@ def sidebar():
                 dbc.NavLink("Liberar Ubicación", href="/liberar", active="exact"),
                 dbc.NavLink("Visualización", href="/visualizacion", active="exact"),
                 dbc.NavLink("Visualización en Tiempo Real", href="/visualizacion_realtime", active="exact"),
+                dbc.NavLink("Envejecimiento (FEFO)", href="/envejecimiento", active="exact"),
                 dbc.NavLink("Cerrar Sesión", href="/", active="exact"),
             ],
             vertical=True,
@@ -154,6 +243,20 @@ def liberar_layout():
                             html.Div(id="liberar-feedback", className="mt-3"),
                         ], width=6),
                     ]),
+                    html.Hr(),
+                    html.H4("Liberar Lote (Carga de Camión)"),
+                    dbc.Row([
+                        dbc.Col([
+                            dbc.Textarea(
+                                id="pallets-liberar-lote",
+                                placeholder="Escanee un pallet por línea, en el orden de carga",
+                                style={"height": "200px"},
+                                className="mb-2",
+                            ),
+                            dbc.Button("Liberar Lote", id="liberar-lote-button", color="danger", className="mt-3"),
+                            html.Div(id="liberar-lote-feedback", className="mt-3"),
+                        ], width=6),
+                    ]),
                 ]),
                 width=10,
             ),
@@ -210,6 +313,15 @@ def visualizacion_layout():
         html.Div([
             html.H5("Espacios Disponibles Totales:", style={"marginBottom": "5px"}),
             html.H2(id="espacios-disponibles-general-html", className="text-success"),  # ID para callback
+        ], style={"marginBottom": "20px"}),
+
+        # Pronóstico de llenado por rack y de la cámara
+        html.Div([
+            html.H5("Pronóstico de Llenado:", style={"marginBottom": "5px"}),
+            html.Div(id="pronostico-llenado-html"),  # ID para callback
+            # Las tasas se recalculan cada TTL_TASAS segundos; el pronóstico se refresca al mismo ritmo
+            dcc.Interval(id="interval-pronostico", interval=int(TTL_TASAS * 1000), n_intervals=0),
+            html.Small(f"Tasas promedio de las últimas {VENTANA_HORAS} horas.", className="text-muted"),
         ]),
         html.Hr(),
 
@@ -242,6 +354,10 @@ def visualizacion_layout():
             dbc.Col(
                 dbc.Container([
                     html.H2("Visualización del Almacén", style={"marginBottom": "30px"}),
+                    selector_tipo_almacen("tipo-almacen-visualizacion"),
+                    # Claves de las vistas de rack dibujadas por este cliente
+                    dcc.Store(id="vistas-rack-visualizacion"),
+                    html.Div(id="aviso-visualizacion"),
 
                     # Rack 1
                     html.Div([
@@ -361,6 +477,11 @@ def visualizacion_realtime_layout():
                         interval=2000,  # Actualiza cada 2000ms (2 segundos)
                         n_intervals=0
                     ),
+                    # Lo que este cliente tiene dibujado: la clave de la vista de cada rack
+                    # ("1", "2") y el aviso de conexión mostrado ("aviso")
+                    dcc.Store(id="vistas-rack-realtime"),
+                    selector_tipo_almacen("tipo-almacen-realtime"),
+                    html.Div(id="aviso-realtime"),
 
                     # Rack 1
                     html.Div([
@@ -394,6 +515,390 @@ def visualizacion_realtime_layout():
     ])
 
 
+def envejecimiento_layout():
+    """Layout para la página de envejecimiento de pallets (días desde la Fecha de Faena)."""
+    leyenda = [
+        html.Span(
+            f"{desde}-{hasta} días" if hasta is not None else f"{desde}+ días",
+            style={"backgroundColor": color, "color": "white", "padding": "4px 10px", "marginRight": "10px"},
+        )
+        for desde, hasta, color in RANGOS_DIAS
+    ]
+    return html.Div([
+        dbc.Row([
+            sidebar(),
+            dbc.Col(
+                dbc.Container([
+                    html.H2("Envejecimiento de Pallets (FEFO)", style={"marginBottom": "30px"}),
+                    selector_tipo_almacen("tipo-almacen-envejecimiento"),
+                    html.Div(leyenda, style={"marginBottom": "20px"}),
+                    html.Div(id="racks-envejecimiento-html"),
+                    html.H4("Resumen por Rack, Piso y Variedad", style={"marginTop": "40px"}),
+                    html.Div(id="resumen-envejecimiento-html"),
+                ]),
+                xs=12, sm=12, md=10, lg=10, xl=10,
+            ),
+        ]),
+    ])
+
+
+# --- Tablas de racks ---
+COLORES_ESTADO = {"libre": "green", "ocupado": "red", "resaltado": "blue"}
+
+# Desde esta cantidad de posiciones un rack se dibuja como mapa de calor en lugar de tabla
+UMBRAL_POSICIONES_MAPA = 1500
+
+
+def vista_rack(df_rack, resaltados=None):
+    """
+    Celdas de un rack listas para dibujar y para comparar con lo ya dibujado.
+    `df_rack` debe ser de una sola cámara: piso, posición y letra solo identifican
+    una ubicación dentro de su cámara.
+
+    Devuelve un diccionario con el tipo de vista ("tabla" para racks chicos, "mapa"
+    de calor para racks grandes), las filas (piso, posición), las letras y las capas:
+    matrices fila x letra con el NPallet, el estado (0 = libre, 1 = ocupado,
+    2 = resaltado por los filtros) y, en los mapas, Variedad y Mercado.
+    """
+    if df_rack["Tipo Almacén"].nunique() > 1:
+        raise ValueError("vista_rack recibe las posiciones de una sola cámara")
+    resaltados = resaltados or set()
+    tipo = "mapa" if len(df_rack) >= UMBRAL_POSICIONES_MAPA else "tabla"
+    if df_rack.empty:
+        vacia = np.empty((0, 0), dtype=object)
+        return {"tipo": tipo, "filas": [], "letras": [], "capas": {"npallet": vacia, "estado": vacia.astype(int)}}
+    campos = (
+        df_rack.groupby(["Piso", "Posición Pallet", "Letra"])[["NPallet", "Variedad", "Mercado"]]
+        .first()
+        .unstack("Letra")
+    )
+    if tipo == "tabla":
+        # En la tabla los pisos y posiciones más altos van arriba
+        campos = campos.sort_index(ascending=[False, False])
+    n_pallet = campos["NPallet"].fillna("Libre")
+    valores = n_pallet.to_numpy(dtype=object)
+    capas = {
+        "npallet": valores,
+        "estado": np.where(valores == "Libre", 0, np.where(np.isin(valores, list(resaltados)), 2, 1)),
+    }
+    if tipo == "mapa":
+        capas["variedad"] = campos["Variedad"].fillna("").to_numpy(dtype=object)
+        capas["mercado"] = campos["Mercado"].fillna("").to_numpy(dtype=object)
+    return {
+        "tipo": tipo,
+        "filas": list(n_pallet.index),
+        "letras": [str(letra) for letra in n_pallet.columns],
+        "capas": capas,
+    }
+
+
+def datos_tabla_rack(vista):
+    """
+    Datos de la tabla de un rack en columnas: pisos y posiciones una vez por fila y
+    una matriz fila x letra con el NPallet (None si la posición está libre) más las
+    celdas resaltadas como [fila, letra]. Es lo único que viaja al navegador; las
+    filas, columnas y colores del DataTable se arman allí (ver TABLA_RACK_JS).
+    """
+    npallet = vista["capas"]["npallet"]
+    return {
+        "pisos": [int(piso) for piso, _ in vista["filas"]],
+        "posiciones": [int(posicion) for _, posicion in vista["filas"]],
+        "letras": vista["letras"],
+        "npallet": np.where(npallet == "Libre", None, npallet).tolist(),
+        "resaltados": np.argwhere(vista["capas"]["estado"] == 2).tolist(),
+    }
+
+
+# Arma en el navegador las columnas, filas y reglas de color del DataTable de un rack
+# a partir de datos_tabla_rack: ocupado por defecto, una regla "Libre" por letra (las
+# reglas de Dash no pueden referirse a "la columna actual") y una por celda resaltada.
+TABLA_RACK_JS = """
+function(datos) {
+    var colores = %s;
+    if (!datos) {
+        return [[], [], []];
+    }
+    var letras = datos.letras;
+    var columnas = [{name: "Piso", id: "piso"}, {name: "Posición Pallet", id: "posicion"}].concat(
+        letras.map(function(letra) { return {name: letra, id: letra}; })
+    );
+    var filas = datos.npallet.map(function(valores, i) {
+        var fila = {piso: datos.pisos[i], posicion: datos.posiciones[i]};
+        letras.forEach(function(letra, j) {
+            fila[letra] = valores[j] === null ? "Libre" : valores[j];
+        });
+        return fila;
+    });
+    var estilos = [{
+        "if": {column_id: letras},
+        fontWeight: "bold",
+        color: "white",
+        backgroundColor: colores.ocupado
+    }];
+    letras.forEach(function(letra) {
+        estilos.push({
+            "if": {column_id: letra, filter_query: "{" + letra + "} = \\"Libre\\""},
+            backgroundColor: colores.libre
+        });
+    });
+    datos.resaltados.forEach(function(celda) {
+        estilos.push({
+            "if": {row_index: celda[0], column_id: letras[celda[1]]},
+            backgroundColor: colores.resaltado
+        });
+    });
+    return [columnas, filas, estilos];
+}
+""" % json.dumps(COLORES_ESTADO)
+
+app.clientside_callback(
+    TABLA_RACK_JS,
+    [Output({"tipo": "tabla-rack", "rack": MATCH}, "columns"),
+     Output({"tipo": "tabla-rack", "rack": MATCH}, "data"),
+     Output({"tipo": "tabla-rack", "rack": MATCH}, "style_data_conditional")],
+    Input({"tipo": "datos-tabla-rack", "rack": MATCH}, "data"),
+)
+
+
+def generar_tabla_rack(vista, titulo):
+    """
+    Genera la tabla de un rack como un único DataTable.
+
+    Al navegador solo viajan los datos en columnas de datos_tabla_rack, en un
+    dcc.Store junto a la tabla; TABLA_RACK_JS arma con ellos las filas y los colores.
+    """
+    return html.Div([
+        html.H4(titulo, style={"marginTop": "20px", "marginBottom": "10px"}),
+        dcc.Store(id={"tipo": "datos-tabla-rack", "rack": titulo}, data=datos_tabla_rack(vista)),
+        dash_table.DataTable(
+            id={"tipo": "tabla-rack", "rack": titulo},
+            style_table={"marginTop": "20px"},
+            style_cell={"textAlign": "center"},
+        ),
+    ])
+
+
+def generar_tabla_envejecimiento(matriz, titulo):
+    """
+    Genera la tabla de días desde la faena de un rack. Como en generar_tabla_rack, los
+    colores se aplican con reglas por letra y rango de días en lugar de por celda.
+    """
+    letras = [str(col) for col in matriz.columns]
+    valores = matriz.to_numpy()
+    filas = [
+        dict(
+            {"piso": piso, "posicion": posicion},
+            **{letra: ("Libre" if np.isnan(dias) else int(dias)) for letra, dias in zip(letras, fila)}
+        )
+        for (piso, posicion), fila in zip(matriz.index, valores)
+    ]
+
+    estilos = [{"if": {"column_id": letras}, "backgroundColor": COLOR_LIBRE}]
+    for desde, hasta, color in RANGOS_DIAS:
+        for letra in letras:
+            consulta = f"{{{letra}}} >= {desde}"
+            if hasta is not None:
+                consulta += f" && {{{letra}}} < {hasta}"
+            estilos.append({
+                "if": {"column_id": letra, "filter_query": consulta},
+                "backgroundColor": color,
+                "color": "white",
+                "fontWeight": "bold",
+            })
+
+    return html.Div([
+        html.H4(titulo, style={"marginTop": "20px", "marginBottom": "10px"}),
+        dash_table.DataTable(
+            columns=[
+                {"name": "Piso", "id": "piso"},
+                {"name": "Posición Pallet", "id": "posicion"},
+            ] + [{"name": letra, "id": letra} for letra in letras],
+            data=filas,
+            style_table={"marginTop": "20px"},
+            style_cell={"textAlign": "center"},
+            style_data_conditional=estilos,
+        ),
+    ])
+
+
+def generar_mapa_rack(vista, titulo):
+    """
+    Dibuja un rack como un único mapa de calor (plotly Heatmap, pintado en canvas).
+
+    Las posiciones viajan como matrices planas de estado y atributos, sin un
+    componente por celda, por lo que el costo de dibujo casi no crece con el rack.
+    El tooltip muestra NPallet, Variedad y Mercado. Las matrices se envían como
+    listas (no como arreglos binarios) para poder modificar celdas sueltas con Patch.
+    """
+    capas = vista["capas"]
+    filas = [f"Piso {piso} - Pos. {posicion}" for piso, posicion in vista["filas"]]
+    detalle = np.dstack([capas["npallet"], capas["variedad"], capas["mercado"]])
+
+    colores = [COLORES_ESTADO["libre"], COLORES_ESTADO["ocupado"], COLORES_ESTADO["resaltado"]]
+    escala = []
+    for i, color in enumerate(colores):
+        escala += [[i / len(colores), color], [(i + 1) / len(colores), color]]
+
+    figura = go.Figure(go.Heatmap(
+        z=capas["estado"].tolist(),
+        x=vista["letras"],
+        y=filas,
+        customdata=detalle.tolist(),
+        zmin=-0.5,
+        zmax=2.5,
+        colorscale=escala,
+        showscale=False,
+        xgap=1,
+        ygap=1,
+        hovertemplate="%{y}, %{x}<br>NPallet: %{customdata[0]}<br>"
+                      "Variedad: %{customdata[1]}<br>Mercado: %{customdata[2]}<extra></extra>",
+    ))
+    figura.update_layout(
+        height=min(max(300, 12 * len(filas)), 3000),
+        margin={"l": 10, "r": 10, "t": 10, "b": 10},
+        xaxis={"side": "top"},
+        plot_bgcolor="white",
+    )
+    return html.Div([
+        html.H4(titulo, style={"marginTop": "20px", "marginBottom": "10px"}),
+        dcc.Graph(figure=figura, config={"displayModeBar": False}),
+    ])
+
+
+def generar_vista_rack(vista, titulo):
+    """Tabla para racks chicos (muestra el NPallet en cada celda) y mapa de calor para racks grandes."""
+    if vista["tipo"] == "mapa":
+        return generar_mapa_rack(vista, titulo)
+    return generar_tabla_rack(vista, titulo)
+
+
+# --- Actualizaciones parciales de racks ---
+# Cada cliente guarda en un dcc.Store la clave de la vista que tiene dibujada en cada
+# rack. Si el servidor aún recuerda esa vista, solo se envían (con Patch) las celdas
+# que cambiaron, identificadas por su fila (piso, posición) y letra; si no la
+# recuerda (otro proceso, vista vencida) o cambió demasiado, se redibuja el rack.
+MAXIMO_CELDAS_PARCHE = 300   # Con más celdas cambiadas se redibuja el rack completo
+VISTAS_RECORDADAS = 64
+
+_vistas_rack = OrderedDict()   # clave -> vista enviada a algún cliente
+_vistas_lock = threading.Lock()
+
+
+def clave_vista(tipo_almacen, huella, rack, resaltados=None):
+    """Identifica una vista de rack: snapshot, rack y celdas resaltadas."""
+    contenido = repr((tipo_almacen, huella, rack, sorted(map(str, resaltados or ()))))
+    return hashlib.blake2b(contenido.encode(), digest_size=12).hexdigest()
+
+
+def recordar_vista(clave, vista):
+    with _vistas_lock:
+        _vistas_rack[clave] = vista
+        _vistas_rack.move_to_end(clave)
+        while len(_vistas_rack) > VISTAS_RECORDADAS:
+            _vistas_rack.popitem(last=False)
+
+
+def parche_rack(anterior, vista):
+    """
+    Patch con las celdas que cambiaron entre la vista dibujada y la nueva (no_update
+    si no cambió ninguna), o None si hay que redibujar el rack.
+    """
+    if (
+        anterior is None
+        or anterior["tipo"] != vista["tipo"]
+        or anterior["filas"] != vista["filas"]
+        or anterior["letras"] != vista["letras"]
+    ):
+        return None
+    cambiadas = np.zeros(vista["capas"]["estado"].shape, dtype=bool)
+    for nombre, capa in vista["capas"].items():
+        cambiadas |= capa != anterior["capas"][nombre]
+    celdas = np.argwhere(cambiadas)
+    if len(celdas) == 0:
+        return no_update
+    if len(celdas) > MAXIMO_CELDAS_PARCHE:
+        return None
+
+    capas = vista["capas"]
+    parche = Patch()
+    # children del contenedor: html.Div([H4, dcc.Store con los datos de la tabla, DataTable])
+    # o html.Div([H4, Graph])
+    componente = parche["props"]["children"][1]["props"]
+    if vista["tipo"] == "tabla":
+        datos = componente["data"]
+        for fila, columna in celdas:
+            n_pallet = capas["npallet"][fila, columna]
+            datos["npallet"][int(fila)][int(columna)] = None if n_pallet == "Libre" else n_pallet
+        if ((capas["estado"] == 2) != (anterior["capas"]["estado"] == 2)).any():
+            datos["resaltados"] = np.argwhere(capas["estado"] == 2).tolist()
+    else:
+        traza = componente["figure"]["data"][0]
+        for fila, columna in celdas:
+            fila, columna = int(fila), int(columna)
+            traza["z"][fila][columna] = int(capas["estado"][fila, columna])
+            traza["customdata"][fila][columna] = [
+                capas["npallet"][fila, columna], capas["variedad"][fila, columna], capas["mercado"][fila, columna]
+            ]
+    return parche
+
+
+def dibujar_rack(df_rack, titulo, clave, clave_anterior, resaltados=None):
+    """
+    Contenido de un rack para el cliente que tiene dibujada la vista `clave_anterior`:
+    no_update, un Patch con las celdas cambiadas o el rack completo.
+    """
+    if clave == clave_anterior:
+        return no_update
+    vista = vista_rack(df_rack, resaltados)
+    with _vistas_lock:
+        anterior = _vistas_rack.get(clave_anterior)
+    recordar_vista(clave, vista)
+    parche = parche_rack(anterior, vista)
+    return generar_vista_rack(vista, titulo) if parche is None else parche
+
+
+@app.callback(
+    [Output("racks-envejecimiento-html", "children"),
+     Output("resumen-envejecimiento-html", "children")],
+    Input("tipo-almacen-envejecimiento", "value")
+)
+def actualizar_envejecimiento(tipo_almacen):
+    """Actualiza las tablas de días desde la faena por rack y el resumen por rack, piso y Variedad."""
+    if tipo_almacen is None:
+        # Sin cámaras leídas; el selector ya muestra el aviso
+        return no_update, no_update
+    posiciones, _ = obtener_snapshot(tipo_almacen)
+    df = calcular_envejecimiento(dataframe_posiciones(posiciones))
+
+    tablas = [
+        generar_tabla_envejecimiento(matriz, f"Rack {rack}")
+        for rack, matriz in matrices_envejecimiento(df).items()
+    ]
+    resumen = resumen_envejecimiento(df)
+    tabla_resumen = dash_table.DataTable(
+        columns=[{"name": col, "id": col} for col in resumen.columns],
+        data=resumen.to_dict("records"),
+        sort_action="native",
+        page_size=20,
+        style_cell={"textAlign": "center"},
+    )
+    return tablas, tabla_resumen
+
+
+def utilizacion_o_snapshot(df_posiciones, tipo_almacen, rack=None):
+    """
+    Utilización y espacios disponibles desde los contadores de ocupación. Si todavía no
+    están cargados y la base no responde, se cuentan sobre las posiciones del snapshot
+    que ya se está mostrando (quizás desactualizado).
+    """
+    try:
+        return utilizacion(tipo_almacen, rack=rack)
+    except ConnectionError:
+        if rack is not None:
+            df_posiciones = df_posiciones[df_posiciones["Rack"] == rack]
+        return formatear_utilizacion(int((df_posiciones["NPallet"] != "Libre").sum()), len(df_posiciones))
+
+
 @app.callback(
     [
         Output("rack1-realtime-html", "children"),
@@ -402,100 +907,97 @@ def visualizacion_realtime_layout():
         Output("utilizacion-rack2-realtime-html", "children"),
         Output("disponibles-rack1-realtime-html", "children"),
         Output("disponibles-rack2-realtime-html", "children"),
+        Output("vistas-rack-realtime", "data"),
+        Output("aviso-realtime", "children"),
     ],
-    Input("interval-realtime", "n_intervals")
+    Input("interval-realtime", "n_intervals"),
+    Input("tipo-almacen-realtime", "value"),
+    State("vistas-rack-realtime", "data"),
 )
-def actualizar_vista_realtime(n_intervals):
-    """Actualiza los datos en tiempo real."""
-
-    # Generar HTML de tablas dinámicas
-    def generar_html_matriz(df, titulo):
-        """Genera el HTML para la tabla dinámica de un rack."""
-        filas = []
-        encabezados = ["Piso", "Posición Pallet"] + list(df.columns)
-        filas.append(html.Tr([html.Th(col, style={"textAlign": "center"}) for col in encabezados]))
-
-        for index, row in df.iterrows():
-            celdas = []
-            piso, posicion = index if isinstance(index, tuple) else (index, "")
-            celdas.append(html.Td(piso, style={"textAlign": "center"}))
-            celdas.append(html.Td(posicion, style={"textAlign": "center"}))
-
-            for col, val in row.items():
-                estilo = {"textAlign": "center", "fontWeight": "bold", "color": "white"}
-                if val == "Libre":
-                    estilo["backgroundColor"] = "green"
-                else:
-                    estilo["backgroundColor"] = "red"
-                celdas.append(html.Td(val, style=estilo))
-
-            filas.append(html.Tr(celdas))
-
-        return html.Div([
-            html.H4(titulo, style={"marginTop": "20px", "marginBottom": "10px"}),
-            html.Table(filas, className="table table-bordered table-hover", style={"marginTop": "20px"})
-        ])
-
-    # Recuperar posiciones
-    posiciones = obtener_todas_las_posiciones()
+def actualizar_vista_realtime(n_intervals, tipo_almacen, vistas_anteriores):
+    """
+    Actualiza los datos en tiempo real.
+
+    Si el cliente ya dibujó el snapshot actual se responde no_update en todas las
+    salidas; si no, cada rack recibe solo las celdas que cambiaron (ver dibujar_rack).
+    Sin conexión con la base se sigue mostrando la última lectura, con un aviso que
+    solo se envía cuando cambia (el Store guarda también el aviso mostrado).
+    """
+    vistas_anteriores = vistas_anteriores or {}
+    if tipo_almacen is None:
+        # Sin cámaras leídas; el selector ya muestra el aviso
+        return (no_update,) * 8
+
+    # Recuperar posiciones de la cámara seleccionada
+    try:
+        posiciones, huella = obtener_snapshot(tipo_almacen)
+    except ConnectionError as e:
+        if vistas_anteriores.get("aviso") == "sin_conexion":
+            return (no_update,) * 8
+        return (no_update,) * 6 + (dict(vistas_anteriores, aviso="sin_conexion"), aviso_sin_conexion(e))
+    desde = desactualizado_desde(tipo_almacen)
+    estado_aviso = desde.isoformat() if desde else None
+    aviso = no_update if estado_aviso == vistas_anteriores.get("aviso") else aviso_desactualizado(tipo_almacen)
     if not posiciones:
-        return "Error: No hay datos disponibles", "", "", "", "", ""
+        return "Error: No hay datos disponibles", "", "", "", "", "", {"aviso": estado_aviso}, aviso
 
-    df_posiciones = pd.DataFrame.from_records(posiciones, columns=[
-        "Tipo Almacén", "Piso", "Rack", "Letra", "Posición Pallet", "Estado Ubicación",
-        "id_pallet_asignado", "Descripción", "Variedad", "Mercado", "Fecha Faena", "NPallet"
-    ])
+    vistas = {rack: clave_vista(tipo_almacen, huella, rack) for rack in ("1", "2")}
+    vistas["aviso"] = estado_aviso
+    if vistas == vistas_anteriores:
+        return (no_update,) * 8
+
+    df_posiciones = dataframe_posiciones(posiciones)
     df_posiciones["NPallet"] = df_posiciones["NPallet"].fillna("Libre")
 
     # Filtrar racks
     df_rack1 = df_posiciones[df_posiciones["Rack"] == 1]
     df_rack2 = df_posiciones[df_posiciones["Rack"] == 2]
 
-    # Calcular métricas
-    total_rack1 = len(df_rack1)
-    total_rack2 = len(df_rack2)
-    ocupados_rack1 = len(df_rack1[df_rack1["NPallet"] != "Libre"])
-    ocupados_rack2 = len(df_rack2[df_rack2["NPallet"] != "Libre"])
-    disponibles_rack1 = total_rack1 - ocupados_rack1
-    disponibles_rack2 = total_rack2 - ocupados_rack2
-    utilizacion_rack1 = f"{(ocupados_rack1 / total_rack1 * 100):.2f}%" if total_rack1 > 0 else "0.00%"
-    utilizacion_rack2 = f"{(ocupados_rack2 / total_rack2 * 100):.2f}%" if total_rack2 > 0 else "0.00%"
-
-    # Crear tablas dinámicas
-    matriz_rack1 = pd.crosstab(
-        index=[df_rack1["Piso"], df_rack1["Posición Pallet"]],
-        columns=df_rack1["Letra"],
-        values=df_rack1["NPallet"],
-        aggfunc="first"
-    ).fillna("Libre").sort_index(ascending=[False, False])
-
-    matriz_rack2 = pd.crosstab(
-        index=[df_rack2["Piso"], df_rack2["Posición Pallet"]],
-        columns=df_rack2["Letra"],
-        values=df_rack2["NPallet"],
-        aggfunc="first"
-    ).fillna("Libre").sort_index(ascending=[False, False])
-
-    rack1_html = generar_html_matriz(matriz_rack1, "Rack 1")
-    rack2_html = generar_html_matriz(matriz_rack2, "Rack 2")
-
-    return rack1_html, rack2_html, utilizacion_rack1, utilizacion_rack2, f"{disponibles_rack1} espacios", f"{disponibles_rack2} espacios"
+    # Métricas desde los contadores de ocupación
+    utilizacion_rack1, disponibles_rack1 = utilizacion_o_snapshot(df_posiciones, tipo_almacen, rack=1)
+    utilizacion_rack2, disponibles_rack2 = utilizacion_o_snapshot(df_posiciones, tipo_almacen, rack=2)
+
+    # Tablas (o mapas, en racks grandes): completas la primera vez, luego solo las celdas cambiadas
+    rack1_html = dibujar_rack(df_rack1, "Rack 1", vistas["1"], vistas_anteriores.get("1"))
+    rack2_html = dibujar_rack(df_rack2, "Rack 2", vistas["2"], vistas_anteriores.get("2"))
+
+    return rack1_html, rack2_html, utilizacion_rack1, utilizacion_rack2, f"{disponibles_rack1} espacios", f"{disponibles_rack2} espacios", vistas, aviso
 
 
 @app.callback(
     [Output("ingresar-pallet-feedback", "children"),
      Output("qr-data-input", "value")],
     [Input("ingresar-pallet-button", "n_clicks")],
-    [State("qr-data-input", "value")],
+    [State("qr-data-input", "value"),
+     State("sesion-navegador", "data")],
     prevent_initial_call=True
 )
-def manejar_ingresar_pallet(n_clicks, qr_data):
+def manejar_ingresar_pallet(n_clicks, qr_data, sesion=None):
     """Maneja el ingreso del pallet a la base de datos."""
-    if qr_data:
-        feedback = ingresar_pallet(qr_data)
-    else:
-        feedback = ""
-    return feedback, ""
+    if not qr_data:
+        return "", ""
+
+    res = ingresar(qr_data, sesion=sesion)
+    # Se conserva el QR solo si la base no respondió y no hay diario que lo acepte
+    return alerta(res), (qr_data if res.get("sin_conexion") else "")
+
+
+def sesion_escaner():
+    """
+    Sesión de un escáner de la API para descartar envíos repetidos: la cabecera
+    X-Escaner-Id. Sin ella no se deduplica; la dirección del cliente no sirve porque
+    varios equipos detrás del mismo NAT o proxy la comparten.
+    """
+    return request.headers.get("X-Escaner-Id") or None
+
+
+# Color del aviso según el estado del resultado de una operación
+COLORES_RESULTADO = {"ok": "success", "pendiente": "info", "error": "danger"}
+
+
+def alerta(res):
+    """Convierte el resultado de una operación de escaneo en un aviso para el operador."""
+    return dbc.Alert(res["mensaje"], color=COLORES_RESULTADO[res["estado"]])
 
 
 
@@ -509,107 +1011,61 @@ def manejar_ingresar_pallet(n_clicks, qr_data):
      Output("disponibles-rack2-html", "children"),
      Output("utilizacion-general-html", "children"),
      Output("espacios-disponibles-general-html", "children"),
-     Output("filtro-id-pallet", "options"),
-     Output("filtro-variedad-pallet", "options"),
-     Output("filtro-mercado-pallet", "options"),
-     Output("filtro-fecha-faena", "options")],
+     Output("vistas-rack-visualizacion", "data"),
+     Output("aviso-visualizacion", "children")],
     [Input("filtro-id-pallet", "value"),
      Input("filtro-variedad-pallet", "value"),
      Input("filtro-mercado-pallet", "value"),
-     Input("filtro-fecha-faena", "value")]
+     Input("filtro-fecha-faena", "value"),
+     Input("tipo-almacen-visualizacion", "value")],
+    State("vistas-rack-visualizacion", "data")
 )
-def actualizar_colores(filtro_ids, filtro_variedad, filtro_mercado, filtro_fecha_faena):
-    """Actualiza las tablas, la utilización, los espacios disponibles, las métricas generales y los filtros."""
-    posiciones = obtener_todas_las_posiciones()
-    df_posiciones = pd.DataFrame.from_records(posiciones, columns=[
-        "Tipo Almacén", "Piso", "Rack", "Letra", "Posición Pallet", "Estado Ubicación",
-        "id_pallet_asignado", "Descripción", "Variedad", "Mercado", "Fecha Faena", "NPallet"
-    ])
+def actualizar_colores(filtro_ids, filtro_variedad, filtro_mercado, filtro_fecha_faena, tipo_almacen, vistas_anteriores):
+    """
+    Actualiza las tablas, la utilización, los espacios disponibles y las métricas
+    generales. Al cambiar los filtros solo se envían las celdas cuyo resaltado cambió.
+    """
+    if tipo_almacen is None:
+        # Sin cámaras leídas; el selector ya muestra el aviso
+        return (no_update,) * 10
+    try:
+        posiciones, huella = obtener_snapshot(tipo_almacen)
+    except ConnectionError as e:
+        return (no_update,) * 9 + (aviso_sin_conexion(e),)
+    df_posiciones = dataframe_posiciones(posiciones)
     df_posiciones["NPallet"] = df_posiciones["NPallet"].fillna("Libre")
 
     # Filtrar datos por racks
     df_rack1 = df_posiciones[df_posiciones["Rack"] == 1]
     df_rack2 = df_posiciones[df_posiciones["Rack"] == 2]
 
-    # Calcular utilización y espacios disponibles por rack
-    total_rack1 = len(df_rack1)
-    total_rack2 = len(df_rack2)
-    ocupados_rack1 = len(df_rack1[df_rack1["NPallet"] != "Libre"])
-    ocupados_rack2 = len(df_rack2[df_rack2["NPallet"] != "Libre"])
-    disponibles_rack1 = total_rack1 - ocupados_rack1
-    disponibles_rack2 = total_rack2 - ocupados_rack2
-    utilizacion_rack1 = f"{(ocupados_rack1 / total_rack1 * 100):.2f}%" if total_rack1 > 0 else "0.00%"
-    utilizacion_rack2 = f"{(ocupados_rack2 / total_rack2 * 100):.2f}%" if total_rack2 > 0 else "0.00%"
-
-    # Calcular métricas generales
-    total_general = total_rack1 + total_rack2
-    ocupados_general = ocupados_rack1 + ocupados_rack2
-    disponibles_general = total_general - ocupados_general
-    utilizacion_general = f"{(ocupados_general / total_general * 100):.2f}%" if total_general > 0 else "0.00%"
-
-    # Crear matrices dinámicas para Rack 1 y Rack 2
-    matriz_rack1 = pd.crosstab(
-        index=[df_rack1["Piso"], df_rack1["Posición Pallet"]],
-        columns=df_rack1["Letra"],
-        values=df_rack1["NPallet"],
-        aggfunc="first"
-    ).fillna("Libre").sort_index(ascending=[False, False])
-
-    matriz_rack2 = pd.crosstab(
-        index=[df_rack2["Piso"], df_rack2["Posición Pallet"]],
-        columns=df_rack2["Letra"],
-        values=df_rack2["NPallet"],
-        aggfunc="first"
-    ).fillna("Libre").sort_index(ascending=[False, False])
-
-    # Crear opciones para los dropdowns dinámicos
-    id_pallet_options = [{"label": val, "value": val} for val in df_posiciones["NPallet"].unique() if val != "Libre"]
-    variedad_options = [{"label": val, "value": val} for val in df_posiciones["Variedad"].dropna().unique()]
-    mercado_options = [{"label": val, "value": val} for val in df_posiciones["Mercado"].dropna().unique()]
-    fecha_faena_options = [{"label": str(val), "value": str(val)} for val in df_posiciones["Fecha Faena"].dropna().unique()]
-
-    # Generar HTML de tablas con colores dinámicos
-    def generar_html_matriz(df, titulo):
-        filas = []
-        encabezados = ["Piso", "Posición Pallet"] + list(df.columns)
-        filas.append(html.Tr([html.Th(col, style={"textAlign": "center"}) for col in encabezados]))
-
-        for index, row in df.iterrows():
-            celdas = []
-            piso, posicion = index
-            celdas.append(html.Td(piso, style={"textAlign": "center"}))
-            celdas.append(html.Td(posicion, style={"textAlign": "center"}))
-
-            for col, val in row.items():
-                estilo = {"textAlign": "center", "fontWeight": "bold", "color": "white"}
-
-                if val == "Libre":
-                    estilo["backgroundColor"] = "green"
-                else:
-                    variedad = df_posiciones.loc[df_posiciones["NPallet"] == val, "Variedad"].values[0]
-                    mercado = df_posiciones.loc[df_posiciones["NPallet"] == val, "Mercado"].values[0]
-                    fecha_faena = df_posiciones.loc[df_posiciones["NPallet"] == val, "Fecha Faena"].values[0]
-
-                    if (
-                        (filtro_ids and val in filtro_ids) or
-                        (filtro_variedad and variedad in filtro_variedad) or
-                        (filtro_mercado and mercado in filtro_mercado) or
-                        (filtro_fecha_faena and str(fecha_faena) in filtro_fecha_faena)
-                    ):
-                        estilo["backgroundColor"] = "blue"
-                    else:
-                        estilo["backgroundColor"] = "red"
-
-                celdas.append(html.Td(val, style=estilo))
-            filas.append(html.Tr(celdas))
-
-        return html.Div([
-            html.H4(titulo, style={"marginTop": "20px", "marginBottom": "10px"}),
-            html.Table(filas, className="table table-bordered table-hover", style={"marginTop": "20px"})
-        ])
-
-    rack1_html = generar_html_matriz(matriz_rack1, "Rack 1")
-    rack2_html = generar_html_matriz(matriz_rack2, "Rack 2")
+    # Utilización y espacios disponibles por rack y generales, desde los contadores de ocupación
+    utilizacion_rack1, disponibles_rack1 = utilizacion_o_snapshot(df_posiciones, tipo_almacen, rack=1)
+    utilizacion_rack2, disponibles_rack2 = utilizacion_o_snapshot(df_posiciones, tipo_almacen, rack=2)
+    utilizacion_general, disponibles_general = utilizacion_o_snapshot(df_posiciones, tipo_almacen)
+
+    # NPallet que cumplen alguno de los filtros (se pintan en azul)
+    ocupados = df_posiciones[df_posiciones["NPallet"] != "Libre"]
+    coincide = pd.Series(False, index=ocupados.index)
+    if filtro_ids:
+        coincide |= ocupados["NPallet"].isin(filtro_ids)
+    if filtro_variedad:
+        coincide |= ocupados["Variedad"].isin(filtro_variedad)
+    if filtro_mercado:
+        coincide |= ocupados["Mercado"].isin(filtro_mercado)
+    if filtro_fecha_faena:
+        coincide |= ocupados["Fecha Faena"].map(str).isin(filtro_fecha_faena)
+    resaltados = set(ocupados.loc[coincide, "NPallet"])
+
+    vistas_anteriores = vistas_anteriores or {}
+    resaltados_rack1 = resaltados & set(df_rack1["NPallet"])
+    resaltados_rack2 = resaltados & set(df_rack2["NPallet"])
+    vistas = {
+        "1": clave_vista(tipo_almacen, huella, 1, resaltados_rack1),
+        "2": clave_vista(tipo_almacen, huella, 2, resaltados_rack2),
+    }
+    rack1_html = dibujar_rack(df_rack1, "Rack 1", vistas["1"], vistas_anteriores.get("1"), resaltados_rack1)
+    rack2_html = dibujar_rack(df_rack2, "Rack 2", vistas["2"], vistas_anteriores.get("2"), resaltados_rack2)
 
     return (
         rack1_html,
@@ -620,13 +1076,74 @@ def actualizar_colores(filtro_ids, filtro_variedad, filtro_mercado, filtro_fecha
         f"{disponibles_rack2} espacios",
         utilizacion_general,
         f"{disponibles_general} espacios",
-        id_pallet_options,
-        variedad_options,
-        mercado_options,
-        fecha_faena_options
+        vistas,
+        aviso_desactualizado(tipo_almacen),
     )
 
 
+@app.callback(
+    Output("pronostico-llenado-html", "children"),
+    [Input("tipo-almacen-visualizacion", "value"),
+     Input("interval-pronostico", "n_intervals")]
+)
+def actualizar_pronostico(tipo_almacen, n_intervals):
+    """Tabla con las tasas de entrada y salida y el tiempo estimado hasta llenar cada rack."""
+    try:
+        df = pronosticar(tipo_almacen)
+    except Exception as e:
+        print(f"Error al calcular el pronóstico de llenado: {e}")
+        return dbc.Alert("No se pudo calcular el pronóstico de llenado.", color="warning")
+    if df.empty:
+        return html.P("Sin datos de ocupación.", className="text-muted")
+
+    df["Lleno"] = df["Horas"].map(describir_horas)
+    df = df.drop(columns="Horas").round({"Entradas/h": 2, "Salidas/h": 2, "Neto/h": 2})
+    df["Rack"] = df["Rack"].map(str)
+    return dash_table.DataTable(
+        columns=[{"name": col, "id": col} for col in df.columns],
+        data=df.to_dict("records"),
+        style_cell={"textAlign": "center", "fontSize": "12px", "padding": "2px"},
+        style_data_conditional=[{
+            "if": {"filter_query": '{Rack} = "Cámara"'},
+            "fontWeight": "bold",
+        }],
+    )
+
+
+# Dropdown de filtro -> campo del índice de búsqueda
+FILTROS_BUSQUEDA = {
+    "filtro-id-pallet": "NPallet",
+    "filtro-variedad-pallet": "Variedad",
+    "filtro-mercado-pallet": "Mercado",
+    "filtro-fecha-faena": "Fecha Faena",
+}
+
+
+def registrar_busqueda(id_dropdown, campo):
+    """Registra el callback que sugiere opciones para un filtro a medida que se escribe."""
+    @app.callback(
+        Output(id_dropdown, "options"),
+        [Input(id_dropdown, "search_value"),
+         Input("tipo-almacen-visualizacion", "value")],
+        State(id_dropdown, "value")
+    )
+    def sugerir_opciones(texto, tipo_almacen, seleccionados):
+        # Las opciones ya seleccionadas se conservan para que sigan visibles
+        seleccionados = seleccionados or []
+        opciones = [{"label": valor, "value": valor} for valor in seleccionados]
+        try:
+            encontrados = buscar(tipo_almacen, campo, texto)
+        except ConnectionError as e:
+            print(f"Sin conexión con la base de datos: {e}")
+            return opciones + [{"label": MENSAJE_SIN_CONEXION, "value": "", "disabled": True}]
+        return opciones + [{"label": valor, "value": valor} for valor in encontrados if valor not in seleccionados]
+    return sugerir_opciones
+
+
+for id_dropdown, campo in FILTROS_BUSQUEDA.items():
+    registrar_busqueda(id_dropdown, campo)
+
+
 
 # --- Callbacks ---
 @app.callback(
@@ -644,6 +1161,8 @@ def display_page(pathname):
         return visualizacion_layout()
     elif pathname == "/visualizacion_realtime":
         return visualizacion_realtime_layout()
+    elif pathname == "/envejecimiento":
+        return envejecimiento_layout()
     return login_layout()
 
 
@@ -665,106 +1184,36 @@ def display_page(pathname):
     [
         State("letra-select", "value"),
         State("pallet-id", "value"),  # Aquí se ingresará el string completo
+        State("sesion-navegador", "data"),
     ],
 )
-def asignar_y_refrescar(tipo_almacen, piso, rack, n_clicks, letra, pallet_data):
+def asignar_y_refrescar(tipo_almacen, piso, rack, n_clicks, letra, pallet_data, sesion=None):
     # Obtener las opciones disponibles basadas en los filtros seleccionados
-    tipos_almacen, pisos, racks, letras = obtener_opciones_disponibles(
-        tipo_almacen=tipo_almacen, piso=piso, rack=rack, letra=letra
-    )
-
-    # Convertir resultados a formato para dropdowns
-    tipos_almacen_options = [{"label": t, "value": t} for t in tipos_almacen]
-    pisos_options = [{"label": p, "value": p} for p in pisos]
-    racks_options = [{"label": r, "value": r} for r in racks]
-    letras_options = [{"label": l, "value": l} for l in letras]
+    try:
+        tipos_almacen, pisos, racks, letras = obtener_opciones(
+            tipo_almacen=tipo_almacen, piso=piso, rack=rack, letra=letra
+        )
+
+        # Convertir resultados a formato para dropdowns
+        tipos_almacen_options = [{"label": t, "value": t} for t in tipos_almacen]
+        pisos_options = [{"label": p, "value": p} for p in pisos]
+        racks_options = [{"label": r, "value": r} for r in racks]
+        letras_options = [{"label": l, "value": l} for l in letras]
+    except ConnectionError:
+        # Sin base de datos se mantienen las opciones ya cargadas
+        tipos_almacen_options = pisos_options = racks_options = letras_options = no_update
 
     # Verificar si el botón de asignar fue presionado
     if n_clicks:
-        # Validar que todos los campos requeridos estén llenos
-        if not all([tipo_almacen, piso, rack, letra, pallet_data]):
-            return (
-                dbc.Alert(
-                    "Por favor, complete todos los campos antes de asignar.",
-                    color="danger",
-                ),
-                tipos_almacen_options,
-                pisos_options,
-                racks_options,
-                letras_options,
-                pallet_data,  # No limpiar el campo si hay error
-            )
-
-        # Extraer el NPallet del string ingresado
-        try:
-            n_pallet = pallet_data.split(",")[-1].strip()  # Extraer el último campo (NPallet)
-            if len(n_pallet) != 8 or not n_pallet.isdigit():
-                raise ValueError("El NPallet extraído no es válido.")
-        except Exception as e:
-            return (
-                dbc.Alert(
-                    f"Error al procesar el dato ingresado: {str(e)}. Asegúrese de usar el formato correcto.",
-                    color="danger",
-                ),
-                tipos_almacen_options,
-                pisos_options,
-                racks_options,
-                letras_options,
-                pallet_data,  # No limpiar el campo si hay error
-            )
-
-        # Convertir el NPallet al id_pallet
-        conn = conectar_bd()
-        cursor = conn.cursor()
-        try:
-            cursor.execute("SELECT id_pallet FROM pallets WHERE NPallet = ?", (n_pallet,))
-            result = cursor.fetchone()
-            if result is None:
-                return (
-                    dbc.Alert(f"El NPallet '{n_pallet}' no existe en la base de datos.", color="danger"),
-                    tipos_almacen_options,
-                    pisos_options,
-                    racks_options,
-                    letras_options,
-                    pallet_data,  # No limpiar el campo si hay error
-                )
-            id_pallet = result[0]  # Obtener el id_pallet correspondiente
-        except pyodbc.Error as e:
-            return (
-                dbc.Alert(f"Error al buscar el NPallet: {e}", color="danger"),
-                tipos_almacen_options,
-                pisos_options,
-                racks_options,
-                letras_options,
-                pallet_data,  # No limpiar el campo si hay error
-            )
-        finally:
-            conn.close()
-
-        # Intentar asignar el pallet usando id_pallet
-        mensaje = asignar_ubicacion(id_pallet, tipo_almacen, piso, rack, letra)
-
-        # Retornar mensaje de éxito o error
-        color = "success" if "Error" not in mensaje else "danger"
-        if color == "success":
-            mensaje = f"Pallet con NPallet {n_pallet} asignado a la ubicación {tipo_almacen}, {piso}, {rack}, {letra}."
-            return (
-                dbc.Alert(mensaje, color=color),
-                tipos_almacen_options,
-                pisos_options,
-                racks_options,
-                letras_options,
-                "",  # Limpiar el campo si se asignó correctamente
-            )
-        else:
-            return (
-                dbc.Alert(mensaje, color=color),
-                tipos_almacen_options,
-                pisos_options,
-                racks_options,
-                letras_options,
-                pallet_data,  # No limpiar el campo si hay error
-            )
+        res = asignar(tipo_almacen, piso, rack, letra, pallet_data, sesion=sesion)
+        return (
+            alerta(res),
+            tipos_almacen_options,
+            pisos_options,
+            racks_options,
+            letras_options,
+            pallet_data if res["estado"] == "error" else "",  # No limpiar el campo si hay error
+        )
 
     # Si no se presionó el botón, solo actualiza las opciones dinámicas
     return "", tipos_almacen_options, pisos_options, racks_options, letras_options, pallet_data
@@ -775,61 +1224,40 @@ def asignar_y_refrescar(tipo_almacen, piso, rack, n_clicks, letra, pallet_data):
 @app.callback(
     Output("liberar-feedback", "children"),
     Input("liberar-button", "n_clicks"),
-    State("pallet-id-liberar", "value")
+    State("pallet-id-liberar", "value"),
+    State("sesion-navegador", "data")
 )
-def handle_liberar_pallet(n_clicks, pallet_data):
+def handle_liberar_pallet(n_clicks, pallet_data, sesion=None):
     """Libera la ubicación del pallet especificado utilizando NPallet."""
     if n_clicks:
-        if not pallet_data:
-            return dbc.Alert("Ingrese los datos del pallet.", color="danger")
-
-        # Extraer el NPallet del string ingresado
-        try:
-            n_pallet = pallet_data.split(",")[-1].strip()  # Extraer el último campo (NPallet)
-            if len(n_pallet) != 8 or not n_pallet.isdigit():
-                raise ValueError("El NPallet extraído no es válido.")
-        except Exception as e:
-            return dbc.Alert(
-                f"Error al procesar los datos ingresados: {str(e)}. Asegúrese de usar el formato correcto.",
-                color="danger"
-            )
-
-        # Convertir el NPallet al id_pallet
-        conn = conectar_bd()
-        cursor = conn.cursor()
-        try:
-            cursor.execute("SELECT id_pallet FROM pallets WHERE NPallet = ?", (n_pallet,))
-            result = cursor.fetchone()
-            if result is None:
-                return dbc.Alert(f"El NPallet '{n_pallet}' no existe en la base de datos.", color="danger")
-            id_pallet = result[0]  # Obtener el id_pallet correspondiente
-        except pyodbc.Error as e:
-            return dbc.Alert(f"Error al buscar el NPallet: {e}", color="danger")
-        finally:
-            conn.close()
-
-        # Liberar la ubicación utilizando el id_pallet
-        mensaje = liberar_ubicacion(id_pallet)
-
-        # Ajustar el mensaje final
-        if "Ubicación liberada y reorganizada" in mensaje:
-            mensaje = f"Pallet ({n_pallet}) liberado y ubicación reorganizada exitosamente."
-            color = "success"
-        elif "posición 1" in mensaje:
-            mensaje = f"Error: Solo se puede liberar el Pallet con NPallet {n_pallet} desde la posición 1."
-            color = "danger"
-        elif "no está asignado a ninguna ubicación" in mensaje:
-            mensaje = f"Error: El Pallet con NPallet {n_pallet} no está asignado a ninguna ubicación."
-            color = "danger"
-        else:
-            mensaje = f"Error al liberar la ubicación para el Pallet con NPallet {n_pallet}: {mensaje}"
-            color = "danger"
-
-        return dbc.Alert(mensaje, color=color)
+        return alerta(liberar(pallet_data, sesion=sesion))
 
     return ""
 
 
+@app.callback(
+    Output("liberar-lote-feedback", "children"),
+    Output("pallets-liberar-lote", "value"),
+    Input("liberar-lote-button", "n_clicks"),
+    State("pallets-liberar-lote", "value"),
+    prevent_initial_call=True
+)
+def handle_liberar_lote(n_clicks, texto):
+    """Libera en una sola transacción los pallets escaneados, uno por línea."""
+    res = liberar_lote((texto or "").splitlines())
+    detalle = html.Ul([
+        html.Li(pallet["mensaje"], className="text-success" if pallet["estado"] == "ok" else "text-danger")
+        for pallet in res["pallets"]
+    ])
+    # Se conservan en el campo solo los escaneos que no se pudieron liberar
+    liberados = {pallet["n_pallet"] for pallet in res["pallets"] if pallet["estado"] == "ok"}
+    pendientes = [
+        linea for linea in (texto or "").splitlines()
+        if linea.strip() and linea.split(",")[-1].strip() not in liberados
+    ]
+    return [alerta(res), detalle], "\n".join(pendientes)
+
+
 
 
 
@@ -910,14 +1338,206 @@ def health_check():
     return "OK", 200
 
 
+@app.server.route("/ready")
+def ready_check():
+    """Preparación: 200 cuando terminó el calentamiento inicial, 503 mientras tanto."""
+    return jsonify(calentamiento.estado()), 200 if calentamiento.lista() else 503
+
+
+@app.server.route("/metricas/consultas")
+def metricas_consultas():
+    """Cantidad de ejecuciones de cada consulta registrada en conexion_bd.CONSULTAS."""
+    return jsonify(contadores_consultas())
+
+
+@app.server.route("/metricas/disyuntor")
+def metricas_disyuntor():
+    """Estado del disyuntor de la base (cerrado o abierto, fallas seguidas, último error)."""
+    return jsonify(estado_disyuntor())
+
+
+@app.server.route("/metricas/diario")
+def metricas_diario():
+    """Escaneos pendientes del diario y los rechazados por la base al aplicarlos."""
+    diario = diario_escaneos.obtener_diario()
+    if diario is None:
+        return jsonify({"habilitado": False})
+    return jsonify({"habilitado": True, "pendientes": diario.pendientes(), "rechazados": diario.rechazos()})
+
 
+@app.server.route("/metricas/consistencia")
+def metricas_consistencia():
+    """Informe de la última revisión de consistencia (diferencias encontradas y reparadas)."""
+    return jsonify(consistencia.ultima_revision())
+
+
+# Estado HTTP de las respuestas de la API de escáneres según el resultado. Las fallas
+# de conexión (sin_conexion) responden 503 para que el escáner sepa que puede reintentar.
+ESTADOS_HTTP = {"ok": 200, "pendiente": 202, "error": 422}
+ESTADO_HTTP_SIN_CONEXION = 503
+
+
+def respuesta_escaner(res):
+    if res.get("sin_conexion"):
+        return jsonify(res), ESTADO_HTTP_SIN_CONEXION
+    return jsonify(res), ESTADOS_HTTP[res["estado"]]
+
+
+def cuerpo_escaner(campos):
+    """
+    Lee el cuerpo JSON de una petición de escáner. `campos` indica los tipos admitidos
+    de cada campo; los ausentes los valida la operación. Devuelve (datos, None), o
+    (None, respuesta 422) si el cuerpo no es un objeto o algún campo tiene otro tipo.
+    """
+    datos = request.get_json(silent=True)
+    if datos is None:
+        datos = {}
+    if not isinstance(datos, dict):
+        return None, respuesta_escaner(resultado("error", "Error: El cuerpo debe ser un objeto JSON."))
+    for campo, tipos in campos.items():
+        valor = datos.get(campo)
+        if valor is not None and (isinstance(valor, bool) or not isinstance(valor, tipos)):
+            return None, respuesta_escaner(resultado("error", f"Error: El campo '{campo}' no tiene un tipo válido."))
+    return datos, None
+
+
+@app.server.route("/api/escaner/ingreso", methods=["POST"])
+def api_ingreso():
+    """Ingreso de un pallet. Cuerpo JSON: {"qr": "<datos del QR>"}."""
+    datos, error = cuerpo_escaner({"qr": str})
+    if error:
+        return error
+    return respuesta_escaner(ingresar(datos.get("qr"), sesion=sesion_escaner()))
+
+
+@app.server.route("/api/escaner/asignacion", methods=["POST"])
+def api_asignacion():
+    """
+    Asignación de un pallet a un carril.
+    Cuerpo JSON: {"pallet": "<datos o NPallet>", "tipo_almacen", "piso", "rack", "letra"}.
+    """
+    datos, error = cuerpo_escaner(
+        {"pallet": str, "tipo_almacen": str, "piso": (int, str), "rack": (int, str), "letra": str}
+    )
+    if error:
+        return error
+    return respuesta_escaner(asignar(
+        datos.get("tipo_almacen"), datos.get("piso"), datos.get("rack"), datos.get("letra"), datos.get("pallet"),
+        sesion=sesion_escaner()
+    ))
+
+
+@app.server.route("/api/escaner/liberacion", methods=["POST"])
+def api_liberacion():
+    """Liberación de la posición 1 de un carril. Cuerpo JSON: {"pallet": "<datos o NPallet>"}."""
+    datos, error = cuerpo_escaner({"pallet": str})
+    if error:
+        return error
+    return respuesta_escaner(liberar(datos.get("pallet"), sesion=sesion_escaner()))
+
+
+@app.server.route("/api/escaner/liberacion-lote", methods=["POST"])
+def api_liberacion_lote():
+    """
+    Liberación de varios pallets en una transacción. Cuerpo JSON: {"pallets": ["<datos o NPallet>", ...]}.
+    La respuesta incluye el resultado de cada pallet en "pallets".
+    """
+    datos, error = cuerpo_escaner({"pallets": list})
+    if error:
+        return error
+    pallets = datos.get("pallets") or []
+    if not all(isinstance(pallet, str) for pallet in pallets):
+        return respuesta_escaner(resultado("error", "Error: Los pallets deben enviarse como texto."))
+    return respuesta_escaner(liberar_lote(pallets))
+
+
+def filas_json(filas, columnas):
+    """Convierte filas de la base en diccionarios serializables (fechas como texto)."""
+    return [
+        {col: (str(val) if val is not None and not isinstance(val, (int, float, str)) else val)
+         for col, val in zip(columnas, fila)}
+        for fila in filas
+    ]
+
+
+@app.server.route("/api/movimientos/pallet/<n_pallet>")
+def api_historial_pallet(n_pallet):
+    """Historial de movimientos de un pallet, del más antiguo al más reciente."""
+    return jsonify(filas_json(historial_pallet(n_pallet), [
+        "momento", "operacion", "tipo_almacen", "piso", "rack", "letra", "posicion_anterior", "posicion_pallet"
+    ]))
+
+
+@app.server.route("/api/movimientos/rack")
+def api_movimientos_rack():
+    """Movimientos de un rack en un día: ?tipo_almacen=&rack=&dia=AAAA-MM-DD (por defecto, hoy)."""
+    try:
+        rack = int(request.args["rack"])
+        dia = date.fromisoformat(request.args.get("dia") or date.today().isoformat())
+    except (KeyError, ValueError):
+        return jsonify({"error": "Indique rack (número) y dia (AAAA-MM-DD)."}), 400
+    filas = movimientos_rack_dia(request.args.get("tipo_almacen"), rack, dia)
+    return jsonify(filas_json(filas, [
+        "momento", "operacion", "NPallet", "piso", "letra", "posicion_anterior", "posicion_pallet"
+    ]))
+
+
+@app.server.route("/api/posiciones")
+def api_posiciones():
+    """
+    Devuelve el estado de las posiciones en JSON, de una cámara (?tipo_almacen=) o de todas.
+
+    El ETag es la huella del snapshot; si el cliente envía el mismo valor en
+    If-None-Match se responde 304 sin leer ni serializar las filas. Si la base no
+    responde se devuelve la última lectura con la cabecera X-Datos-Desde (fecha de esa
+    lectura), o 503 si todavía no hay ninguna.
+    """
+    tipo_almacen = request.args.get("tipo_almacen") or None
+    try:
+        filas, huella = obtener_snapshot(tipo_almacen)
+    except ConnectionError as e:
+        return jsonify({"estado": "error", "mensaje": str(e), "sin_conexion": True}), 503
+    cabeceras = {}
+    desde = desactualizado_desde(tipo_almacen)
+    if desde is not None:
+        cabeceras["X-Datos-Desde"] = desde.isoformat(timespec="seconds")
+    return respuesta_condicional(huella, lambda: jsonify(filas_json(filas, COLUMNAS_POSICIONES)), cabeceras)
+
+
+def respuesta_condicional(etag, generar, cabeceras=None):
+    """
+    Responde 304 si el cliente ya tiene la versión `etag` de los datos (If-None-Match)
+    y, si no, la respuesta que arma `generar()`. Como el ETag identifica la versión y
+    no el cuerpo, la comparación se hace antes de serializar.
+
+    Flask-Compress agrega el algoritmo al ETag de las respuestas comprimidas
+    ("abc:gzip"), por lo que se ignora ese sufijo al comparar.
+    """
+    enviados = {valor.split(":")[0] for valor in request.if_none_match.as_set()}
+    if etag in enviados:
+        response = app.server.response_class(status=304)
+    else:
+        response = generar()
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers.update(cabeceras or {})
+    return response
 
 
 # --- Layout Inicial ---
-app.layout = html.Div([
-    dcc.Location(id="url", refresh=True),  # Maneja las redirecciones
-    html.Div(id="page-content")  # Contenedor para el contenido de la página
-])
+def layout_principal():
+    """
+    Layout principal. Se arma en cada carga para que cada navegador reciba su propio
+    identificador de sesión; el dcc.Store local conserva el primero que recibió.
+    """
+    return html.Div([
+        dcc.Location(id="url", refresh=True),  # Maneja las redirecciones
+        dcc.Store(id="sesion-navegador", storage_type="local", data=uuid.uuid4().hex),
+        html.Div(id="page-content")  # Contenedor para el contenido de la página
+    ])
+
+
+app.layout = layout_principal
 
 
 # --- Ejecutar la Aplicación ---
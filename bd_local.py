@@ -0,0 +1,376 @@
+# bd_local.py
+
+"""
+Sustituto local de la base de datos de Azure sobre SQLite.
+
+Replica las tablas y los procedimientos almacenados que usa conexion_bd.py
+(InsertPalletFromQR, reasignar_pallet, retirar_pallet y actualizar_status_ubicacion)
+para poder ejecutar la aplicación, las pruebas de carga y los simuladores sin acceso
+a Azure SQL. Los errores de SQLite se traducen a las excepciones de pyodbc para que
+el manejo de errores de la aplicación sea el mismo.
+
+Como el driver ODBC sin MARS, una conexión rechaza una sentencia mientras otro de sus
+cursores tiene resultados sin terminar de leer (hasta que un fetch no devuelve más
+filas, o se llama a nextset o close), aunque SQLite no tenga esa limitación.
+"""
+
+import re
+import sqlite3
+
+import pyodbc
+
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS Usuarios (
+    username TEXT PRIMARY KEY,
+    password TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS pallets (
+    id_pallet INTEGER PRIMARY KEY AUTOINCREMENT,
+    descripcion TEXT,
+    Variedad TEXT,
+    Mercado TEXT,
+    fechafaena TEXT,
+    NPallet TEXT UNIQUE
+);
+CREATE TABLE IF NOT EXISTS ubicaciones (
+    id_ubicacion INTEGER PRIMARY KEY AUTOINCREMENT,
+    ubicacion_key TEXT UNIQUE,
+    tipo_almacen TEXT,
+    piso INTEGER,
+    rack INTEGER,
+    letra TEXT,
+    posicion_pallet INTEGER,
+    status_ubicacion TEXT DEFAULT 'Libre',
+    id_pallet_asignado INTEGER
+);
+CREATE TABLE IF NOT EXISTS asignacion_pallet (
+    id_pallet INTEGER PRIMARY KEY,
+    id_ubicacion INTEGER,
+    posicion_pallet INTEGER
+);
+CREATE TABLE IF NOT EXISTS movimientos_pallet (
+    id_movimiento INTEGER PRIMARY KEY AUTOINCREMENT,
+    momento TIMESTAMP NOT NULL,
+    operacion TEXT NOT NULL,
+    id_pallet INTEGER NOT NULL,
+    NPallet TEXT,
+    tipo_almacen TEXT,
+    piso INTEGER,
+    rack INTEGER,
+    letra TEXT,
+    posicion_anterior INTEGER,
+    posicion_pallet INTEGER
+);
+CREATE INDEX IF NOT EXISTS ix_movimientos_npallet ON movimientos_pallet (NPallet, momento);
+CREATE INDEX IF NOT EXISTS ix_movimientos_ubicacion ON movimientos_pallet (tipo_almacen, rack, momento);
+CREATE INDEX IF NOT EXISTS ix_ubicaciones_carril ON ubicaciones (piso, rack, letra, posicion_pallet);
+CREATE INDEX IF NOT EXISTS ix_ubicaciones_pallet ON ubicaciones (id_pallet_asignado);
+"""
+
+# Segundos que SQLite espera un bloqueo antes de fallar con "database is locked"
+TIEMPO_ESPERA_BLOQUEO = 5.0
+
+
+def crear_bd_local(ruta, tipos_almacen=("Camara 1",), pisos=4, racks=2, letras="ABCDEFGH", posiciones=6):
+    """
+    Crea (o reutiliza) una base SQLite con el esquema de la aplicación y una grilla de
+    ubicaciones libres: tipos_almacen x pisos x racks x letras x posiciones.
+
+    Con más de una cámara la base sirve para lecturas, pero no para asignar: el
+    procedimiento reasignar_pallet recibe solo piso, rack y letra, y el mismo carril
+    existe en todas las cámaras (ver _reasignar_pallet). Las pruebas de carga y el
+    simulador usan una sola cámara.
+    """
+    conn = sqlite3.connect(ruta)
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(ESQUEMA)
+        if conn.execute("SELECT COUNT(*) FROM ubicaciones").fetchone()[0] == 0:
+            filas = [
+                (f"{tipo}-{piso}-{rack}-{letra}-{posicion}", tipo, piso, rack, letra, posicion)
+                for tipo in tipos_almacen
+                for piso in range(1, pisos + 1)
+                for rack in range(1, racks + 1)
+                for letra in letras
+                for posicion in range(1, posiciones + 1)
+            ]
+            conn.executemany(
+                "INSERT INTO ubicaciones (ubicacion_key, tipo_almacen, piso, rack, letra, posicion_pallet) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                filas,
+            )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def conectar_bd_local(ruta, solo_lectura=False):
+    """Abre una conexión a la base local con la misma interfaz que pyodbc."""
+    if solo_lectura:
+        conn = sqlite3.connect(
+            f"file:{ruta}?mode=ro", uri=True, timeout=TIEMPO_ESPERA_BLOQUEO, check_same_thread=False
+        )
+    else:
+        conn = sqlite3.connect(ruta, timeout=TIEMPO_ESPERA_BLOQUEO, check_same_thread=False)
+    return ConexionLocal(conn)
+
+
+def instalar(ruta, *modulos, ruta_lectura=None):
+    """
+    Redirige conectar_bd de conexion_bd (y de los módulos indicados, que lo importan
+    por nombre) a la base local en `ruta`. Las lecturas dirigidas a la réplica usan
+    `ruta_lectura` en modo de solo lectura, o la misma base si no se indica.
+    """
+    import conexion_bd
+
+    def conectar_bd():
+        return conectar_bd_local(ruta)
+
+    def conectar_bd_lectura():
+        try:
+            return conectar_bd_local(ruta_lectura or ruta, solo_lectura=True)
+        except sqlite3.Error as e:
+            raise ConnectionError(f"Error al conectar a la réplica de lectura: {e}")
+
+    for modulo in (conexion_bd,) + modulos:
+        modulo.conectar_bd = conectar_bd
+    conexion_bd.conectar_bd_lectura = conectar_bd_lectura
+    # Las conexiones del pool apuntan a la base anterior
+    conexion_bd.vaciar_pool()
+    return conectar_bd
+
+
+def replicar(ruta, ruta_lectura):
+    """
+    Copia la base principal sobre la réplica local, como lo haría la replicación de
+    Azure SQL. Llamarla periódicamente simula una réplica con atraso.
+    """
+    origen = sqlite3.connect(ruta, timeout=TIEMPO_ESPERA_BLOQUEO)
+    destino = sqlite3.connect(ruta_lectura, timeout=TIEMPO_ESPERA_BLOQUEO)
+    try:
+        origen.backup(destino)
+    finally:
+        origen.close()
+        destino.close()
+
+
+def _traducir_error(e):
+    """Convierte una excepción de sqlite3 en su equivalente de pyodbc."""
+    if isinstance(e, sqlite3.IntegrityError):
+        return pyodbc.IntegrityError(str(e))
+    if isinstance(e, sqlite3.OperationalError):
+        if "locked" in str(e) or "busy" in str(e):
+            # Como un bloqueo o deadlock de SQL Server: conflicto reintentable
+            return pyodbc.OperationalError("40001", f"[40001] {e}")
+        return pyodbc.OperationalError("HY000", f"[HY000] {e}")
+    return pyodbc.Error(str(e))
+
+
+class ConexionLocal:
+    """Conexión con la interfaz mínima de pyodbc.Connection usada por la aplicación."""
+
+    def __init__(self, conn):
+        self._conn = conn
+        self.cursor_con_resultados = None
+
+    def cursor(self):
+        return CursorLocal(self._conn, self)
+
+    def commit(self):
+        try:
+            self._conn.commit()
+        except sqlite3.Error as e:
+            raise _traducir_error(e)
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def close(self):
+        self._conn.close()
+
+
+class CursorLocal:
+    """Cursor que ejecuta SQL en SQLite y emula los procedimientos almacenados (EXEC)."""
+
+    _PATRON_EXEC = re.compile(r"^\s*EXEC\s+(\w+)\s*(.*)$", re.IGNORECASE | re.DOTALL)
+    _PATRON_PARAMETRO = re.compile(r"@(\w+)\s*=\s*\?")
+
+    def __init__(self, conn, conexion):
+        self._conn = conn
+        self._conexion = conexion
+        self._cursor = conn.cursor()
+        self.fast_executemany = False
+        self.arraysize = 1
+
+    def _verificar_conexion_libre(self):
+        ocupado = self._conexion.cursor_con_resultados
+        if ocupado is not None and ocupado is not self:
+            raise pyodbc.Error("HY000", "[HY000] Connection is busy with results for another command")
+
+    def _terminar_resultados(self):
+        if self._conexion.cursor_con_resultados is self:
+            self._conexion.cursor_con_resultados = None
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    def execute(self, sql, *params):
+        if len(params) == 1 and isinstance(params[0], (list, tuple)):
+            params = params[0]
+        self._verificar_conexion_libre()
+        self._terminar_resultados()
+        try:
+            coincidencia = self._PATRON_EXEC.match(sql)
+            if coincidencia:
+                nombre, argumentos = coincidencia.groups()
+                nombres = self._PATRON_PARAMETRO.findall(argumentos)
+                procedimiento = PROCEDIMIENTOS[nombre.lower()]
+                procedimiento(self._conn, **dict(zip(nombres, params)))
+                self._cursor = self._conn.cursor()
+            else:
+                self._cursor.execute(sql, tuple(params))
+        except sqlite3.Error as e:
+            raise _traducir_error(e)
+        if self._cursor.description is not None:
+            self._conexion.cursor_con_resultados = self
+        return self
+
+    def executemany(self, sql, filas):
+        self._verificar_conexion_libre()
+        if self._PATRON_EXEC.match(sql):
+            # Los procedimientos se emulan de a una fila
+            for fila in filas:
+                self.execute(sql, fila)
+            return
+        try:
+            self._cursor.executemany(sql, [tuple(fila) for fila in filas])
+        except sqlite3.Error as e:
+            raise _traducir_error(e)
+
+    def fetchone(self):
+        fila = self._cursor.fetchone()
+        if fila is None:
+            self._terminar_resultados()
+        return fila
+
+    def fetchall(self):
+        filas = self._cursor.fetchall()
+        self._terminar_resultados()
+        return filas
+
+    def fetchmany(self, size=None):
+        size = size or self.arraysize
+        filas = self._cursor.fetchmany(size)
+        if len(filas) < size:
+            self._terminar_resultados()
+        return filas
+
+    def nextset(self):
+        # SQLite no devuelve varios conjuntos de resultados
+        self._terminar_resultados()
+        return False
+
+    def close(self):
+        self._terminar_resultados()
+        self._cursor.close()
+
+
+# --- Procedimientos almacenados ---
+def _iniciar_escritura(conn):
+    """Toma el bloqueo de escritura al comenzar un procedimiento, como haría SQL Server."""
+    if not conn.in_transaction:
+        conn.execute("BEGIN IMMEDIATE")
+
+
+def _insert_pallet_from_qr(conn, qrData):
+    variedad, descripcion, mercado, fecha_faena, n_pallet = qrData.split(",")
+    _iniciar_escritura(conn)
+    conn.execute(
+        "INSERT INTO pallets (Variedad, descripcion, Mercado, fechafaena, NPallet) VALUES (?, ?, ?, ?, ?)",
+        (variedad, descripcion, mercado, fecha_faena, n_pallet),
+    )
+
+
+def _reasignar_pallet(conn, piso, rack, letra, id_pallet):
+    _iniciar_escritura(conn)
+    # Los parámetros del procedimiento no identifican la cámara: si el carril existe
+    # en más de una, se falla en lugar de ocupar una posición de otra cámara
+    camaras = conn.execute(
+        "SELECT COUNT(DISTINCT tipo_almacen) FROM ubicaciones WHERE piso = ? AND rack = ? AND letra = ?",
+        (piso, rack, letra),
+    ).fetchone()[0]
+    if camaras > 1:
+        raise sqlite3.DatabaseError(
+            f"El carril {piso}-{rack}-{letra} existe en {camaras} cámaras; "
+            "la base local solo admite asignaciones con una cámara."
+        )
+    libre = conn.execute(
+        "SELECT id_ubicacion, posicion_pallet FROM ubicaciones "
+        "WHERE piso = ? AND rack = ? AND letra = ? AND id_pallet_asignado IS NULL "
+        "ORDER BY posicion_pallet LIMIT 1",
+        (piso, rack, letra),
+    ).fetchone()
+    if libre is None:
+        raise sqlite3.DatabaseError(f"No hay posiciones libres en {piso}-{rack}-{letra}.")
+    id_ubicacion, posicion = libre
+    conn.execute(
+        "UPDATE ubicaciones SET id_pallet_asignado = ? WHERE id_ubicacion = ?",
+        (id_pallet, id_ubicacion),
+    )
+    conn.execute(
+        "INSERT OR REPLACE INTO asignacion_pallet (id_pallet, id_ubicacion, posicion_pallet) VALUES (?, ?, ?)",
+        (id_pallet, id_ubicacion, posicion),
+    )
+
+
+def _retirar_pallet(conn, id_pallet):
+    _iniciar_escritura(conn)
+    actual = conn.execute(
+        "SELECT tipo_almacen, piso, rack, letra, posicion_pallet FROM ubicaciones WHERE id_pallet_asignado = ?",
+        (id_pallet,),
+    ).fetchone()
+    if actual is None:
+        raise sqlite3.DatabaseError(f"El pallet {id_pallet} no tiene ubicación.")
+    tipo_almacen, piso, rack, letra, posicion = actual
+    conn.execute("DELETE FROM asignacion_pallet WHERE id_pallet = ?", (id_pallet,))
+
+    # Los pallets detrás del retirado avanzan una posición
+    carril = conn.execute(
+        "SELECT id_ubicacion, posicion_pallet, id_pallet_asignado FROM ubicaciones "
+        "WHERE tipo_almacen = ? AND piso = ? AND rack = ? AND letra = ? AND posicion_pallet >= ? "
+        "ORDER BY posicion_pallet",
+        (tipo_almacen, piso, rack, letra, posicion),
+    ).fetchall()
+    for (id_ubicacion, _, _), (_, _, siguiente) in zip(carril, carril[1:] + [(None, None, None)]):
+        conn.execute(
+            "UPDATE ubicaciones SET id_pallet_asignado = ? WHERE id_ubicacion = ?",
+            (siguiente, id_ubicacion),
+        )
+        if siguiente is not None:
+            conn.execute(
+                "UPDATE asignacion_pallet SET id_ubicacion = ?, posicion_pallet = "
+                "(SELECT posicion_pallet FROM ubicaciones WHERE id_ubicacion = ?) WHERE id_pallet = ?",
+                (id_ubicacion, id_ubicacion, siguiente),
+            )
+
+
+def _actualizar_status_ubicacion(conn):
+    _iniciar_escritura(conn)
+    conn.execute(
+        "UPDATE ubicaciones SET status_ubicacion = "
+        "CASE WHEN id_pallet_asignado IS NULL THEN 'Libre' ELSE 'Ocupado' END"
+    )
+
+
+PROCEDIMIENTOS = {
+    "insertpalletfromqr": _insert_pallet_from_qr,
+    "reasignar_pallet": _reasignar_pallet,
+    "retirar_pallet": _retirar_pallet,
+    "actualizar_status_ubicacion": _actualizar_status_ubicacion,
+}
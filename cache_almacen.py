@@ -0,0 +1,174 @@
+# cache_almacen.py
+
+"""
+Caché de lecturas del almacén particionada por tipo_almacen (cámara).
+
+Cada cámara tiene su propio snapshot de posiciones y sus propias opciones de
+ubicaciones libres, que se cargan, vencen e invalidan de forma independiente: un
+movimiento en una cámara solo invalida esa cámara. Las cargas concurrentes de una
+misma partición se agrupan en una sola consulta.
+
+Lecturas con revalidación (stale-while-revalidate): mientras una petición recarga un
+snapshot vencido, las demás reciben el anterior sin esperar. Si la base no responde
+o el disyuntor de conexion_bd está abierto, se sirve la última lectura buena y la
+cámara queda marcada como desactualizada hasta la siguiente lectura correcta.
+"""
+
+import itertools
+import threading
+import time
+import uuid
+from datetime import datetime
+
+import pyodbc
+
+import conexion_bd
+
+
+# Segundos. Los movimientos hechos por este proceso invalidan la cámara al instante
+# (invalidar), así que el TTL solo acota cuánto tardan en verse los cambios hechos por
+# otros procesos o directamente en la base. Un TTL igual al intervalo de la vista en
+# tiempo real recargaba la cámara completa en cada tick aunque nada hubiera cambiado.
+TTL_SNAPSHOT = 30.0
+TTL_OPCIONES = 5.0
+TTL_TIPOS = 300.0
+
+_lock = threading.Lock()
+_snapshots = {}      # tipo_almacen -> (momento, posiciones, huella)
+_opciones = {}       # tipo_almacen -> {(piso, rack, letra): (momento, opciones)}
+_generaciones = {}   # tipo_almacen -> contador de invalidaciones
+_cargas = {}         # clave de partición -> Lock para agrupar cargas concurrentes
+_tipos = None        # (momento, lista de tipos de almacén)
+
+# Últimas lecturas buenas, que las invalidaciones no descartan
+_respaldos = {}            # tipo_almacen -> (fecha de lectura, posiciones, huella)
+_respaldos_opciones = {}   # (tipo_almacen, piso, rack, letra) -> opciones
+_desactualizados = {}      # tipo_almacen -> fecha de la lectura que se sirve sin conexión
+
+# Las claves de vista que guardan los clientes y el ETag de /api/posiciones se arman
+# con la huella, y la petición siguiente puede llegar a otro proceso: las huellas
+# llevan un prefijo propio de cada proceso
+_PROCESO = uuid.uuid4().hex[:8]
+_cargas_snapshot = itertools.count(1)
+
+
+def nueva_huella():
+    """
+    Huella de una carga de snapshot: distinta en cada carga y en cada proceso. Identifica
+    la lectura, no su contenido, así que no recorre las posiciones; una recarga sin
+    cambios da otra huella y las vistas lo resuelven comparando celdas.
+    """
+    return f"{_PROCESO}-{next(_cargas_snapshot)}"
+
+
+def _lock_carga(clave):
+    with _lock:
+        return _cargas.setdefault(clave, threading.Lock())
+
+
+def _vigente(entrada, ttl):
+    return entrada is not None and time.monotonic() - entrada[0] < ttl
+
+
+def _servir_respaldo(tipo_almacen, error):
+    """Última lectura buena de una cámara, marcada como desactualizada; sin ella se propaga `error`."""
+    respaldo = _respaldos.get(tipo_almacen)
+    if respaldo is None:
+        raise error
+    if tipo_almacen not in _desactualizados:
+        print(f"Caché: sin conexión, se sirven las posiciones de {tipo_almacen} leídas a las {respaldo[0]:%H:%M:%S}: {error}")
+    _desactualizados[tipo_almacen] = respaldo[0]
+    return respaldo[1], respaldo[2]
+
+
+def obtener_snapshot(tipo_almacen):
+    """
+    Devuelve (posiciones, huella) de una cámara, recargándola si venció su TTL. Si la
+    base no responde devuelve la última lectura buena (ver desactualizado_desde).
+    """
+    entrada = _snapshots.get(tipo_almacen)
+    if _vigente(entrada, TTL_SNAPSHOT):
+        return entrada[1], entrada[2]
+
+    carga = _lock_carga(("snapshot", tipo_almacen))
+    # Con un snapshot vencido no se espera a la recarga que ya hace otra petición
+    if not carga.acquire(blocking=entrada is None):
+        return entrada[1], entrada[2]
+    try:
+        entrada = _snapshots.get(tipo_almacen)
+        if _vigente(entrada, TTL_SNAPSHOT):
+            return entrada[1], entrada[2]
+        generacion = _generaciones.get(tipo_almacen, 0)
+        try:
+            posiciones = conexion_bd.obtener_todas_las_posiciones(tipo_almacen)
+        except (ConnectionError, pyodbc.Error) as e:
+            return _servir_respaldo(tipo_almacen, e)
+        entrada = (time.monotonic(), posiciones, nueva_huella())
+        with _lock:
+            # No guardar datos leídos antes de una invalidación concurrente
+            if _generaciones.get(tipo_almacen, 0) == generacion:
+                _snapshots[tipo_almacen] = entrada
+            _respaldos[tipo_almacen] = (datetime.now(), entrada[1], entrada[2])
+            _desactualizados.pop(tipo_almacen, None)
+    finally:
+        carga.release()
+    return entrada[1], entrada[2]
+
+
+def desactualizado_desde(tipo_almacen):
+    """
+    Fecha de la lectura que se está sirviendo en lugar de una actual porque la base no
+    responde, o None si las posiciones de la cámara están al día.
+    """
+    return _desactualizados.get(tipo_almacen)
+
+
+def obtener_opciones(tipo_almacen=None, piso=None, rack=None, letra=None):
+    """
+    Versión con caché de conexion_bd.obtener_opciones_disponibles. Las lecturas sin
+    tipo_almacen (todas las cámaras) forman su propia partición (None), que se
+    invalida junto con cualquier cámara.
+    """
+    clave = (piso, rack, letra)
+    particion = _opciones.get(tipo_almacen, {})
+    entrada = particion.get(clave)
+    if _vigente(entrada, TTL_OPCIONES):
+        return entrada[1]
+
+    generacion = _generaciones.get(tipo_almacen, 0)
+    try:
+        opciones = conexion_bd.obtener_opciones_disponibles(
+            tipo_almacen=tipo_almacen, piso=piso, rack=rack, letra=letra
+        )
+    except (ConnectionError, pyodbc.Error):
+        respaldo = _respaldos_opciones.get((tipo_almacen,) + clave)
+        if respaldo is None:
+            raise
+        return respaldo
+    with _lock:
+        if _generaciones.get(tipo_almacen, 0) == generacion:
+            _opciones.setdefault(tipo_almacen, {})[clave] = (time.monotonic(), opciones)
+        _respaldos_opciones[(tipo_almacen,) + clave] = opciones
+    return opciones
+
+
+def obtener_tipos_almacen():
+    """Lista de cámaras (tipo_almacen) definidas en ubicaciones."""
+    global _tipos
+    if not _vigente(_tipos, TTL_TIPOS):
+        try:
+            _tipos = (time.monotonic(), conexion_bd.obtener_tipos_almacen())
+        except (ConnectionError, pyodbc.Error):
+            # Las cámaras casi nunca cambian: sin conexión sirve la lista anterior
+            if _tipos is None:
+                raise
+    return _tipos[1]
+
+
+def invalidar(tipo_almacen):
+    """Descarta los datos en caché de una cámara tras un movimiento en ella."""
+    with _lock:
+        for particion in (tipo_almacen, None):
+            _generaciones[particion] = _generaciones.get(particion, 0) + 1
+            _opciones.pop(particion, None)
+            _snapshots.pop(particion, None)
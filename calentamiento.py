@@ -0,0 +1,102 @@
+# calentamiento.py
+
+"""
+Calentamiento al iniciar la aplicación y estado de preparación (readiness).
+
+Tras cada reinicio de App Service, la primera petición pagaba la resolución DNS, el
+TLS y el inicio de sesión en la base, y luego la carga de los cachés. Al iniciar, un
+hilo en segundo plano abre las conexiones iniciales de los pools, crea la tabla
+movimientos_pallet si no existe y carga los cachés de cámaras, posiciones, opciones
+de ubicación y contadores de ocupación. Hasta que
+termina, lista() devuelve False y la ruta /ready responde 503, de modo que el
+balanceador no envía tráfico a la instancia. Si la base no responde, se reintenta
+con espera creciente.
+
+Con CALENTAMIENTO=0 no se calienta nada y la instancia se considera lista de inmediato;
+la tabla movimientos_pallet debe existir (movimientos.crear_tabla_movimientos).
+"""
+
+import os
+import threading
+import time
+
+import pyodbc
+
+import cache_almacen
+import conexion_bd
+import movimientos
+import ocupacion
+
+
+CONEXIONES_INICIALES = int(os.environ.get("BD_CONEXIONES_INICIALES", "4"))
+CONEXIONES_INICIALES_LECTURA = int(os.environ.get("BD_CONEXIONES_INICIALES_LECTURA", "2"))
+HABILITADO = os.environ.get("CALENTAMIENTO", "1") != "0"
+ESPERA_MAXIMA_REINTENTO = 60.0
+
+_listo = threading.Event()
+_estado = {"etapa": "pendiente", "intentos": 0, "error": None, "segundos": None}
+_hilo = None
+_hilo_lock = threading.Lock()
+
+
+def calentar():
+    """Abre las conexiones iniciales y carga los cachés. Propaga los errores de la base."""
+    _estado["etapa"] = "conexiones"
+    conexion_bd.precalentar_pool(CONEXIONES_INICIALES, CONEXIONES_INICIALES_LECTURA)
+
+    _estado["etapa"] = "esquema"
+    try:
+        movimientos.crear_tabla_movimientos()
+    except pyodbc.Error as e:
+        # Sin permisos de DDL la instancia funciona igual, pero el registro de movimientos no
+        print(f"Calentamiento: no se pudo crear movimientos_pallet (créela con movimientos.ESQUEMA_SQL_SERVER): {e}")
+
+    _estado["etapa"] = "cachés"
+    for tipo_almacen in cache_almacen.obtener_tipos_almacen():
+        cache_almacen.obtener_snapshot(tipo_almacen)
+        cache_almacen.obtener_opciones(tipo_almacen)
+    cache_almacen.obtener_opciones()
+
+    _estado["etapa"] = "ocupación"
+    ocupacion.ocupacion()
+
+
+def _calentar_con_reintentos():
+    inicio = time.monotonic()
+    espera = 1.0
+    while True:
+        _estado["intentos"] += 1
+        try:
+            calentar()
+            break
+        except Exception as e:
+            _estado["error"] = str(e)
+            print(f"Calentamiento: falló en la etapa '{_estado['etapa']}', se reintentará en {espera:.0f} s: {e}")
+            time.sleep(espera)
+            espera = min(espera * 2, ESPERA_MAXIMA_REINTENTO)
+    _estado.update(etapa="lista", error=None, segundos=round(time.monotonic() - inicio, 3))
+    _listo.set()
+
+
+def iniciar():
+    """Inicia el calentamiento en segundo plano (una sola vez por proceso)."""
+    global _hilo
+    with _hilo_lock:
+        if _hilo is not None or _listo.is_set():
+            return
+        if not HABILITADO:
+            _estado["etapa"] = "lista"
+            _listo.set()
+            return
+        _hilo = threading.Thread(target=_calentar_con_reintentos, name="calentamiento", daemon=True)
+        _hilo.start()
+
+
+def lista():
+    """True cuando el calentamiento terminó y la instancia puede recibir tráfico."""
+    return _listo.is_set()
+
+
+def estado():
+    """Copia del estado del calentamiento, para la ruta de preparación."""
+    return dict(_estado, lista=lista())
@@ -2,7 +2,62 @@
 
 import pyodbc
 import hashlib
-import dash_bootstrap_components as dbc
+import os
+import queue
+import random
+import threading
+import time
+from collections import Counter
+
+import disyuntor
+import movimientos
+
+
+# Parámetros de conexión. Cada uno se puede configurar con la variable de entorno
+# indicada (por ejemplo, en la configuración de la aplicación en App Service);
+# BD_CADENA_CONEXION reemplaza la cadena completa. Las credenciales no tienen valor
+# por defecto: sin BD_USUARIO y BD_CLAVE (ni BD_CADENA_CONEXION) no se conecta.
+BD_DRIVER = os.environ.get("BD_DRIVER", "{ODBC Driver 17 for SQL Server}")
+BD_SERVIDOR = os.environ.get("BD_SERVIDOR", "gestiondepallet-server.database.windows.net")
+BD_NOMBRE = os.environ.get("BD_NOMBRE", "GestionFrigorifico")
+BD_USUARIO = os.environ.get("BD_USUARIO")
+BD_CLAVE = os.environ.get("BD_CLAVE")
+
+CADENA_CONEXION = os.environ.get("BD_CADENA_CONEXION")
+if not CADENA_CONEXION and BD_USUARIO and BD_CLAVE:
+    CADENA_CONEXION = (
+        f'DRIVER={BD_DRIVER};'
+        f'SERVER={BD_SERVIDOR};'
+        f'DATABASE={BD_NOMBRE};'
+        f'UID={BD_USUARIO};'
+        f'PWD={BD_CLAVE};'
+        'Encrypt=yes;'
+        'TrustServerCertificate=no;'
+    )
+if CADENA_CONEXION and not CADENA_CONEXION.endswith(";"):
+    CADENA_CONEXION += ";"
+
+# Segundos de espera al iniciar sesión y por consulta (0 = sin límite). Una consulta
+# que agota su tiempo cuenta como falla para el disyuntor (ver disyuntor.py).
+TIEMPO_CONEXION = int(os.environ.get("BD_TIEMPO_CONEXION", "15"))
+TIEMPO_CONSULTA = int(os.environ.get("BD_TIEMPO_CONSULTA", "30"))
+
+
+class ConfiguracionIncompleta(ConnectionError):
+    """
+    Faltan los parámetros de conexión. Es un ConnectionError para que las operaciones,
+    los cachés y el diario de escaneos la traten como una base no disponible.
+    """
+
+
+def _cadena_conexion():
+    """Cadena de conexión configurada; ConfiguracionIncompleta si faltan las credenciales."""
+    if not CADENA_CONEXION:
+        raise ConfiguracionIncompleta(
+            "Faltan las credenciales de la base de datos: defina las variables de entorno "
+            "BD_USUARIO y BD_CLAVE, o BD_CADENA_CONEXION."
+        )
+    return CADENA_CONEXION
 
 
 # Función para conectar a la base de datos
@@ -10,36 +65,412 @@ def conectar_bd():
     """
     Establece una conexión con la base de datos en Azure.
     """
+    cadena = _cadena_conexion()
     try:
-        conn = pyodbc.connect(
-            'DRIVER={ODBC Driver 17 for SQL Server};'
-            'SERVER=gestiondepallet-server.database.windows.net;'
-            'DATABASE=GestionFrigorifico;'
-            'UID=Admin_DBA;'
-            'PWD=Sebyta14;'
-            'Encrypt=yes;'
-            'TrustServerCertificate=no;'
-        )
+        conn = pyodbc.connect(cadena, timeout=TIEMPO_CONEXION)
+        conn.timeout = TIEMPO_CONSULTA
         return conn
     except pyodbc.Error as e:
         raise ConnectionError(f"Error al conectar a la base de datos: {e}")
 
 
+def conectar_bd_lectura():
+    """
+    Establece una conexión de solo lectura. Con ApplicationIntent=ReadOnly, Azure SQL
+    la dirige a la réplica de lectura (o a la principal si no hay réplica).
+    """
+    cadena = _cadena_conexion()
+    try:
+        conn = pyodbc.connect(cadena + 'ApplicationIntent=ReadOnly;', timeout=TIEMPO_CONEXION)
+        conn.timeout = TIEMPO_CONSULTA
+        return conn
+    except pyodbc.Error as e:
+        raise ConnectionError(f"Error al conectar a la réplica de lectura: {e}")
+
+
+# --- Registro de consultas y pool de conexiones ---
+
+# Sentencias con nombre usadas por la aplicación. Cada conexión del pool reserva un
+# cursor por sentencia, por lo que el driver la prepara una sola vez por conexión.
+# En las sentencias con {marcadores} se expande un "?" por parámetro (listas IN), y
+# se reserva un cursor por cantidad de parámetros.
+CONSULTAS = {
+    "crear_usuario": "INSERT INTO Usuarios (username, password) VALUES (?, ?)",
+    "verificar_credenciales": "SELECT * FROM Usuarios WHERE username = ? AND password = ?",
+    "pallet_existe": "SELECT 1 FROM pallets WHERE id_pallet = ?",
+    "contar_npallet": "SELECT COUNT(*) FROM pallets WHERE NPallet = ?",
+    "id_pallet_por_npallet": "SELECT id_pallet FROM pallets WHERE NPallet = ?",
+    "pallet_y_tipo_por_npallet": (
+        "SELECT p.id_pallet, u.tipo_almacen FROM pallets p "
+        "LEFT JOIN ubicaciones u ON u.id_pallet_asignado = p.id_pallet WHERE p.NPallet = ?"
+    ),
+    "ubicacion_de_pallet": "SELECT ubicacion_key FROM ubicaciones WHERE id_pallet_asignado = ?",
+    "contar_ubicaciones_pallet": "SELECT COUNT(*) FROM ubicaciones WHERE id_pallet_asignado = ?",
+    "asignacion_de_pallet": "SELECT id_ubicacion, posicion_pallet FROM asignacion_pallet WHERE id_pallet = ?",
+    "carril_de_pallet": (
+        "SELECT tipo_almacen, piso, rack, letra, posicion_pallet FROM ubicaciones WHERE id_pallet_asignado = ?"
+    ),
+    "pallets_y_carril_por_npallets": (
+        "SELECT p.NPallet, p.id_pallet, u.tipo_almacen, u.piso, u.rack, u.letra, u.posicion_pallet "
+        "FROM pallets p LEFT JOIN ubicaciones u ON u.id_pallet_asignado = p.id_pallet "
+        "WHERE p.NPallet IN ({marcadores})"
+    ),
+    "npallets_existentes": "SELECT NPallet FROM pallets WHERE NPallet IN ({marcadores})",
+    "version_carril": (
+        "SELECT posicion_pallet, id_pallet_asignado FROM ubicaciones "
+        "WHERE tipo_almacen = ? AND piso = ? AND rack = ? AND letra = ? ORDER BY posicion_pallet"
+    ),
+    "posiciones": """
+        SELECT 
+            u.tipo_almacen, 
+            u.piso, 
+            u.rack, 
+            u.letra, 
+            u.posicion_pallet, 
+            u.status_ubicacion, 
+            u.id_pallet_asignado,
+            p.descripcion,
+            p.Variedad,
+            p.Mercado,
+            p.fechafaena,
+            p.NPallet
+        FROM ubicaciones u
+        LEFT JOIN pallets p ON u.id_pallet_asignado = p.id_pallet
+        WHERE (? IS NULL OR u.tipo_almacen = ?)
+    """,
+    "tipos_almacen": "SELECT DISTINCT tipo_almacen FROM ubicaciones ORDER BY tipo_almacen",
+    "opciones_disponibles": """
+        SELECT DISTINCT tipo_almacen, piso, rack, letra
+        FROM ubicaciones
+        WHERE status_ubicacion = 'Libre'
+          AND (? IS NULL OR tipo_almacen = ?)
+          AND (? IS NULL OR piso = ?)
+          AND (? IS NULL OR rack = ?)
+          AND (? IS NULL OR letra = ?)
+        ORDER BY tipo_almacen, piso, rack, letra
+    """,
+    "insertar_pallet_qr": "EXEC InsertPalletFromQR @qrData = ?",
+    "reasignar_pallet": "EXEC reasignar_pallet @piso=?, @rack=?, @letra=?, @id_pallet=?",
+    "retirar_pallet": "EXEC retirar_pallet @id_pallet = ?",
+    "actualizar_status_ubicacion": "EXEC actualizar_status_ubicacion",
+    "ocupacion": (
+        "SELECT tipo_almacen, rack, piso, COUNT(*), "
+        "SUM(CASE WHEN id_pallet_asignado IS NULL THEN 0 ELSE 1 END) "
+        "FROM ubicaciones GROUP BY tipo_almacen, rack, piso"
+    ),
+    "insertar_movimiento": (
+        "INSERT INTO movimientos_pallet (momento, operacion, id_pallet, tipo_almacen, piso, rack, letra, "
+        "posicion_anterior, posicion_pallet, NPallet) "
+        "SELECT ?, ?, ?, ?, ?, ?, ?, ?, ?, NPallet FROM pallets WHERE id_pallet = ?"
+    ),
+    "historial_pallet": (
+        "SELECT momento, operacion, tipo_almacen, piso, rack, letra, posicion_anterior, posicion_pallet "
+        "FROM movimientos_pallet WHERE NPallet = ? ORDER BY momento, id_movimiento"
+    ),
+    "movimientos_rack_dia": (
+        "SELECT momento, operacion, NPallet, piso, letra, posicion_anterior, posicion_pallet "
+        "FROM movimientos_pallet WHERE tipo_almacen = ? AND rack = ? AND momento >= ? AND momento < ? "
+        "ORDER BY momento, id_movimiento"
+    ),
+    "entradas_salidas_desde": (
+        "SELECT momento, operacion, rack FROM movimientos_pallet "
+        "WHERE (? IS NULL OR tipo_almacen = ?) AND momento >= ? AND operacion IN ('asignacion', 'liberacion')"
+    ),
+}
+
+POOL_TAMANO = int(os.environ.get("BD_POOL_TAMANO", "10"))  # Conexiones inactivas que se conservan para reutilizar
+ESPERA_REPLICA = 30.0  # Segundos sin intentar la réplica de lectura tras una falla
+# Segundos que una conexión puede quedar inactiva en el pool. Azure y los balanceadores
+# intermedios cortan las conexiones ociosas; reutilizarlas haría fallar la primera
+# consulta y la contaría como falla para el disyuntor, por lo que se descartan antes.
+INACTIVIDAD_MAXIMA = float(os.environ.get("BD_INACTIVIDAD_MAXIMA", "240"))
+LECTURA_ARRAYSIZE = int(os.environ.get("BD_ARRAYSIZE", "1000"))  # Filas por fetchmany en lecturas grandes
+
+_contadores = Counter()
+_contadores_lock = threading.Lock()
+
+
+class ConexionPool:
+    """Conexión prestada por el pool: close() la devuelve al pool en lugar de cerrarla."""
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self.conn = conn
+        self.cursores = {}
+        self.activo = None
+        self.invalida = False
+        self.devuelta = time.monotonic()
+
+    def activar(self, cursor):
+        """
+        Marca `cursor` como el próximo en ejecutar y descarta los resultados sin leer
+        del anterior. Sin MARS, el driver rechaza una sentencia ("Connection is busy
+        with results for another command") mientras otro cursor de la misma conexión
+        tiene resultados abiertos, aunque ya se haya leído su única fila con fetchone.
+        """
+        if self.activo is not None and self.activo is not cursor:
+            _descartar_resultados(self.activo)
+        self.activo = cursor
+
+    def cursor(self):
+        cursor = self.conn.cursor()
+        self.activar(cursor)
+        return cursor
+
+    def commit(self):
+        self.conn.commit()
+
+    def rollback(self):
+        self.conn.rollback()
+
+    def close(self):
+        self._pool.devolver(self)
+
+
+class PoolConexiones:
+    """Pool de conexiones reutilizables; las conexiones con errores de enlace se descartan."""
+
+    def __init__(self, conectar, tamano=POOL_TAMANO, inactividad_maxima=INACTIVIDAD_MAXIMA):
+        self._conectar = conectar
+        self._tamano = tamano
+        self._inactividad_maxima = inactividad_maxima
+        self._libres = queue.LifoQueue()
+
+    def obtener(self):
+        while True:
+            try:
+                conexion = self._libres.get_nowait()
+            except queue.Empty:
+                return ConexionPool(self, self._conectar())
+            if time.monotonic() - conexion.devuelta <= self._inactividad_maxima:
+                return conexion
+            # Inactiva demasiado tiempo: probablemente cortada por el servidor
+            self._cerrar(conexion)
+
+    def devolver(self, conexion):
+        if conexion.activo is not None:
+            _descartar_resultados(conexion.activo)
+            conexion.activo = None
+        if not conexion.invalida:
+            try:
+                # No dejar transacciones abiertas en una conexión reutilizable
+                conexion.rollback()
+            except pyodbc.Error:
+                conexion.invalida = True
+        if conexion.invalida or self._libres.qsize() >= self._tamano:
+            self._cerrar(conexion)
+        else:
+            conexion.devuelta = time.monotonic()
+            self._libres.put(conexion)
+
+    def precalentar(self, cantidad):
+        """Abre conexiones hasta tener `cantidad` inactivas (sin superar el tamaño del pool)."""
+        while self._libres.qsize() < min(cantidad, self._tamano):
+            self._libres.put(ConexionPool(self, self._conectar()))
+
+    def vaciar(self):
+        while True:
+            try:
+                self._cerrar(self._libres.get_nowait())
+            except queue.Empty:
+                return
+
+    @staticmethod
+    def _cerrar(conexion):
+        try:
+            conexion.conn.close()
+        except pyodbc.Error:
+            pass
+
+
+_pool = PoolConexiones(lambda: conectar_bd())
+_pool_lectura = PoolConexiones(lambda: conectar_bd_lectura())
+_replica_caida_hasta = 0.0
+
+
+def _sondear_base():
+    """Prueba de la base principal para el disyuntor: conexión nueva y SELECT 1."""
+    conn = conectar_bd()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT 1")
+        cursor.fetchone()
+    finally:
+        conn.close()
+
+
+_disyuntor = disyuntor.Disyuntor(lambda: _sondear_base())
+
+
+def obtener_conexion(lectura=False):
+    """
+    Toma una conexión del pool (o abre una nueva). Se devuelve con close().
+
+    Con lectura=True la conexión es a la réplica de lectura, para consultas que toleran
+    unos segundos de atraso. Si la réplica no responde se usa la base principal y no
+    se vuelve a intentar hasta pasados ESPERA_REPLICA segundos.
+
+    Con el disyuntor abierto lanza disyuntor.CircuitoAbierto (un ConnectionError) sin
+    intentar conectarse.
+    """
+    global _replica_caida_hasta
+    _disyuntor.verificar()
+    if lectura and time.monotonic() >= _replica_caida_hasta:
+        try:
+            return _pool_lectura.obtener()
+        except ConnectionError as e:
+            _replica_caida_hasta = time.monotonic() + ESPERA_REPLICA
+            print(f"Réplica de lectura no disponible, se usa la base principal: {e}")
+    try:
+        return _pool.obtener()
+    except ConnectionError as e:
+        _disyuntor.registrar_falla(e)
+        raise
+
+
+def precalentar_pool(cantidad, cantidad_lectura=0):
+    """
+    Abre de antemano conexiones a la base principal (y a la réplica de lectura), para
+    que las primeras peticiones no paguen DNS, TLS e inicio de sesión. Una falla de la
+    réplica no es un error: las lecturas usarán la base principal.
+    """
+    _pool.precalentar(cantidad)
+    if cantidad_lectura:
+        try:
+            _pool_lectura.precalentar(cantidad_lectura)
+        except ConnectionError as e:
+            print(f"Réplica de lectura no disponible al precalentar: {e}")
+
+
+def estado_disyuntor():
+    """Estado del disyuntor de la base (ver disyuntor.py)."""
+    return _disyuntor.estado()
+
+
+def vaciar_pool():
+    """Cierra las conexiones inactivas de los pools, por ejemplo al cambiar de base de datos."""
+    global _replica_caida_hasta
+    _pool.vaciar()
+    _pool_lectura.vaciar()
+    _replica_caida_hasta = 0.0
+
+
+def _es_error_conexion(error):
+    """Indica si un error de pyodbc invalida la conexión (SQLSTATE 08xxx)."""
+    return bool(error.args) and str(error.args[0]).startswith("08")
+
+
+def _descartar_resultados(cursor):
+    """Descarta las filas y los conjuntos de resultados que quedan sin leer en un cursor."""
+    try:
+        while cursor.nextset():
+            pass
+    except pyodbc.Error:
+        pass
+
+
+def registrar_consultas(consultas):
+    """Agrega sentencias con nombre al registro, para módulos que definen las suyas."""
+    repetidas = set(consultas) & set(CONSULTAS)
+    if repetidas:
+        raise ValueError(f"Consultas ya registradas: {', '.join(sorted(repetidas))}")
+    CONSULTAS.update(consultas)
+
+
+def _es_tiempo_agotado(error):
+    """Indica si un error de pyodbc es por tiempo de espera agotado (SQLSTATE HYT00 o HYT01)."""
+    return bool(error.args) and str(error.args[0]) in ("HYT00", "HYT01")
+
+
+def _registrar_en_disyuntor(inicio, error=None):
+    """
+    Informa al disyuntor el resultado de una consulta: los errores de conexión, los
+    tiempos agotados y las consultas más lentas que disyuntor.LENTITUD_MAXIMA cuentan
+    como fallas; cualquier otra respuesta, como éxito. Con inicio=None (lotes, cuya
+    duración depende de la cantidad de filas) no se mide la lentitud.
+    """
+    if error is not None:
+        if _es_error_conexion(error) or _es_tiempo_agotado(error):
+            _disyuntor.registrar_falla(error)
+        return
+    duracion = 0.0 if inicio is None else time.monotonic() - inicio
+    if duracion > disyuntor.LENTITUD_MAXIMA:
+        _disyuntor.registrar_falla(f"consulta de {duracion:.1f} s")
+    else:
+        _disyuntor.registrar_exito()
+
+
+def ejecutar(conexion, nombre, params=()):
+    """
+    Ejecuta la consulta registrada `nombre` con el cursor que la conexión reserva
+    para ella, y devuelve ese cursor para leer los resultados. Los resultados que
+    hayan quedado sin leer en el cursor usado antes en la conexión se descartan.
+    """
+    sql = CONSULTAS[nombre]
+    clave = nombre
+    if "{marcadores}" in sql:
+        sql = sql.format(marcadores=", ".join("?" * len(params)))
+        clave = f"{nombre}:{len(params)}"
+    cursor = conexion.cursores.get(clave)
+    if cursor is None:
+        cursor = conexion.cursores[clave] = conexion.conn.cursor()
+    conexion.activar(cursor)
+    with _contadores_lock:
+        _contadores[nombre] += 1
+    inicio = time.monotonic()
+    try:
+        cursor.execute(sql, params)
+    except pyodbc.Error as e:
+        if _es_error_conexion(e):
+            conexion.invalida = True
+        _registrar_en_disyuntor(inicio, e)
+        raise
+    _registrar_en_disyuntor(inicio)
+    return cursor
+
+
+def ejecutar_lote(conexion, nombre, filas):
+    """
+    Ejecuta la consulta registrada `nombre` una vez por fila, enviando todas las filas
+    juntas con fast_executemany en lugar de un viaje de ida y vuelta por fila.
+    """
+    filas = [tuple(fila) for fila in filas]
+    if not filas:
+        return
+    clave = f"{nombre}:lote"
+    cursor = conexion.cursores.get(clave)
+    if cursor is None:
+        cursor = conexion.cursores[clave] = conexion.conn.cursor()
+        cursor.fast_executemany = True
+    conexion.activar(cursor)
+    with _contadores_lock:
+        _contadores[nombre] += len(filas)
+    try:
+        cursor.executemany(CONSULTAS[nombre], filas)
+    except pyodbc.Error as e:
+        if _es_error_conexion(e):
+            conexion.invalida = True
+        _registrar_en_disyuntor(None, e)
+        raise
+    _registrar_en_disyuntor(None)
+
+
+def contadores_consultas():
+    """Cantidad de ejecuciones de cada consulta registrada desde el inicio del proceso."""
+    with _contadores_lock:
+        return dict(_contadores)
+
 
 def crear_usuario(username, password):
     """
     Crea un nuevo usuario con credenciales encriptadas.
     Retorna True si el usuario fue creado exitosamente, False en caso de error.
     """
-    conn = conectar_bd()
-    cursor = conn.cursor()
+    conn = obtener_conexion()
     hashed_password = hashlib.sha256(password.encode()).hexdigest()
 
     try:
-        cursor.execute(
-            "INSERT INTO Usuarios (username, password) VALUES (?, ?)",
-            (username, hashed_password)
-        )
+        ejecutar(conn, "crear_usuario", (username, hashed_password))
         conn.commit()
         return True
     except pyodbc.IntegrityError:
@@ -58,167 +489,426 @@ def verificar_credenciales(username, password):
     """
     Verifica las credenciales de un usuario.
     """
-    conn = conectar_bd()
-    cursor = conn.cursor()
+    conn = obtener_conexion()
     hashed_password = hashlib.sha256(password.encode()).hexdigest()
 
     try:
-        cursor.execute(
-            "SELECT * FROM Usuarios WHERE username = ? AND password = ?",
-            (username, hashed_password)
-        )
-        usuario = cursor.fetchone()
+        usuario = ejecutar(conn, "verificar_credenciales", (username, hashed_password)).fetchone()
         return usuario is not None
     finally:
         conn.close()
 
 
 # Funciones relacionadas con ubicaciones y pallets
-def asignar_ubicacion(pallet_id, tipo_almacen, piso, rack, letra):
+
+# Reintentos automáticos cuando otro operador modifica el mismo carril a la vez
+MAX_REINTENTOS_CONFLICTO = 3
+ESPERA_BASE_REINTENTO = 0.05  # segundos; se duplica en cada reintento
+
+# SQLSTATE de pyodbc que indican un conflicto transitorio (deadlock, timeout de bloqueo)
+SQLSTATE_CONFLICTO = ("40001", "HYT00")
+
+
+class ConflictoConcurrencia(Exception):
+    """Otro operador modificó el carril entre la lectura de su versión y la escritura."""
+
+
+def _es_conflicto(error):
     """
-    Asigna una ubicación a un pallet en el almacén.
+    Indica si un error de pyodbc corresponde a un conflicto transitorio reintentable.
+    Los errores de enlace (08xxx) no lo son: ver _error_de_conexion.
     """
-    conn = conectar_bd()
-    cursor = conn.cursor()
+    return bool(error.args) and error.args[0] in SQLSTATE_CONFLICTO
+
+
+def _error_de_conexion(error):
+    """ConnectionError equivalente a un error de enlace de pyodbc (08xxx), o None si no lo es."""
+    if _es_error_conexion(error):
+        return ConnectionError(f"Se perdió la conexión con la base de datos: {error}")
+    return None
+
+
+def _version_carril(conn, tipo_almacen, piso, rack, letra):
+    """
+    Devuelve la versión de un carril: la secuencia (posición, pallet) de sus ubicaciones.
+    Cualquier asignación o retiro en el carril produce una versión distinta.
+    """
+    cursor = ejecutar(conn, "version_carril", (tipo_almacen, piso, rack, letra))
+    return tuple((fila[0], fila[1]) for fila in cursor.fetchall())
+
+
+def _con_reintentos(intento, mensaje_conflicto):
+    """
+    Ejecuta `intento` (una función que abre su propia transacción) y lo reintenta con
+    espera exponencial si falla por ConflictoConcurrencia o por un conflicto de la base.
+    """
+    for numero in range(MAX_REINTENTOS_CONFLICTO + 1):
+        try:
+            return intento()
+        except ConflictoConcurrencia:
+            pass
+        except pyodbc.Error as e:
+            if not _es_conflicto(e):
+                raise
+        if numero < MAX_REINTENTOS_CONFLICTO:
+            time.sleep(ESPERA_BASE_REINTENTO * (2 ** numero) * (0.5 + random.random()))
+    return mensaje_conflicto
 
+
+def asignar_ubicacion(pallet_id, tipo_almacen, piso, rack, letra, conexion=None):
+    """
+    Asigna una ubicación a un pallet en el almacén.
+
+    La asignación es optimista: se lee la versión del carril, se ejecuta
+    reasignar_pallet y, antes de confirmar, se verifica en la misma transacción que
+    el único cambio en el carril es el pallet asignado y que el pallet no quedó en
+    dos ubicaciones. Si otro operador intervino, se revierte y se reintenta. Un
+    carril sin posiciones libres se rechaza sin llamar al procedimiento.
+
+    Con `conexion` se usa esa conexión (por ejemplo, la del diario de escaneos) en
+    lugar de una del pool; no debe tener cambios sin confirmar, porque un conflicto
+    los revierte.
+    """
     try:
         # Validar que el pallet ID sea un entero
         pallet_id = int(pallet_id)
+    except ValueError:
+        return "Error: El ID del pallet debe ser un número entero."
 
-        # Verificar si el pallet existe
-        cursor.execute("SELECT 1 FROM pallets WHERE id_pallet = ?", (pallet_id,))
-        if cursor.fetchone() is None:
-            return f"Error: El Pallet con ID {pallet_id} no existe."
+    def intento():
+        conn = conexion or obtener_conexion()
+        try:
+            # Verificar si el pallet existe
+            if ejecutar(conn, "pallet_existe", (pallet_id,)).fetchone() is None:
+                return f"Error: El Pallet con ID {pallet_id} no existe."
 
-        # Verificar si el pallet ya tiene una ubicación asignada
-        cursor.execute(
-            "SELECT ubicacion_key FROM ubicaciones WHERE id_pallet_asignado = ?",
-            (pallet_id,)
-        )
-        ubicacion_actual = cursor.fetchone()
-        if ubicacion_actual:
-            return f"Error: El Pallet ya tiene una ubicación asignada: {ubicacion_actual[0]}."
-
-        # Asignar ubicación mediante procedimientos almacenados
-        cursor.execute(
-            "EXEC reasignar_pallet @piso=?, @rack=?, @letra=?, @id_pallet=?",
-            (piso, rack, letra, pallet_id)
-        )
-        conn.commit()
+            # Verificar si el pallet ya tiene una ubicación asignada
+            ubicacion_actual = ejecutar(conn, "ubicacion_de_pallet", (pallet_id,)).fetchone()
+            if ubicacion_actual:
+                return f"Error: El Pallet ya tiene una ubicación asignada: {ubicacion_actual[0]}."
 
-        cursor.execute("EXEC actualizar_status_ubicacion")
-        conn.commit()
+            # Verificar que el carril exista y tenga lugar
+            version = _version_carril(conn, tipo_almacen, piso, rack, letra)
+            if not version:
+                return f"Error: La ubicación {tipo_almacen}, {piso}, {rack}, {letra} no existe."
+            if all(pallet is not None for _, pallet in version):
+                return f"Error: La ubicación {tipo_almacen}, {piso}, {rack}, {letra} no tiene posiciones libres."
 
-        return f"Pallet {pallet_id} asignado a la ubicación {tipo_almacen}, {piso}, {rack}, {letra}."
-    except ValueError:
-        return "Error: El ID del pallet debe ser un número entero."
+            # Asignar ubicación mediante procedimientos almacenados
+            ejecutar(conn, "reasignar_pallet", (piso, rack, letra, pallet_id))
+
+            # Verificar la versión antes de confirmar
+            nueva_version = _version_carril(conn, tipo_almacen, piso, rack, letra)
+            cambios = [(antes, despues) for antes, despues in zip(version, nueva_version) if antes != despues]
+            ubicaciones_pallet = ejecutar(conn, "contar_ubicaciones_pallet", (pallet_id,)).fetchone()[0]
+            if (
+                len(nueva_version) != len(version)
+                or len(cambios) != 1
+                or cambios[0][0][1] is not None
+                or cambios[0][1][1] != pallet_id
+                or ubicaciones_pallet != 1
+            ):
+                conn.rollback()
+                raise ConflictoConcurrencia()
+
+            ejecutar(conn, "actualizar_status_ubicacion")
+            conn.commit()
+            movimientos.registrar(
+                "asignacion", pallet_id, tipo_almacen, piso, rack, letra, posicion_pallet=cambios[0][1][0]
+            )
+
+            return f"Pallet {pallet_id} asignado a la ubicación {tipo_almacen}, {piso}, {rack}, {letra}."
+        except pyodbc.Error:
+            conn.rollback()
+            raise
+        finally:
+            if conexion is None:
+                conn.close()
+
+    try:
+        return _con_reintentos(
+            intento,
+            f"Error: Conflicto al asignar el Pallet {pallet_id}; otro operador modificó el carril. Intente nuevamente."
+        )
     except pyodbc.Error as e:
+        error_conexion = _error_de_conexion(e)
+        if error_conexion is not None:
+            raise error_conexion from e
         return f"Error al asignar ubicación: {e}"
-    finally:
-        conn.close()
 
 
 def liberar_ubicacion(pallet_id):
     """
     Libera una ubicación ocupada por un pallet y reorganiza posiciones.
-    """
-    conn = conectar_bd()
-    cursor = conn.cursor()
 
+    Igual que la asignación, el retiro verifica la versión del carril antes de
+    confirmar: el resto de los pallets debe quedar en el mismo orden, sin el retirado.
+    """
     try:
         # Validar que el pallet ID sea un entero
         pallet_id = int(pallet_id)
+    except ValueError:
+        return "Error: El ID del pallet debe ser un número entero."
 
-        # Verificar si el pallet existe
-        cursor.execute("SELECT 1 FROM pallets WHERE id_pallet = ?", (pallet_id,))
-        if cursor.fetchone() is None:
-            return f"Error: El Pallet con ID {pallet_id} no existe."
+    def intento():
+        conn = obtener_conexion()
+        try:
+            # Verificar si el pallet existe
+            if ejecutar(conn, "pallet_existe", (pallet_id,)).fetchone() is None:
+                return f"Error: El Pallet con ID {pallet_id} no existe."
 
-        # Verificar si el pallet tiene una ubicación asignada
-        cursor.execute(
-            "SELECT id_ubicacion, posicion_pallet FROM asignacion_pallet WHERE id_pallet = ?",
-            (pallet_id,)
-        )
-        result = cursor.fetchone()
-        if result is None:
-            return f"Error: El Pallet con ID {pallet_id} no está asignado a ninguna ubicación."
+            # Verificar si el pallet tiene una ubicación asignada. asignacion_pallet no se
+            # vuelve a consultar: consistencia.py la mantiene alineada con ubicaciones
+            fila = ejecutar(conn, "carril_de_pallet", (pallet_id,)).fetchone()
+            if fila is None:
+                return f"Error: El Pallet con ID {pallet_id} no está asignado a ninguna ubicación."
 
-        id_ubicacion, posicion_actual = result
+            carril, posicion_actual = tuple(fila[:4]), fila[4]
 
-        # Verificar si el pallet está en la posición 1
-        if posicion_actual != 1:
-            return "Error: Solo se puede retirar el pallet de la posición 1."
+            # Verificar si el pallet está en la posición 1
+            if posicion_actual != 1:
+                return "Error: Solo se puede retirar el pallet de la posición 1."
 
-        # Retirar el pallet
-        cursor.execute("EXEC retirar_pallet @id_pallet = ?", (pallet_id,))
-        conn.commit()
+            version = _version_carril(conn, *carril)
 
-        cursor.execute("EXEC actualizar_status_ubicacion")
-        conn.commit()
+            # Retirar el pallet
+            ejecutar(conn, "retirar_pallet", (pallet_id,))
 
-        return f"Ubicación liberada y reorganizada para el Pallet {pallet_id}."
-    except ValueError:
-        return "Error: El ID del pallet debe ser un número entero."
+            # Verificar la versión antes de confirmar
+            nueva_version = _version_carril(conn, *carril)
+            esperados = [p for _, p in version if p is not None and p != pallet_id]
+            if [p for _, p in nueva_version if p is not None] != esperados:
+                conn.rollback()
+                raise ConflictoConcurrencia()
+
+            ejecutar(conn, "actualizar_status_ubicacion")
+            conn.commit()
+
+            # Registrar el retiro y el avance de los pallets que quedaban detrás
+            movimientos.registrar("liberacion", pallet_id, *carril, posicion_anterior=posicion_actual)
+            posiciones_antes = {p: pos for pos, p in version if p is not None}
+            for posicion, id_avanza in nueva_version:
+                if id_avanza is not None and posiciones_antes.get(id_avanza) != posicion:
+                    movimientos.registrar(
+                        "avance", id_avanza, *carril,
+                        posicion_pallet=posicion, posicion_anterior=posiciones_antes.get(id_avanza)
+                    )
+
+            return f"Ubicación liberada y reorganizada para el Pallet {pallet_id}."
+        except pyodbc.Error:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    try:
+        return _con_reintentos(
+            intento,
+            f"Error: Conflicto al liberar el Pallet {pallet_id}; otro operador modificó el carril. Intente nuevamente."
+        )
     except pyodbc.Error as e:
-        conn.rollback()
+        error_conexion = _error_de_conexion(e)
+        if error_conexion is not None:
+            raise error_conexion from e
         return f"Error al liberar ubicación: {e}"
-    finally:
-        conn.close()
 
 
-def obtener_todas_las_posiciones():
+def liberar_ubicaciones(n_pallets):
     """
-    Recupera todas las posiciones del almacén, incluyendo id_pallet_asignado, descripción, variedad, mercado, fecha de faena y NPallet.
+    Libera varios pallets en una sola transacción, por ejemplo al cargar un camión.
+
+    Los NPallet se buscan con una sola consulta. En cada carril solo se pueden retirar
+    los pallets del lote que ocupan las primeras posiciones seguidas (1, 2, ...): al
+    retirarlos en orden, cada uno llega a la posición 1. Los demás pallets del lote se
+    rechazan sin impedir el retiro del resto. Antes de confirmar se verifica la versión
+    de cada carril tocado, como en liberar_ubicacion.
+
+    Returns:
+        list: Un resultado (NPallet, id_pallet, carril, liberado, mensaje) por NPallet
+        distinto, en el orden recibido.
     """
-    conn = conectar_bd()
-    cursor = conn.cursor()
+    n_pallets = list(dict.fromkeys(n_pallets))
+    if not n_pallets:
+        return []
+
+    def intento():
+        conn = obtener_conexion()
+        try:
+            filas = ejecutar(conn, "pallets_y_carril_por_npallets", n_pallets).fetchall()
+            encontrados = {fila[0]: fila for fila in filas}
 
+            resultados = {}
+            por_carril = {}
+            for n_pallet in n_pallets:
+                fila = encontrados.get(n_pallet)
+                if fila is None:
+                    resultados[n_pallet] = (n_pallet, None, None, False, f"Error: El NPallet '{n_pallet}' no existe.")
+                elif fila[2] is None:
+                    resultados[n_pallet] = (
+                        n_pallet, fila[1], None, False,
+                        f"Error: El Pallet con ID {fila[1]} no está asignado a ninguna ubicación."
+                    )
+                else:
+                    por_carril.setdefault(tuple(fila[2:6]), []).append((fila[6], fila[1], n_pallet))
+
+            # Validar el orden de cada carril y retirar desde el frente
+            versiones = {}
+            retirados = {}
+            for carril, pallets in por_carril.items():
+                versiones[carril] = _version_carril(conn, *carril)
+                pallets.sort()
+                for esperado, (posicion, id_pallet, n_pallet) in enumerate(pallets, start=1):
+                    if posicion != esperado:
+                        resultados[n_pallet] = (
+                            n_pallet, id_pallet, carril, False,
+                            f"Error: El Pallet con ID {id_pallet} está en la posición {posicion} y delante "
+                            "hay pallets que no están en el lote."
+                        )
+                        continue
+                    ejecutar(conn, "retirar_pallet", (id_pallet,))
+                    retirados.setdefault(carril, []).append((posicion, id_pallet))
+                    resultados[n_pallet] = (
+                        n_pallet, id_pallet, carril, True,
+                        f"Ubicación liberada y reorganizada para el Pallet {id_pallet}."
+                    )
+
+            # Verificar la versión de los carriles tocados antes de confirmar
+            nuevas_versiones = {}
+            for carril, pallets in retirados.items():
+                ids_retirados = {id_pallet for _, id_pallet in pallets}
+                nuevas_versiones[carril] = _version_carril(conn, *carril)
+                esperados = [p for _, p in versiones[carril] if p is not None and p not in ids_retirados]
+                if [p for _, p in nuevas_versiones[carril] if p is not None] != esperados:
+                    conn.rollback()
+                    raise ConflictoConcurrencia()
+
+            if retirados:
+                ejecutar(conn, "actualizar_status_ubicacion")
+            conn.commit()
+
+            # Registrar los retiros y el avance neto de los pallets que quedaban detrás
+            for carril, pallets in retirados.items():
+                for posicion, id_pallet in pallets:
+                    movimientos.registrar("liberacion", id_pallet, *carril, posicion_anterior=posicion)
+                posiciones_antes = {p: pos for pos, p in versiones[carril] if p is not None}
+                for posicion, id_avanza in nuevas_versiones[carril]:
+                    if id_avanza is not None and posiciones_antes.get(id_avanza) != posicion:
+                        movimientos.registrar(
+                            "avance", id_avanza, *carril,
+                            posicion_pallet=posicion, posicion_anterior=posiciones_antes.get(id_avanza)
+                        )
+
+            return [resultados[n_pallet] for n_pallet in n_pallets]
+        except pyodbc.Error:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    mensaje_conflicto = "Error: Conflicto al liberar el lote; otro operador modificó un carril. Intente nuevamente."
     try:
-        cursor.execute("""
-            SELECT 
-                u.tipo_almacen, 
-                u.piso, 
-                u.rack, 
-                u.letra, 
-                u.posicion_pallet, 
-                u.status_ubicacion, 
-                u.id_pallet_asignado,
-                p.descripcion,
-                p.Variedad,
-                p.Mercado,
-                p.fechafaena,
-                p.NPallet
-            FROM ubicaciones u
-            LEFT JOIN pallets p ON u.id_pallet_asignado = p.id_pallet
-        """)
-        return cursor.fetchall()
-    finally:
-        conn.close()
+        resultado = _con_reintentos(intento, mensaje_conflicto)
+    except pyodbc.Error as e:
+        error_conexion = _error_de_conexion(e)
+        if error_conexion is not None:
+            raise error_conexion from e
+        resultado = f"Error al liberar ubicaciones: {e}"
+    if isinstance(resultado, str):
+        return [(n_pallet, None, None, False, resultado) for n_pallet in n_pallets]
+    return resultado
+
+
+# --- Lecturas por lotes ---
+
+class LecturaColumnar:
+    """
+    Resultado de una lectura guardado por columnas: una lista por columna del SELECT.
+    Se puede iterar como filas (tuplas) para los consumidores que las necesitan.
+    """
+
+    __slots__ = ("columnas",)
+
+    def __init__(self, columnas):
+        self.columnas = columnas
+
+    def __len__(self):
+        return len(self.columnas[0]) if self.columnas else 0
+
+    def __iter__(self):
+        return zip(*self.columnas)
+
+    def columna(self, indice):
+        return self.columnas[indice]
 
 
+def leer_lotes(cursor, arraysize=None):
+    """Genera los lotes de hasta `arraysize` filas que devuelve fetchmany hasta agotar el cursor."""
+    cursor.arraysize = arraysize or LECTURA_ARRAYSIZE
+    while True:
+        lote = cursor.fetchmany(cursor.arraysize)
+        if not lote:
+            return
+        yield lote
 
 
-def obtener_opciones_campo():
+def leer_por_columnas(cursor, arraysize=None):
     """
-    Recupera las opciones únicas de cada campo desde la base de datos.
+    Lee el resultado de un cursor de a un lote y vuelca cada lote en una lista por
+    columna, sin conservar las filas.
+
+    Memoria máxima: las listas de columnas (8 bytes por valor), un objeto por valor
+    distinto de las columnas repetitivas o por valor de las demás, y un solo lote de
+    `arraysize` filas. Con fetchall se sumaba un objeto Row por fila (unos 60 + 8 x
+    columnas bytes) y un objeto por cada valor, repetido o no, durante toda la vida
+    del snapshot. prueba_memoria.py mide y acota este máximo.
     """
-    conn = conectar_bd()
-    cursor = conn.cursor()
+    columnas = [[] for _ in cursor.description]
+    # Los valores repetidos de una columna (cámara, letra, Variedad...) se guardan una
+    # sola vez; una columna deja de deduplicarse si la mitad de sus valores son distintos
+    repetidos = [{} for _ in columnas]
+    for lote in leer_lotes(cursor, arraysize):
+        for indice, (columna, valores) in enumerate(zip(columnas, zip(*lote))):
+            vistos = repetidos[indice]
+            if vistos is None:
+                columna.extend(valores)
+                continue
+            columna.extend(map(vistos.setdefault, valores, valores))
+            if len(vistos) * 2 > len(columna):
+                repetidos[indice] = None
+    return LecturaColumnar(columnas)
 
-    try:
-        cursor.execute("SELECT DISTINCT tipo_almacen FROM ubicaciones")
-        tipos_almacen = [row[0] for row in cursor.fetchall()]
 
-        cursor.execute("SELECT DISTINCT piso FROM ubicaciones")
-        pisos = [row[0] for row in cursor.fetchall()]
+# Columnas devueltas por obtener_todas_las_posiciones, en orden
+COLUMNAS_POSICIONES = [
+    "Tipo Almacén", "Piso", "Rack", "Letra", "Posición Pallet", "Estado Ubicación",
+    "id_pallet_asignado", "Descripción", "Variedad", "Mercado", "Fecha Faena", "NPallet"
+]
+
 
-        cursor.execute("SELECT DISTINCT rack FROM ubicaciones")
-        racks = [row[0] for row in cursor.fetchall()]
+def obtener_todas_las_posiciones(tipo_almacen=None):
+    """
+    Recupera todas las posiciones del almacén, incluyendo id_pallet_asignado, descripción, variedad, mercado, fecha de faena y NPallet.
+    Si se indica tipo_almacen, solo se leen las posiciones de esa cámara.
 
-        cursor.execute("SELECT DISTINCT letra FROM ubicaciones")
-        letras = [row[0] for row in cursor.fetchall()]
+    Devuelve una LecturaColumnar (ver leer_por_columnas) con las columnas de COLUMNAS_POSICIONES.
+    """
+    conn = obtener_conexion(lectura=True)
 
-        return tipos_almacen, pisos, racks, letras
+    try:
+        tipo_almacen = tipo_almacen or None
+        return leer_por_columnas(ejecutar(conn, "posiciones", (tipo_almacen, tipo_almacen)))
+    finally:
+        conn.close()
+
+
+def obtener_tipos_almacen():
+    """
+    Recupera los tipos de almacén (cámaras) definidos en ubicaciones.
+    """
+    conn = obtener_conexion(lectura=True)
+
+    try:
+        return [row[0] for row in ejecutar(conn, "tipos_almacen").fetchall()]
     finally:
         conn.close()
 
@@ -227,44 +917,23 @@ def obtener_opciones_disponibles(tipo_almacen=None, piso=None, rack=None, letra=
     """
     Recupera las opciones disponibles basadas en los filtros seleccionados.
     """
-    conn = conectar_bd()
-    cursor = conn.cursor()
+    conn = obtener_conexion(lectura=True)
 
     try:
-        query = """
-            SELECT DISTINCT tipo_almacen, piso, rack, letra
-            FROM ubicaciones
-            WHERE status_ubicacion = 'Libre'
-        """
-        conditions = []
-        params = []
-
-        if tipo_almacen:
-            conditions.append("tipo_almacen = ?")
-            params.append(tipo_almacen)
-        if piso:
-            conditions.append("piso = ?")
-            params.append(piso)
-        if rack:
-            conditions.append("rack = ?")
-            params.append(rack)
-        if letra:
-            conditions.append("letra = ?")
-            params.append(letra)
-
-        if conditions:
-            query += " AND " + " AND ".join(conditions)
-
-        query += " ORDER BY tipo_almacen, piso, rack, letra"
-
-        cursor.execute(query, params)
-        opciones_libres = cursor.fetchall()
-
-        # Organizar los datos
-        tipos_almacen = sorted(set(row[0] for row in opciones_libres))
-        pisos = sorted(set(row[1] for row in opciones_libres if row[1]))
-        racks = sorted(set(row[2] for row in opciones_libres if row[2]))
-        letras = sorted(set(row[3] for row in opciones_libres if row[3]))
+        # Los filtros vacíos se envían como NULL para usar siempre la misma sentencia
+        filtros = [valor or None for valor in (tipo_almacen, piso, rack, letra)]
+        params = [valor for filtro in filtros for valor in (filtro, filtro)]
+        cursor = ejecutar(conn, "opciones_disponibles", params)
+
+        # Organizar los datos: solo se conservan los valores distintos de cada columna
+        valores = [set(), set(), set(), set()]
+        for lote in leer_lotes(cursor):
+            for conjunto, columna in zip(valores, zip(*lote)):
+                conjunto.update(columna)
+        tipos_almacen = sorted(valores[0])
+        pisos = sorted(valor for valor in valores[1] if valor)
+        racks = sorted(valor for valor in valores[2] if valor)
+        letras = sorted(valor for valor in valores[3] if valor)
 
         return tipos_almacen, pisos, racks, letras
     finally:
@@ -272,6 +941,34 @@ def obtener_opciones_disponibles(tipo_almacen=None, piso=None, rack=None, letra=
 
 
 
+def validar_qr(qr_data):
+    """
+    Valida el formato de los datos de un código QR de pallet.
+
+    Returns:
+        tuple: (n_pallet, None) si el QR es válido, o (None, mensaje de error).
+    """
+    # Dividir los datos del QR
+    datos = qr_data.split(',')
+
+    if len(datos) != 5:
+        return None, "Error: El formato del QR no es válido. Debe tener 5 campos separados por comas."
+
+    # Extraer los campos validados (Variedad, Descripción, Mercado, FechaFaena, NPallet)
+    fecha_faena = datos[3]
+    n_pallet = datos[4]
+
+    # Verificar la longitud de FechaFaena
+    if len(fecha_faena) != 8 or not fecha_faena.isdigit():
+        return None, f"Error: La Fecha Faena debe tener exactamente 8 caracteres numéricos. Valor proporcionado: {fecha_faena}"
+
+    # Verificar la longitud de NPallet
+    if len(n_pallet) != 8:
+        return None, f"Error: El NPallet debe tener exactamente 8 caracteres. Valor proporcionado: {n_pallet}"
+
+    return n_pallet, None
+
+
 def ingresar_pallet(qr_data):
     """
     Inserta un pallet en la base de datos utilizando el procedimiento almacenado InsertPalletFromQR.
@@ -280,47 +977,44 @@ def ingresar_pallet(qr_data):
         qr_data (str): Los datos del código QR que se deben insertar en la base de datos.
 
     Returns:
-        str: Un mensaje indicando si el ingreso fue exitoso o si hubo un error.
-    """
-    if qr_data:
-        # Dividir los datos del QR
-        datos = qr_data.split(',')
-        
-        if len(datos) != 5:
-            return dbc.Alert(f"Error: El formato del QR no es válido. Debe tener 5 campos separados por comas.", color="danger")
-        
-        # Extraer cada campo
-        variedad = datos[0]
-        descripcion = datos[1]
-        mercado = datos[2]
-        fecha_faena = datos[3]
-        n_pallet = datos[4]
-        
-        # Verificar la longitud de FechaFaena
-        if len(fecha_faena) != 8 or not fecha_faena.isdigit():
-            return dbc.Alert(f"Error: La Fecha Faena debe tener exactamente 8 caracteres numéricos. Valor proporcionado: {fecha_faena}", color="danger")
-
-        # Verificar la longitud de NPallet
-        if len(n_pallet) != 8:
-            return dbc.Alert(f"Error: El NPallet debe tener exactamente 8 caracteres. Valor proporcionado: {n_pallet}", color="danger")
-        
-        conn = conectar_bd()
-        cursor = conn.cursor()
-        try:
-            # Verificar si el NPallet ya existe
-            cursor.execute("SELECT COUNT(*) FROM pallets WHERE NPallet = ?", (n_pallet,))
-            if cursor.fetchone()[0] > 0:
-                return dbc.Alert(f"Error: El NPallet '{n_pallet}' ya existe en la base de datos.", color="danger")
-            
-            # Ejecutar el procedimiento almacenado para insertar el pallet desde el QR
-            cursor.execute("EXEC InsertPalletFromQR @qrData = ?", (qr_data,))
-            conn.commit()
-            return dbc.Alert(f"Pallet ingresado exitosamente con datos: {qr_data}", color="success")
-        except pyodbc.Error as e:
-            return dbc.Alert(f"Error al ingresar pallet: {e}", color="danger")
-        finally:
-            conn.close()
-    return ""
+        dict: Resultado con "estado" ("ok" o "error"), "mensaje" y el NPallet ingresado;
+        los errores de la base que no se deben a los datos llevan "sin_conexion": True.
+    """
+    n_pallet, error = validar_qr(qr_data)
+    if error:
+        return {"estado": "error", "mensaje": error}
+
+    conn = obtener_conexion()
+    try:
+        # Verificar si el NPallet ya existe
+        if ejecutar(conn, "contar_npallet", (n_pallet,)).fetchone()[0] > 0:
+            return {
+                "estado": "error",
+                "mensaje": f"Error: El NPallet '{n_pallet}' ya existe en la base de datos.",
+                "n_pallet": n_pallet,
+            }
+
+        # Ejecutar el procedimiento almacenado para insertar el pallet desde el QR
+        ejecutar(conn, "insertar_pallet_qr", (qr_data,))
+        conn.commit()
+        return {
+            "estado": "ok",
+            "mensaje": f"Pallet ingresado exitosamente con datos: {qr_data}",
+            "n_pallet": n_pallet,
+        }
+    except (pyodbc.IntegrityError, pyodbc.DataError, pyodbc.ProgrammingError) as e:
+        # Datos rechazados por la base: reintentar no cambia el resultado
+        return {"estado": "error", "mensaje": f"Error al ingresar pallet: {e}", "n_pallet": n_pallet}
+    except pyodbc.Error as e:
+        # Enlace caído, tiempo agotado u otra falla de la base: el escáner puede reintentar
+        return {
+            "estado": "error",
+            "mensaje": f"Error al ingresar pallet: {e}",
+            "n_pallet": n_pallet,
+            "sin_conexion": True,
+        }
+    finally:
+        conn.close()
 
 
 
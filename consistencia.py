@@ -0,0 +1,188 @@
+# consistencia.py
+
+"""
+Reconciliador de consistencia entre ubicaciones, asignacion_pallet y status_ubicacion.
+
+La ubicación de un pallet está en dos lugares: ubicaciones.id_pallet_asignado (que
+leen la asignación y las vistas) y asignacion_pallet (id_ubicacion y
+posicion_pallet, que lee el retiro). Un hilo en segundo plano compara ambas
+estructuras, y el estado Libre/Ocupado de cada ubicación, cada INTERVALO_REVISION
+segundos con consultas por conjuntos (una por chequeo, sin recorrer filas en Python).
+
+ubicaciones es la fuente de verdad: con REPARAR las diferencias de asignacion_pallet
+y de status_ubicacion se corrigen en una sola transacción. Los pallets en dos
+ubicaciones y los huecos dentro de un carril solo se informan, porque repararlos
+requiere decidir qué pallet está realmente en cada posición.
+
+Variables de entorno: RECONCILIADOR=0 lo desactiva, RECONCILIADOR_REPARAR=0 solo
+informa y RECONCILIADOR_INTERVALO cambia el intervalo.
+"""
+
+import os
+import threading
+import time
+from datetime import datetime
+
+import pyodbc
+
+import cache_almacen
+import conexion_bd
+
+
+HABILITADO = os.environ.get("RECONCILIADOR", "1") != "0"
+REPARAR = os.environ.get("RECONCILIADOR_REPARAR", "1") != "0"
+INTERVALO_REVISION = float(os.environ.get("RECONCILIADOR_INTERVALO", "300"))
+
+# Pallets que están en exactamente una ubicación (los únicos que se pueden reparar)
+_PALLETS_UNICOS = (
+    "SELECT id_pallet_asignado FROM ubicaciones WHERE id_pallet_asignado IS NOT NULL "
+    "GROUP BY id_pallet_asignado HAVING COUNT(*) = 1"
+)
+_ESTADO_CORRECTO = "CASE WHEN id_pallet_asignado IS NULL THEN 'Libre' ELSE 'Ocupado' END"
+
+# Chequeo -> (descripción, consulta que cuenta las diferencias, reparación o None)
+CHEQUEOS = {
+    "pallets_duplicados": (
+        "pallets en más de una ubicación",
+        "SELECT COUNT(*) FROM (SELECT id_pallet_asignado FROM ubicaciones "
+        "WHERE id_pallet_asignado IS NOT NULL GROUP BY id_pallet_asignado HAVING COUNT(*) > 1) d",
+        None,
+    ),
+    "huecos_en_carril": (
+        "posiciones libres delante de una ocupada",
+        "SELECT COUNT(*) FROM ubicaciones libre JOIN ubicaciones ocupada "
+        "ON ocupada.tipo_almacen = libre.tipo_almacen AND ocupada.piso = libre.piso "
+        "AND ocupada.rack = libre.rack AND ocupada.letra = libre.letra "
+        "AND ocupada.posicion_pallet > libre.posicion_pallet "
+        "WHERE libre.id_pallet_asignado IS NULL AND ocupada.id_pallet_asignado IS NOT NULL",
+        None,
+    ),
+    "asignaciones_desalineadas": (
+        "asignaciones que no coinciden con su ubicación",
+        "SELECT COUNT(*) FROM asignacion_pallet a JOIN ubicaciones u ON u.id_pallet_asignado = a.id_pallet "
+        "WHERE a.id_ubicacion IS NULL OR a.id_ubicacion <> u.id_ubicacion "
+        "OR a.posicion_pallet IS NULL OR a.posicion_pallet <> u.posicion_pallet",
+        "UPDATE asignacion_pallet SET "
+        "id_ubicacion = (SELECT u.id_ubicacion FROM ubicaciones u WHERE u.id_pallet_asignado = asignacion_pallet.id_pallet), "
+        "posicion_pallet = (SELECT u.posicion_pallet FROM ubicaciones u WHERE u.id_pallet_asignado = asignacion_pallet.id_pallet) "
+        f"WHERE id_pallet IN ({_PALLETS_UNICOS}) AND EXISTS ("
+        "SELECT 1 FROM ubicaciones u WHERE u.id_pallet_asignado = asignacion_pallet.id_pallet "
+        "AND (asignacion_pallet.id_ubicacion IS NULL OR asignacion_pallet.id_ubicacion <> u.id_ubicacion "
+        "OR asignacion_pallet.posicion_pallet IS NULL OR asignacion_pallet.posicion_pallet <> u.posicion_pallet))",
+    ),
+    "asignaciones_sin_ubicacion": (
+        "asignaciones de pallets que no ocupan ninguna ubicación",
+        "SELECT COUNT(*) FROM asignacion_pallet a "
+        "WHERE NOT EXISTS (SELECT 1 FROM ubicaciones u WHERE u.id_pallet_asignado = a.id_pallet)",
+        "DELETE FROM asignacion_pallet "
+        "WHERE NOT EXISTS (SELECT 1 FROM ubicaciones u WHERE u.id_pallet_asignado = asignacion_pallet.id_pallet)",
+    ),
+    "ubicaciones_sin_asignacion": (
+        "ubicaciones ocupadas sin fila en asignacion_pallet",
+        "SELECT COUNT(*) FROM ubicaciones u WHERE u.id_pallet_asignado IS NOT NULL "
+        "AND NOT EXISTS (SELECT 1 FROM asignacion_pallet a WHERE a.id_pallet = u.id_pallet_asignado)",
+        "INSERT INTO asignacion_pallet (id_pallet, id_ubicacion, posicion_pallet) "
+        "SELECT u.id_pallet_asignado, u.id_ubicacion, u.posicion_pallet FROM ubicaciones u "
+        f"WHERE u.id_pallet_asignado IN ({_PALLETS_UNICOS}) "
+        "AND NOT EXISTS (SELECT 1 FROM asignacion_pallet a WHERE a.id_pallet = u.id_pallet_asignado)",
+    ),
+    "estados_desactualizados": (
+        "estados de ubicación desactualizados",
+        f"SELECT COUNT(*) FROM ubicaciones WHERE status_ubicacion IS NULL OR status_ubicacion <> {_ESTADO_CORRECTO}",
+        f"UPDATE ubicaciones SET status_ubicacion = {_ESTADO_CORRECTO} "
+        f"WHERE status_ubicacion IS NULL OR status_ubicacion <> {_ESTADO_CORRECTO}",
+    ),
+}
+
+# Las consultas se ejecutan por el registro de conexion_bd (contadores y disyuntor)
+conexion_bd.registrar_consultas({
+    f"{prefijo}_{nombre}": consulta
+    for nombre, (_, contar, reparacion) in CHEQUEOS.items()
+    for prefijo, consulta in (("consistencia", contar), ("consistencia_reparar", reparacion))
+    if consulta is not None
+})
+
+_ultima_revision = None
+_hilo = None
+_hilo_lock = threading.Lock()
+
+
+def revisar(conn):
+    """Cuenta las diferencias de cada chequeo. Devuelve {chequeo: cantidad} solo con las no nulas."""
+    diferencias = {}
+    for nombre in CHEQUEOS:
+        cantidad = conexion_bd.ejecutar(conn, f"consistencia_{nombre}").fetchone()[0]
+        if cantidad:
+            diferencias[nombre] = cantidad
+    return diferencias
+
+
+def reparar(conn, diferencias):
+    """
+    Aplica en una transacción las reparaciones de los chequeos con diferencias.
+    Devuelve {chequeo: filas corregidas}.
+    """
+    reparadas = {}
+    try:
+        for nombre in diferencias:
+            if CHEQUEOS[nombre][2] is None:
+                continue
+            reparadas[nombre] = conexion_bd.ejecutar(conn, f"consistencia_reparar_{nombre}").rowcount
+        conn.commit()
+    except pyodbc.Error:
+        conn.rollback()
+        raise
+    return reparadas
+
+
+def reconciliar(reparar_diferencias=REPARAR):
+    """Ejecuta una pasada completa (revisión y, si corresponde, reparación) y devuelve su informe."""
+    global _ultima_revision
+    inicio = time.monotonic()
+    conn = conexion_bd.obtener_conexion()
+    try:
+        diferencias = revisar(conn)
+        reparadas = reparar(conn, diferencias) if reparar_diferencias and diferencias else {}
+    finally:
+        conn.close()
+
+    if reparadas.get("estados_desactualizados"):
+        # El estado de las ubicaciones forma parte de los snapshots en caché
+        for tipo_almacen in cache_almacen.obtener_tipos_almacen():
+            cache_almacen.invalidar(tipo_almacen)
+
+    informe = {
+        "momento": datetime.now().isoformat(timespec="seconds"),
+        "segundos": round(time.monotonic() - inicio, 3),
+        "diferencias": diferencias,
+        "reparadas": reparadas,
+    }
+    _ultima_revision = informe
+    for nombre, cantidad in diferencias.items():
+        accion = "reparadas" if nombre in reparadas else "sin reparar"
+        print(f"Consistencia: {cantidad} {CHEQUEOS[nombre][0]} ({accion}).")
+    return informe
+
+
+def _reconciliar_periodicamente():
+    evento = threading.Event()
+    while not evento.wait(INTERVALO_REVISION):
+        try:
+            reconciliar()
+        except Exception as e:
+            print(f"Consistencia: no se pudo revisar la base: {e}")
+
+
+def iniciar():
+    """Inicia la revisión periódica en segundo plano (una sola vez por proceso)."""
+    global _hilo
+    with _hilo_lock:
+        if _hilo is not None or not HABILITADO:
+            return
+        _hilo = threading.Thread(target=_reconciliar_periodicamente, name="consistencia", daemon=True)
+        _hilo.start()
+
+
+def ultima_revision():
+    """Informe de la última pasada (None si todavía no hubo ninguna)."""
+    return _ultima_revision
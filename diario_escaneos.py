@@ -0,0 +1,352 @@
+# diario_escaneos.py
+
+"""
+Diario local de escaneos con escritura diferida (write-behind).
+
+Los ingresos y asignaciones se aceptan de inmediato escribiéndolos en un archivo
+local de solo anexado (una línea JSON por escaneo). Las escrituras se agrupan y se
+confirman con un único fsync por grupo, de modo que un escaneo aceptado sobrevive a
+una caída del proceso. Un hilo en segundo plano aplica las entradas a la base de
+datos en orden y por lotes; si la base no responde, las entradas quedan pendientes
+y se reintentan más tarde.
+
+Cada entrada lleva una clave de idempotencia "<operación>:<NPallet>": un escaneo
+repetido mientras está pendiente no se duplica, y al aplicarlo se comprueba el
+estado de la base para no repetir un ingreso o una asignación ya realizados.
+
+Configuración (variables de entorno):
+    DIARIO_ESCANEOS_RUTA   Ruta del archivo del diario. Sin ella el diario no se usa.
+    ESCRITURA_DIFERIDA     "1" para pasar siempre por el diario; de lo contrario solo
+                           se usa cuando la base de datos no está disponible.
+"""
+
+import json
+import os
+import threading
+import time
+from collections import deque
+
+import pyodbc
+
+import cache_almacen
+import conexion_bd
+
+
+TAMANO_LOTE = 50            # Entradas aplicadas por transacción
+ESPERA_FSYNC = 0.005        # Ventana (s) para agrupar escrituras en un mismo fsync
+INTERVALO_APLICACION = 1.0  # Espera (s) del aplicador cuando no hay pendientes
+ESPERA_MAXIMA_REINTENTO = 30.0
+TAMANO_MAXIMO_DIARIO = 1024 * 1024  # Bytes; al superarlo y estar todo aplicado se trunca
+
+OPERACIONES = ("ingreso", "asignacion")
+
+
+class DiarioEscaneos:
+    """Diario de solo anexado con confirmación agrupada y aplicación en segundo plano."""
+
+    def __init__(self, ruta, tamano_lote=TAMANO_LOTE, espera_fsync=ESPERA_FSYNC):
+        self.ruta = ruta
+        self.ruta_aplicado = ruta + ".aplicado"
+        self.tamano_lote = tamano_lote
+        self.espera_fsync = espera_fsync
+
+        self._lock = threading.Lock()
+        self._hay_escrituras = threading.Condition(self._lock)
+        self._durable = threading.Condition(self._lock)
+        self._hay_pendientes = threading.Condition(self._lock)
+
+        self._buffer = []
+        self._pendientes = deque()
+        self._claves_pendientes = {}
+        self.rechazados = deque(maxlen=100)
+
+        self._ultimo_aplicado = self._leer_aplicado()
+        self._recuperar()
+        self._ultimo_seq = self._pendientes[-1]["seq"] if self._pendientes else self._ultimo_aplicado
+        self._seq_durable = self._ultimo_seq
+        self._archivo = open(self.ruta, "a", encoding="utf-8")
+
+        threading.Thread(target=self._escritor, name="diario-escritor", daemon=True).start()
+        threading.Thread(target=self._aplicador, name="diario-aplicador", daemon=True).start()
+
+    # --- Registro ---
+    def registrar(self, operacion, n_pallet, datos):
+        """
+        Agrega un escaneo al diario y espera a que quede en disco.
+        Devuelve el número de secuencia asignado (el existente si ya estaba pendiente).
+        """
+        if operacion not in OPERACIONES:
+            raise ValueError(f"Operación no soportada por el diario: {operacion}")
+        clave = f"{operacion}:{n_pallet}"
+        with self._lock:
+            if clave in self._claves_pendientes:
+                return self._claves_pendientes[clave]
+            self._ultimo_seq += 1
+            seq = self._ultimo_seq
+            self._buffer.append({
+                "seq": seq,
+                "clave": clave,
+                "operacion": operacion,
+                "n_pallet": n_pallet,
+                "datos": datos,
+                "registrado": time.time(),
+            })
+            self._claves_pendientes[clave] = seq
+            self._hay_escrituras.notify()
+            while self._seq_durable < seq:
+                self._durable.wait()
+        return seq
+
+    def pendientes(self):
+        """Cantidad de escaneos aceptados que aún no se aplican en la base de datos."""
+        with self._lock:
+            return len(self._pendientes) + len(self._buffer)
+
+    def rechazos(self):
+        """Últimos escaneos aceptados que la base rechazó al aplicarlos, del más antiguo al más nuevo."""
+        return [
+            {
+                "seq": entrada["seq"],
+                "operacion": entrada.get("operacion"),
+                "n_pallet": entrada.get("n_pallet"),
+                "datos": entrada.get("datos"),
+                "registrado": entrada.get("registrado"),
+                "motivo": motivo,
+            }
+            for entrada, motivo in list(self.rechazados)
+        ]
+
+    # --- Persistencia ---
+    def _leer_aplicado(self):
+        try:
+            with open(self.ruta_aplicado, encoding="utf-8") as f:
+                return int(f.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def _guardar_aplicado(self, seq):
+        temporal = self.ruta_aplicado + ".tmp"
+        with open(temporal, "w", encoding="utf-8") as f:
+            f.write(str(seq))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporal, self.ruta_aplicado)
+
+    def _recuperar(self):
+        """Carga las entradas no aplicadas; ignora una última línea truncada por una caída."""
+        try:
+            with open(self.ruta, encoding="utf-8") as f:
+                for linea in f:
+                    try:
+                        entrada = json.loads(linea)
+                    except json.JSONDecodeError:
+                        continue
+                    if not isinstance(entrada, dict) or not isinstance(entrada.get("seq"), int):
+                        # Sin número de secuencia no se puede ordenar ni marcar como aplicada
+                        print(f"Diario de escaneos: se descarta una línea ilegible: {linea.strip()[:200]}")
+                        continue
+                    if entrada["seq"] > self._ultimo_aplicado:
+                        self._pendientes.append(entrada)
+                        if entrada.get("clave"):
+                            self._claves_pendientes[entrada["clave"]] = entrada["seq"]
+        except FileNotFoundError:
+            pass
+
+    def _escritor(self):
+        while True:
+            with self._lock:
+                while not self._buffer:
+                    # Solo el escritor trunca el archivo, y nunca con un grupo a medio escribir
+                    self._compactar()
+                    self._hay_escrituras.wait(INTERVALO_APLICACION)
+            # Dejar que se acumulen más escaneos en el mismo fsync
+            time.sleep(self.espera_fsync)
+            with self._lock:
+                grupo, self._buffer = self._buffer, []
+            self._archivo.write("".join(json.dumps(entrada) + "\n" for entrada in grupo))
+            self._archivo.flush()
+            os.fsync(self._archivo.fileno())
+            with self._lock:
+                self._seq_durable = grupo[-1]["seq"]
+                self._pendientes.extend(grupo)
+                self._durable.notify_all()
+                self._hay_pendientes.notify()
+
+    # --- Aplicación en la base de datos ---
+    def _aplicador(self):
+        espera = INTERVALO_APLICACION
+        tamano = self.tamano_lote
+        while True:
+            with self._lock:
+                if not self._pendientes:
+                    self._hay_pendientes.wait(INTERVALO_APLICACION)
+                lote = list(self._pendientes)[:tamano]
+            if not lote:
+                continue
+            try:
+                resultados = aplicar_lote(lote)
+            except pyodbc.Error as e:
+                if conexion_bd._es_conflicto(e) or conexion_bd._es_error_conexion(e):
+                    self._esperar_reintento(espera, e)
+                    espera = min(espera * 2, ESPERA_MAXIMA_REINTENTO)
+                    continue
+                if len(lote) > 1:
+                    # Aislar la entrada que falla aplicando de a una
+                    tamano = 1
+                    continue
+                resultados = [f"Error al aplicar el escaneo: {e}"]
+            except Exception as e:
+                # Sin base, o un error inesperado: el hilo no debe terminar, se reintenta
+                self._esperar_reintento(espera, e)
+                espera = min(espera * 2, ESPERA_MAXIMA_REINTENTO)
+                continue
+            espera = INTERVALO_APLICACION
+            tamano = self.tamano_lote
+
+            for entrada, resultado in zip(lote, resultados):
+                if resultado.startswith("Error"):
+                    self.rechazados.append((entrada, resultado))
+                    print(f"Diario de escaneos: {entrada.get('clave')} rechazado: {resultado}")
+                elif entrada["operacion"] == "asignacion":
+                    cache_almacen.invalidar(entrada["datos"]["tipo_almacen"])
+            self._guardar_aplicado(lote[-1]["seq"])
+            with self._lock:
+                for entrada in lote:
+                    self._pendientes.popleft()
+                    if self._claves_pendientes.get(entrada.get("clave")) == entrada["seq"]:
+                        del self._claves_pendientes[entrada["clave"]]
+
+    @staticmethod
+    def _esperar_reintento(espera, error):
+        print(f"Diario de escaneos: no se pudo aplicar el lote, se reintentará en {espera:.0f} s: {error!r}")
+        time.sleep(espera)
+
+    def _compactar(self):
+        """
+        Trunca el diario cuando todo está aplicado y el archivo creció demasiado. Se
+        llama desde el escritor, con el lock tomado, entre dos grupos.
+        """
+        if self._pendientes or self._buffer or self._archivo.tell() < TAMANO_MAXIMO_DIARIO:
+            return
+        self._archivo.truncate(0)
+        self._archivo.seek(0)
+        os.fsync(self._archivo.fileno())
+
+
+def aplicar_lote(lote):
+    """
+    Aplica un lote de entradas del diario en orden.
+
+    Cada operación es idempotente respecto del estado de la base: un ingreso de un
+    NPallet existente o una asignación de un pallet que ya tiene ubicación se dan por
+    aplicados. Los ingresos consecutivos se insertan en un solo envío y en una misma
+    transacción; cada asignación se confirma en la suya, por el mismo camino que
+    conexion_bd.asignar_ubicacion (lugar en el carril, versión y reintentos). Devuelve
+    un mensaje por entrada; los que empiezan con "Error" son rechazos de negocio (o
+    entradas ilegibles) que no se reintentan.
+    """
+    conn = conexion_bd.obtener_conexion()
+    try:
+        resultados = []
+        ingresos = []
+        for entrada in lote + [None]:
+            motivo = None if entrada is None else _motivo_entrada_invalida(entrada)
+            if motivo is None and entrada is not None and entrada["operacion"] == "ingreso":
+                ingresos.append(entrada)
+                continue
+            if ingresos:
+                resultados.extend(_aplicar_ingresos(conn, ingresos))
+                ingresos = []
+            if entrada is None:
+                break
+            if motivo is not None:
+                resultados.append(f"Error: Entrada del diario inválida ({motivo}).")
+                continue
+            # Confirmar lo anterior: un conflicto en la asignación revierte su transacción
+            conn.commit()
+            resultados.append(_aplicar_asignacion(conn, entrada))
+        conn.commit()
+        return resultados
+    except pyodbc.Error:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def _motivo_entrada_invalida(entrada):
+    """Motivo por el que una entrada del diario no se puede aplicar, o None si es válida."""
+    campos = {"ingreso": ("qr",), "asignacion": ("tipo_almacen", "piso", "rack", "letra")}
+    if not isinstance(entrada.get("datos"), dict) or not entrada.get("n_pallet"):
+        return "faltan el NPallet o los datos"
+    if entrada.get("operacion") not in campos:
+        return f"operación desconocida {entrada.get('operacion')!r}"
+    faltan = [campo for campo in campos[entrada["operacion"]] if entrada["datos"].get(campo) in (None, "")]
+    if faltan:
+        return f"faltan {', '.join(faltan)}"
+    return None
+
+
+def _aplicar_asignacion(conn, entrada):
+    """Aplica una asignación del diario con conexion_bd.asignar_ubicacion sobre `conn`."""
+    n_pallet = entrada["n_pallet"]
+    datos = entrada["datos"]
+    fila = conexion_bd.ejecutar(conn, "id_pallet_por_npallet", (n_pallet,)).fetchone()
+    if fila is None:
+        return f"Error: El NPallet '{n_pallet}' no existe en la base de datos."
+    id_pallet = fila[0]
+    if conexion_bd.ejecutar(conn, "ubicacion_de_pallet", (id_pallet,)).fetchone() is not None:
+        return f"NPallet {n_pallet} ya estaba asignado."
+
+    mensaje = conexion_bd.asignar_ubicacion(
+        id_pallet, datos["tipo_almacen"], datos["piso"], datos["rack"], datos["letra"], conexion=conn
+    )
+    if mensaje.startswith("Error"):
+        return mensaje
+    return (
+        f"NPallet {n_pallet} asignado a {datos['tipo_almacen']}, {datos['piso']}, "
+        f"{datos['rack']}, {datos['letra']}."
+    )
+
+
+def _aplicar_ingresos(conn, ingresos):
+    """
+    Inserta una serie de ingresos consecutivos: una sola consulta para saber cuáles
+    NPallet ya existen y un solo envío (fast_executemany) para insertar el resto.
+    """
+    n_pallets = list({entrada["n_pallet"] for entrada in ingresos})
+    existentes = {fila[0] for fila in conexion_bd.ejecutar(conn, "npallets_existentes", n_pallets).fetchall()}
+
+    resultados = []
+    filas = []
+    for entrada in ingresos:
+        n_pallet = entrada["n_pallet"]
+        if n_pallet in existentes:
+            resultados.append(f"NPallet {n_pallet} ya estaba ingresado.")
+            continue
+        existentes.add(n_pallet)
+        filas.append((entrada["datos"]["qr"],))
+        resultados.append(f"NPallet {n_pallet} ingresado.")
+    conexion_bd.ejecutar_lote(conn, "insertar_pallet_qr", filas)
+    return resultados
+
+
+_diario = None
+_diario_lock = threading.Lock()
+
+
+def obtener_diario():
+    """Devuelve el diario configurado en DIARIO_ESCANEOS_RUTA, o None si no está habilitado."""
+    global _diario
+    ruta = os.environ.get("DIARIO_ESCANEOS_RUTA")
+    if not ruta:
+        return None
+    with _diario_lock:
+        if _diario is None:
+            _diario = DiarioEscaneos(ruta)
+    return _diario
+
+
+def escritura_diferida():
+    """Indica si los escaneos deben pasar siempre por el diario."""
+    return os.environ.get("ESCRITURA_DIFERIDA") == "1" and obtener_diario() is not None
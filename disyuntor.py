@@ -0,0 +1,119 @@
+# disyuntor.py
+
+"""
+Disyuntor (circuit breaker) de la capa de datos.
+
+Cuando Azure SQL está lenta o caída, cada callback fallaba tras esperar el tiempo de
+conexión, y cada navegador volvía a intentarlo en su siguiente intervalo, sumando
+carga a una base que ya no respondía. El disyuntor cuenta las fallas seguidas (de
+conexión, por tiempo agotado o por consultas más lentas que LENTITUD_MAXIMA); al
+llegar a FALLAS_PARA_ABRIR se abre y las peticiones fallan de inmediato con
+CircuitoAbierto, sin tocar la base. Mientras está abierto, un único hilo de sondeo
+prueba la base con espera creciente y lo cierra cuando responde.
+
+Las lecturas en caché (cache_almacen.py) atrapan CircuitoAbierto y sirven la última
+lectura buena marcada como desactualizada.
+
+Variables de entorno: DISYUNTOR=0 lo desactiva, DISYUNTOR_FALLAS, DISYUNTOR_LENTITUD
+y DISYUNTOR_ESPERA cambian el umbral de fallas, la lentitud máxima y la espera del
+primer sondeo.
+"""
+
+import os
+import threading
+import time
+from datetime import datetime
+
+
+HABILITADO = os.environ.get("DISYUNTOR", "1") != "0"
+FALLAS_PARA_ABRIR = int(os.environ.get("DISYUNTOR_FALLAS", "3"))
+LENTITUD_MAXIMA = float(os.environ.get("DISYUNTOR_LENTITUD", "5"))     # Segundos por consulta
+ESPERA_SONDEO = float(os.environ.get("DISYUNTOR_ESPERA", "5"))          # Segundos hasta el primer sondeo
+ESPERA_MAXIMA_SONDEO = 60.0
+
+
+class CircuitoAbierto(ConnectionError):
+    """La base se considera no disponible; se reintentará desde el sondeo en segundo plano."""
+
+
+class Disyuntor:
+    """
+    Disyuntor con dos estados, "cerrado" y "abierto". `sondear` es una función sin
+    argumentos que prueba la base y lanza una excepción si no responde.
+    """
+
+    def __init__(self, sondear, fallas_para_abrir=FALLAS_PARA_ABRIR, espera=ESPERA_SONDEO):
+        self._sondear = sondear
+        self._fallas_para_abrir = fallas_para_abrir
+        self._espera = espera
+        self._lock = threading.Lock()
+        self._abierto = False
+        self._fallas = 0
+        self._abierto_desde = None
+        self._ultimo_error = None
+        self._sondeos = 0
+        self._hilo = None
+
+    @property
+    def abierto(self):
+        return self._abierto
+
+    def verificar(self):
+        """Lanza CircuitoAbierto si el disyuntor está abierto."""
+        if self._abierto:
+            raise CircuitoAbierto(
+                f"Base de datos no disponible desde las {self._abierto_desde:%H:%M:%S} "
+                f"({self._ultimo_error}); se reintentará automáticamente."
+            )
+
+    def registrar_exito(self):
+        if self._fallas:
+            with self._lock:
+                self._fallas = 0
+
+    def registrar_falla(self, error):
+        """Cuenta una falla; al llegar al umbral abre el disyuntor e inicia el sondeo."""
+        if not HABILITADO:
+            return
+        with self._lock:
+            self._fallas += 1
+            self._ultimo_error = str(error)
+            if self._abierto or self._fallas < self._fallas_para_abrir:
+                return
+            self._abierto = True
+            self._abierto_desde = datetime.now()
+            self._sondeos = 0
+            self._hilo = threading.Thread(target=self._sondear_hasta_cerrar, name="disyuntor", daemon=True)
+            self._hilo.start()
+        print(f"Disyuntor abierto tras {self._fallas} fallas seguidas: {error}")
+
+    def _sondear_hasta_cerrar(self):
+        espera = self._espera
+        while True:
+            time.sleep(espera)
+            self._sondeos += 1
+            inicio = time.monotonic()
+            try:
+                self._sondear()
+            except Exception as e:
+                self._ultimo_error = str(e)
+            else:
+                if time.monotonic() - inicio < LENTITUD_MAXIMA:
+                    break
+                self._ultimo_error = "la base responde con lentitud"
+            espera = min(espera * 2, ESPERA_MAXIMA_SONDEO)
+        with self._lock:
+            self._abierto = False
+            self._fallas = 0
+            self._hilo = None
+        print(f"Disyuntor cerrado: la base respondió tras {self._sondeos} sondeos.")
+
+    def estado(self):
+        """Estado actual, para la ruta de métricas."""
+        return {
+            "estado": "abierto" if self._abierto else "cerrado",
+            "fallas_seguidas": self._fallas,
+            "abierto_desde": self._abierto_desde.isoformat(timespec="seconds") if self._abierto else None,
+            "ultimo_error": self._ultimo_error,
+            "sondeos": self._sondeos,
+        }
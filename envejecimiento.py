@@ -0,0 +1,76 @@
+# envejecimiento.py
+
+"""
+Envejecimiento de los pallets (días desde la Fecha de Faena) para despachar por FEFO.
+
+Todos los cálculos se hacen por columnas sobre el DataFrame de posiciones (el mismo
+que arma APP.py a partir del snapshot), sin recorrer las filas, de modo que se
+mantienen en milisegundos con decenas de miles de posiciones.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+# Rangos de antigüedad en días (desde, hasta, color), de menor a mayor
+RANGOS_DIAS = [
+    (0, 7, "#2e7d32"),
+    (7, 14, "#f9a825"),
+    (14, 21, "#ef6c00"),
+    (21, None, "#c62828"),
+]
+COLOR_LIBRE = "#e0e0e0"
+
+
+def dias_desde_faena(fechas, hoy=None):
+    """
+    Convierte una serie de fechas de faena (date, datetime o texto como "20240101")
+    en días transcurridos hasta `hoy`. Las posiciones libres o con fechas inválidas
+    quedan en NaN.
+    """
+    hoy = pd.Timestamp(hoy if hoy is not None else pd.Timestamp.today()).normalize()
+    fechas = pd.to_datetime(fechas, errors="coerce")
+    return (hoy - fechas).dt.days.astype("float64")
+
+
+def calcular_envejecimiento(df_posiciones, hoy=None):
+    """Agrega al DataFrame de posiciones la columna "Días" (NaN si la posición está libre)."""
+    df = df_posiciones.copy()
+    df["Días"] = dias_desde_faena(df["Fecha Faena"], hoy)
+    df.loc[df["NPallet"].isna() | (df["NPallet"] == "Libre"), "Días"] = np.nan
+    return df
+
+
+def matrices_envejecimiento(df):
+    """
+    Matrices (piso, posición) x letra con los días de cada posición, una por rack de
+    una cámara. Se arman con un único unstack para toda la cámara.
+    """
+    if df["Tipo Almacén"].nunique() > 1:
+        raise ValueError("matrices_envejecimiento recibe las posiciones de una sola cámara")
+    dias = (
+        df.groupby(["Rack", "Piso", "Posición Pallet", "Letra"], sort=False)["Días"]
+        .first()
+        .unstack("Letra")
+        .sort_index(ascending=[True, False, False])
+    )
+    return {
+        rack: matriz.droplevel("Rack")
+        for rack, matriz in dias.groupby(level="Rack", sort=False)
+    }
+
+
+def resumen_envejecimiento(df):
+    """
+    Resumen por rack, piso y Variedad de los pallets ocupados: cantidad, antigüedad
+    promedio y máxima. Ordenado de mayor a menor antigüedad para despachar primero.
+    """
+    ocupados = df[df["Días"].notna()]
+    resumen = (
+        ocupados.groupby(["Rack", "Piso", "Variedad"], dropna=False)["Días"]
+        .agg(Pallets="size", Promedio="mean", Máximo="max")
+        .reset_index()
+        .sort_values("Máximo", ascending=False)
+    )
+    resumen["Promedio"] = resumen["Promedio"].round(1)
+    return resumen
@@ -0,0 +1,68 @@
+# indice_busqueda.py
+
+"""
+Búsqueda incremental para los filtros de la página de visualización.
+
+En lugar de enviar al navegador la lista completa de NPallet, Variedades, Mercados y
+Fechas de Faena, cada dropdown pide sugerencias a medida que se escribe. Las
+sugerencias salen de un índice de prefijos en memoria (listas ordenadas y búsqueda
+binaria) construido a partir del snapshot de posiciones de cada cámara; el índice
+se reconstruye solo cuando cambia la huella del snapshot.
+"""
+
+import bisect
+
+import cache_almacen
+from conexion_bd import COLUMNAS_POSICIONES
+
+
+LIMITE_SUGERENCIAS = 20  # Coincidencias devueltas por cada pulsación
+
+# Campo del filtro -> índice de su columna en conexion_bd.obtener_todas_las_posiciones
+CAMPOS = {
+    campo: COLUMNAS_POSICIONES.index(campo)
+    for campo in ("Variedad", "Mercado", "Fecha Faena", "NPallet")
+}
+
+_indices = {}  # tipo_almacen -> (huella, {campo: IndicePrefijos})
+
+
+class IndicePrefijos:
+    """Valores únicos ordenados sin distinguir mayúsculas, para buscar por prefijo."""
+
+    def __init__(self, valores):
+        unicos = {str(valor) for valor in valores if valor is not None}
+        ordenados = sorted((valor.casefold(), valor) for valor in unicos)
+        self._claves = [clave for clave, _ in ordenados]
+        self._valores = [valor for _, valor in ordenados]
+
+    def buscar(self, prefijo, limite=LIMITE_SUGERENCIAS):
+        """Devuelve hasta `limite` valores que comienzan con `prefijo`, en orden alfabético."""
+        prefijo = (prefijo or "").casefold()
+        inicio = bisect.bisect_left(self._claves, prefijo)
+        resultado = []
+        for indice in range(inicio, min(inicio + limite, len(self._claves))):
+            if not self._claves[indice].startswith(prefijo):
+                break
+            resultado.append(self._valores[indice])
+        return resultado
+
+
+def construir_indices(posiciones):
+    """Construye un índice por campo con los valores de las posiciones ocupadas (LecturaColumnar)."""
+    ocupadas = [i for i, n_pallet in enumerate(posiciones.columna(CAMPOS["NPallet"])) if n_pallet is not None]
+    indices = {}
+    for campo, columna in CAMPOS.items():
+        valores = posiciones.columna(columna)
+        indices[campo] = IndicePrefijos(valores[i] for i in ocupadas)
+    return indices
+
+
+def buscar(tipo_almacen, campo, prefijo, limite=LIMITE_SUGERENCIAS):
+    """Sugerencias para el filtro `campo` de una cámara que comienzan con `prefijo`."""
+    posiciones, huella = cache_almacen.obtener_snapshot(tipo_almacen)
+    entrada = _indices.get(tipo_almacen)
+    if entrada is None or entrada[0] != huella:
+        entrada = (huella, construir_indices(posiciones))
+        _indices[tipo_almacen] = entrada
+    return entrada[1][campo].buscar(prefijo, limite)
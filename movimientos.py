@@ -0,0 +1,213 @@
+# movimientos.py
+
+"""
+Registro de movimientos de pallets (solo anexado).
+
+Cada asignación, liberación y avance de posición dentro de un carril se agrega a la
+tabla movimientos_pallet. Las operaciones solo encolan el movimiento en memoria; un
+hilo en segundo plano los inserta por lotes (fast_executemany), fuera del camino
+crítico del escaneo. Si la base no responde, los movimientos quedan en cola y se
+reintentan; los que estén en cola al caerse el proceso se pierden.
+
+La tabla tiene índices por NPallet y por ubicación y fecha, de modo que el historial
+de un pallet y los movimientos del día de un rack se leen sin recorrer el registro.
+"""
+
+import atexit
+import itertools
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+
+import pyodbc
+
+import conexion_bd
+
+
+TAMANO_LOTE = 200             # Movimientos insertados por transacción
+INTERVALO_ESCRITURA = 1.0     # Espera (s) máxima antes de escribir un lote incompleto
+ESPERA_MAXIMA_REINTENTO = 30.0
+MAXIMO_PENDIENTES = 50_000    # Al superarse se descartan los más antiguos
+
+# Tabla e índices en SQL Server. crear_tabla_movimientos la crea si no existe; se llama
+# al calentar cada instancia (calentamiento.py).
+ESQUEMA_SQL_SERVER = """
+IF OBJECT_ID('movimientos_pallet') IS NULL
+BEGIN
+    CREATE TABLE movimientos_pallet (
+        id_movimiento BIGINT IDENTITY PRIMARY KEY,
+        momento DATETIME2 NOT NULL,
+        operacion VARCHAR(20) NOT NULL,
+        id_pallet INT NOT NULL,
+        NPallet VARCHAR(20),
+        tipo_almacen VARCHAR(50),
+        piso INT,
+        rack INT,
+        letra VARCHAR(5),
+        posicion_anterior INT,
+        posicion_pallet INT
+    );
+    CREATE INDEX ix_movimientos_npallet ON movimientos_pallet (NPallet, momento);
+    CREATE INDEX ix_movimientos_ubicacion ON movimientos_pallet (tipo_almacen, rack, momento);
+END
+"""
+
+
+class RegistroMovimientos:
+    """Cola en memoria de movimientos con escritura por lotes en segundo plano."""
+
+    def __init__(self, tamano_lote=TAMANO_LOTE, intervalo=INTERVALO_ESCRITURA):
+        self.tamano_lote = tamano_lote
+        self.intervalo = intervalo
+        self._lock = threading.Lock()
+        self._hay_movimientos = threading.Condition(self._lock)
+        self._pendientes = deque()   # (secuencia, fila)
+        self._secuencia = itertools.count(1)
+        self._escribiendo = threading.Lock()
+        self.descartados = 0
+        threading.Thread(target=self._escritor, name="movimientos-escritor", daemon=True).start()
+
+    def registrar(self, operacion, id_pallet, tipo_almacen, piso, rack, letra,
+                  posicion_pallet=None, posicion_anterior=None):
+        """Encola un movimiento con la hora actual. No accede a la base de datos."""
+        fila = (
+            datetime.now(), operacion, id_pallet, tipo_almacen, piso, rack, letra,
+            posicion_anterior, posicion_pallet, id_pallet,
+        )
+        with self._lock:
+            if len(self._pendientes) >= MAXIMO_PENDIENTES:
+                self._pendientes.popleft()
+                self.descartados += 1
+            self._pendientes.append((next(self._secuencia), fila))
+            if len(self._pendientes) >= self.tamano_lote:
+                self._hay_movimientos.notify()
+
+    def pendientes(self):
+        """Cantidad de movimientos en cola sin escribir."""
+        with self._lock:
+            return len(self._pendientes)
+
+    def vaciar(self):
+        """Escribe ya todos los movimientos en cola. Devuelve False si la base falló."""
+        while self.pendientes():
+            if not self._escribir_lote():
+                return False
+        return True
+
+    def _escritor(self):
+        espera = self.intervalo
+        while True:
+            with self._lock:
+                if len(self._pendientes) < self.tamano_lote:
+                    self._hay_movimientos.wait(self.intervalo)
+            if not self.pendientes():
+                continue
+            if self._escribir_lote():
+                espera = self.intervalo
+            else:
+                # Con la base caída la cola suele estar llena: esperar igual antes de reintentar
+                time.sleep(espera)
+                espera = min(espera * 2, ESPERA_MAXIMA_REINTENTO)
+
+    def _escribir_lote(self):
+        with self._escribiendo:
+            with self._lock:
+                lote = list(itertools.islice(self._pendientes, self.tamano_lote))
+            if not lote:
+                return True
+            try:
+                conn = conexion_bd.obtener_conexion()
+                try:
+                    conexion_bd.ejecutar_lote(conn, "insertar_movimiento", [fila for _, fila in lote])
+                    conn.commit()
+                finally:
+                    conn.close()
+            except (ConnectionError, pyodbc.Error) as e:
+                print(f"Registro de movimientos: no se pudo escribir el lote, se reintentará: {e}")
+                return False
+            with self._lock:
+                # Quitar lo escrito (los descartes por cola llena pudieron adelantarse)
+                ultima = lote[-1][0]
+                while self._pendientes and self._pendientes[0][0] <= ultima:
+                    self._pendientes.popleft()
+            return True
+
+
+_registro = None
+_registro_lock = threading.Lock()
+
+
+def obtener_registro():
+    """Devuelve el registro de movimientos del proceso (lo crea al primer uso)."""
+    global _registro
+    with _registro_lock:
+        if _registro is None:
+            _registro = RegistroMovimientos()
+            atexit.register(_registro.vaciar)
+    return _registro
+
+
+_suscriptores = []
+
+
+def suscribir(funcion):
+    """
+    Registra funcion(operacion, tipo_almacen, piso, rack) para que se llame con cada
+    movimiento registrado, en el mismo hilo que lo registra.
+    """
+    _suscriptores.append(funcion)
+
+
+def registrar(operacion, id_pallet, tipo_almacen, piso, rack, letra, **kwargs):
+    """Encola un movimiento (ver RegistroMovimientos.registrar) y avisa a los suscriptores."""
+    obtener_registro().registrar(operacion, id_pallet, tipo_almacen, piso, rack, letra, **kwargs)
+    for funcion in _suscriptores:
+        funcion(operacion, tipo_almacen, piso, rack)
+
+
+def crear_tabla_movimientos():
+    """Crea movimientos_pallet y sus índices en SQL Server si aún no existen."""
+    conn = conexion_bd.conectar_bd()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(ESQUEMA_SQL_SERVER)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def historial_pallet(n_pallet):
+    """Movimientos de un pallet, del más antiguo al más reciente."""
+    conn = conexion_bd.obtener_conexion(lectura=True)
+    try:
+        return conexion_bd.ejecutar(conn, "historial_pallet", (n_pallet,)).fetchall()
+    finally:
+        conn.close()
+
+
+def movimientos_rack_dia(tipo_almacen, rack, dia):
+    """Movimientos de un rack durante un día (date), en orden cronológico."""
+    desde = datetime(dia.year, dia.month, dia.day)
+    conn = conexion_bd.obtener_conexion(lectura=True)
+    try:
+        return conexion_bd.ejecutar(
+            conn, "movimientos_rack_dia", (tipo_almacen, rack, desde, desde + timedelta(days=1))
+        ).fetchall()
+    finally:
+        conn.close()
+
+
+def entradas_salidas_desde(tipo_almacen, desde):
+    """
+    Asignaciones y liberaciones de una cámara (o de todas) desde `desde`, como
+    LecturaColumnar con las columnas momento, operacion y rack.
+    """
+    tipo_almacen = tipo_almacen or None
+    conn = conexion_bd.obtener_conexion(lectura=True)
+    try:
+        return conexion_bd.leer_por_columnas(
+            conexion_bd.ejecutar(conn, "entradas_salidas_desde", (tipo_almacen, tipo_almacen, desde))
+        )
+    finally:
+        conn.close()
@@ -0,0 +1,135 @@
+# ocupacion.py
+
+"""
+Contadores de ocupación por cámara (tipo_almacen), rack y piso.
+
+Se cargan con una consulta agregada sobre ubicaciones y luego se mantienen en
+memoria: cada asignación suma uno y cada liberación resta uno (se suscriben al
+registro de movimientos), de modo que la utilización y los espacios disponibles se
+leen sin recorrer las posiciones. Un hilo en segundo plano los recalcula contra la
+base cada INTERVALO_RECONCILIACION segundos para corregir cualquier desvío (por
+ejemplo, movimientos hechos por otra instancia de la aplicación).
+"""
+
+import threading
+
+import pyodbc
+
+import conexion_bd
+import movimientos
+
+
+INTERVALO_RECONCILIACION = 60.0
+
+# Variación de ocupados por tipo de movimiento
+VARIACIONES = {"asignacion": 1, "liberacion": -1}
+
+_lock = threading.Lock()
+_contadores = None   # (tipo_almacen, rack, piso) -> [ocupados, total]
+_reconciliador = None
+
+
+def _clave(tipo_almacen, rack, piso):
+    try:
+        return tipo_almacen, int(rack), int(piso)
+    except (TypeError, ValueError):
+        return tipo_almacen, rack, piso
+
+
+def reconciliar():
+    """
+    Recalcula todos los contadores desde la base de datos (base principal). Los
+    errores del driver (por ejemplo, un tiempo agotado) se informan como
+    ConnectionError, igual que una base no disponible.
+    """
+    global _contadores
+    conn = conexion_bd.obtener_conexion()
+    try:
+        filas = conexion_bd.ejecutar(conn, "ocupacion").fetchall()
+    except pyodbc.Error as e:
+        raise ConnectionError(f"No se pudieron leer los contadores de ocupación: {e}") from e
+    finally:
+        conn.close()
+    nuevos = {
+        _clave(tipo, rack, piso): [int(ocupados or 0), int(total)]
+        for tipo, rack, piso, total, ocupados in filas
+    }
+    with _lock:
+        _contadores = nuevos
+
+
+def _asegurar_cargados():
+    global _reconciliador
+    if _contadores is not None:
+        return
+    reconciliar()
+    with _lock:
+        if _reconciliador is None:
+            _reconciliador = threading.Thread(target=_reconciliar_periodicamente, name="ocupacion", daemon=True)
+            _reconciliador.start()
+
+
+def _reconciliar_periodicamente():
+    evento = threading.Event()
+    while not evento.wait(INTERVALO_RECONCILIACION):
+        try:
+            reconciliar()
+        except Exception as e:
+            print(f"Contadores de ocupación: no se pudo reconciliar: {e}")
+
+
+def _al_moverse(operacion, tipo_almacen, piso, rack):
+    variacion = VARIACIONES.get(operacion)
+    if not variacion:
+        return
+    with _lock:
+        if _contadores is None:
+            return
+        contador = _contadores.get(_clave(tipo_almacen, rack, piso))
+        if contador is not None:
+            contador[0] = min(max(contador[0] + variacion, 0), contador[1])
+
+
+movimientos.suscribir(_al_moverse)
+
+
+def ocupacion(tipo_almacen=None, rack=None, piso=None):
+    """
+    Devuelve (ocupados, total) sumando los contadores que coinciden con los filtros
+    indicados (None = todos).
+    """
+    _asegurar_cargados()
+    ocupados = total = 0
+    with _lock:
+        for (tipo, r, p), (o, t) in _contadores.items():
+            if (
+                (tipo_almacen is None or tipo == tipo_almacen)
+                and (rack is None or r == rack)
+                and (piso is None or p == piso)
+            ):
+                ocupados += o
+                total += t
+    return ocupados, total
+
+
+def ocupacion_por_rack(tipo_almacen=None):
+    """Devuelve {rack: (ocupados, total)} de una cámara (None = todas)."""
+    _asegurar_cargados()
+    racks = {}
+    with _lock:
+        for (tipo, rack, _), (o, t) in _contadores.items():
+            if tipo_almacen is None or tipo == tipo_almacen:
+                ocupados, total = racks.get(rack, (0, 0))
+                racks[rack] = (ocupados + o, total + t)
+    return racks
+
+
+def formatear_utilizacion(ocupados, total):
+    """Devuelve (texto de utilización "12.50%", espacios disponibles) de unos conteos."""
+    texto = f"{(ocupados / total * 100):.2f}%" if total > 0 else "0.00%"
+    return texto, total - ocupados
+
+
+def utilizacion(tipo_almacen=None, rack=None, piso=None):
+    """Devuelve (texto de utilización "12.50%", espacios disponibles)."""
+    return formatear_utilizacion(*ocupacion(tipo_almacen, rack, piso))
@@ -0,0 +1,316 @@
+# operaciones.py
+
+"""
+Operaciones de escaneo: ingreso, asignación y liberación de pallets.
+
+Es el núcleo común de las páginas de Dash y de la API JSON para escáneres. Cada
+operación recibe los datos tal como llegan del escáner y devuelve un resultado
+estructurado: un diccionario con "estado" ("ok", "pendiente" si quedó en el diario
+de escaneos, o "error"), "mensaje" y los datos de la operación. Cada interfaz decide
+cómo mostrarlo (dbc.Alert en las páginas, JSON en la API). Los errores por falta de
+conexión a la base llevan además "sin_conexion": True.
+
+Los escáneres suelen enviar dos veces el mismo código. Dentro de una misma sesión
+(el navegador o el escáner que envía la operación), una operación repetida sobre el
+mismo NPallet durante VENTANA_DUPLICADOS segundos no vuelve a la base: espera y
+devuelve el resultado de la primera, marcado con "duplicado": True. Sin sesión
+conocida no se deduplica.
+
+liberar_lote libera varios pallets en una sola transacción y devuelve además el
+resultado de cada uno en "pallets".
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+import pyodbc
+
+import cache_almacen
+import conexion_bd
+import diario_escaneos
+
+
+VENTANA_DUPLICADOS = 2.0   # Segundos durante los que un escaneo repetido reutiliza el resultado
+ESPERA_DUPLICADO = 30.0    # Espera máxima (s) de un duplicado por el resultado de la primera
+MAXIMO_LOTE_LIBERACION = 200   # Pallets por liberación en lote (un camión completo)
+
+
+class Deduplicador:
+    """Colapsa en memoria las operaciones repetidas (sesión, operación, NPallet)."""
+
+    def __init__(self, ventana=VENTANA_DUPLICADOS):
+        self.ventana = ventana
+        self._lock = threading.Lock()
+        self._entradas = OrderedDict()   # clave -> {"listo": Event, "resultado", "fin"}
+
+    def ejecutar(self, clave, funcion):
+        """Ejecuta funcion() una sola vez por clave dentro de la ventana y devuelve su resultado."""
+        ahora = time.monotonic()
+        with self._lock:
+            self._purgar(ahora)
+            entrada = self._entradas.get(clave)
+            if entrada is not None and entrada["fin"] is not None and ahora - entrada["fin"] >= self.ventana:
+                # Vencida: _purgar no llega a ella si delante queda una operación en curso
+                del self._entradas[clave]
+                entrada = None
+            propia = entrada is None
+            if propia:
+                entrada = self._entradas[clave] = {"listo": threading.Event(), "resultado": None, "fin": None}
+
+        if not propia:
+            entrada["listo"].wait(ESPERA_DUPLICADO)
+            if entrada["resultado"] is not None:
+                return dict(entrada["resultado"], duplicado=True)
+            # La primera falló o no terminó a tiempo: se ejecuta normalmente
+            return funcion()
+
+        try:
+            entrada["resultado"] = funcion()
+            return entrada["resultado"]
+        finally:
+            with self._lock:
+                if entrada["resultado"] is None:
+                    self._entradas.pop(clave, None)
+                entrada["fin"] = time.monotonic()
+            entrada["listo"].set()
+
+    def _purgar(self, ahora):
+        # Las entradas están en orden de llegada; se quitan las vencidas del frente
+        while self._entradas:
+            clave, entrada = next(iter(self._entradas.items()))
+            if entrada["fin"] is None or ahora - entrada["fin"] < self.ventana:
+                return
+            del self._entradas[clave]
+
+
+_deduplicador = Deduplicador()
+
+
+def _sin_duplicados(sesion, operacion, n_pallet, funcion):
+    """Pasa la operación por el deduplicador si se conocen la sesión y el NPallet."""
+    if sesion is None or not n_pallet:
+        return funcion()
+    return _deduplicador.ejecutar((sesion, operacion, n_pallet), funcion)
+
+
+def _clave_pallet(datos):
+    """NPallet (último campo) de los datos escaneados, sin validar, para deduplicar."""
+    if not isinstance(datos, str) or not datos.strip():
+        return None
+    return datos.split(",")[-1].strip()
+
+
+def resultado(estado, mensaje, **datos):
+    """Arma el resultado de una operación."""
+    return {"estado": estado, "mensaje": mensaje, **datos}
+
+
+def extraer_n_pallet(pallet_data):
+    """Extrae el NPallet (último campo) de los datos escaneados y lo valida."""
+    n_pallet = pallet_data.split(",")[-1].strip()
+    if len(n_pallet) != 8 or not n_pallet.isdigit():
+        raise ValueError("El NPallet extraído no es válido.")
+    return n_pallet
+
+
+def registrar_en_diario(diario, operacion, n_pallet, datos):
+    """Registra un escaneo en el diario local para aplicarlo en segundo plano."""
+    diario.registrar(operacion, n_pallet, datos)
+    return resultado(
+        "pendiente",
+        f"NPallet {n_pallet} recibido ({operacion}). Se registrará en la base de datos en segundo plano "
+        f"({diario.pendientes()} escaneos pendientes).",
+        n_pallet=n_pallet,
+    )
+
+
+def ingresar(qr_data, sesion=None):
+    """
+    Ingresa un pallet a partir de los datos de su QR.
+
+    Con el diario de escaneos habilitado, el ingreso se acepta en el diario local
+    (siempre, o solo cuando la base de datos no está disponible).
+    """
+    return _sin_duplicados(sesion, "ingreso", _clave_pallet(qr_data), lambda: _ingresar(qr_data))
+
+
+def _ingresar(qr_data):
+    if not qr_data:
+        return resultado("error", "Error: No se recibieron los datos del QR.")
+
+    diario = diario_escaneos.obtener_diario()
+    if diario is not None:
+        n_pallet, error = conexion_bd.validar_qr(qr_data)
+        if error:
+            return resultado("error", error)
+        if diario_escaneos.escritura_diferida():
+            return registrar_en_diario(diario, "ingreso", n_pallet, {"qr": qr_data})
+
+    try:
+        res = conexion_bd.ingresar_pallet(qr_data)
+    except ConnectionError as e:
+        res = resultado("error", str(e), sin_conexion=True)
+    if res.get("sin_conexion") and diario is not None:
+        return registrar_en_diario(diario, "ingreso", n_pallet, {"qr": qr_data})
+    return res
+
+
+def asignar(tipo_almacen, piso, rack, letra, pallet_data, sesion=None):
+    """Asigna el pallet escaneado a la primera posición libre del carril indicado."""
+    return _sin_duplicados(
+        sesion, "asignacion", _clave_pallet(pallet_data),
+        lambda: _asignar(tipo_almacen, piso, rack, letra, pallet_data)
+    )
+
+
+def _asignar(tipo_almacen, piso, rack, letra, pallet_data):
+    # Validar que todos los campos requeridos estén llenos
+    if not all([tipo_almacen, piso, rack, letra, pallet_data]):
+        return resultado("error", "Por favor, complete todos los campos antes de asignar.")
+
+    try:
+        n_pallet = extraer_n_pallet(pallet_data)
+    except Exception as e:
+        return resultado(
+            "error", f"Error al procesar el dato ingresado: {str(e)}. Asegúrese de usar el formato correcto."
+        )
+
+    # Con escritura diferida la asignación se acepta en el diario local
+    diario = diario_escaneos.obtener_diario()
+    datos_asignacion = {"tipo_almacen": tipo_almacen, "piso": piso, "rack": rack, "letra": letra}
+    if diario_escaneos.escritura_diferida():
+        return registrar_en_diario(diario, "asignacion", n_pallet, datos_asignacion)
+
+    # Convertir el NPallet al id_pallet
+    try:
+        conn = conexion_bd.obtener_conexion()
+    except ConnectionError as e:
+        if diario is not None:
+            return registrar_en_diario(diario, "asignacion", n_pallet, datos_asignacion)
+        return resultado("error", str(e), n_pallet=n_pallet, sin_conexion=True)
+    try:
+        fila = conexion_bd.ejecutar(conn, "id_pallet_por_npallet", (n_pallet,)).fetchone()
+        if fila is None:
+            return resultado("error", f"El NPallet '{n_pallet}' no existe en la base de datos.", n_pallet=n_pallet)
+        id_pallet = fila[0]
+    except pyodbc.Error as e:
+        return resultado("error", f"Error al buscar el NPallet: {e}", n_pallet=n_pallet)
+    finally:
+        conn.close()
+
+    try:
+        mensaje = conexion_bd.asignar_ubicacion(id_pallet, tipo_almacen, piso, rack, letra)
+    except ConnectionError as e:
+        return resultado("error", str(e), n_pallet=n_pallet, sin_conexion=True)
+    if "Error" in mensaje:
+        return resultado("error", mensaje, n_pallet=n_pallet)
+
+    cache_almacen.invalidar(tipo_almacen)
+    return resultado(
+        "ok",
+        f"Pallet con NPallet {n_pallet} asignado a la ubicación {tipo_almacen}, {piso}, {rack}, {letra}.",
+        n_pallet=n_pallet,
+        id_pallet=id_pallet,
+        ubicacion=datos_asignacion,
+    )
+
+
+def liberar(pallet_data, sesion=None):
+    """Libera la ubicación del pallet escaneado; solo se permite desde la posición 1."""
+    return _sin_duplicados(sesion, "liberacion", _clave_pallet(pallet_data), lambda: _liberar(pallet_data))
+
+
+def _liberar(pallet_data):
+    if not pallet_data:
+        return resultado("error", "Ingrese los datos del pallet.")
+
+    try:
+        n_pallet = extraer_n_pallet(pallet_data)
+    except Exception as e:
+        return resultado(
+            "error", f"Error al procesar los datos ingresados: {str(e)}. Asegúrese de usar el formato correcto."
+        )
+
+    # Convertir el NPallet al id_pallet (y obtener su cámara actual)
+    try:
+        conn = conexion_bd.obtener_conexion()
+    except ConnectionError as e:
+        return resultado("error", str(e), n_pallet=n_pallet, sin_conexion=True)
+    try:
+        fila = conexion_bd.ejecutar(conn, "pallet_y_tipo_por_npallet", (n_pallet,)).fetchone()
+        if fila is None:
+            return resultado("error", f"El NPallet '{n_pallet}' no existe en la base de datos.", n_pallet=n_pallet)
+        id_pallet, tipo_almacen = fila[0], fila[1]
+    except pyodbc.Error as e:
+        return resultado("error", f"Error al buscar el NPallet: {e}", n_pallet=n_pallet)
+    finally:
+        conn.close()
+
+    try:
+        mensaje = conexion_bd.liberar_ubicacion(id_pallet)
+    except ConnectionError as e:
+        return resultado("error", str(e), n_pallet=n_pallet, sin_conexion=True)
+
+    if "Ubicación liberada y reorganizada" in mensaje:
+        cache_almacen.invalidar(tipo_almacen)
+        return resultado(
+            "ok",
+            f"Pallet ({n_pallet}) liberado y ubicación reorganizada exitosamente.",
+            n_pallet=n_pallet,
+            id_pallet=id_pallet,
+            tipo_almacen=tipo_almacen,
+        )
+    if "posición 1" in mensaje:
+        mensaje = f"Error: Solo se puede liberar el Pallet con NPallet {n_pallet} desde la posición 1."
+    elif "no está asignado a ninguna ubicación" in mensaje:
+        mensaje = f"Error: El Pallet con NPallet {n_pallet} no está asignado a ninguna ubicación."
+    else:
+        mensaje = f"Error al liberar la ubicación para el Pallet con NPallet {n_pallet}: {mensaje}"
+    return resultado("error", mensaje, n_pallet=n_pallet)
+
+
+def liberar_lote(lista_pallet_data):
+    """
+    Libera en una sola transacción los pallets escaneados (por ejemplo, la carga de
+    un camión). Devuelve un resultado con la cantidad liberada y, en "pallets", el
+    resultado de cada NPallet; el estado es "ok" solo si se liberaron todos.
+    """
+    escaneos = [datos for datos in (lista_pallet_data or []) if datos and datos.strip()]
+    if not escaneos:
+        return resultado("error", "Ingrese los datos de al menos un pallet.", pallets=[])
+    if len(escaneos) > MAXIMO_LOTE_LIBERACION:
+        return resultado(
+            "error", f"Se pueden liberar como máximo {MAXIMO_LOTE_LIBERACION} pallets por lote.", pallets=[]
+        )
+
+    # NPallet de cada escaneo (o el error de formato), sin repetir, en el orden escaneado
+    escaneados = {}
+    for datos in escaneos:
+        try:
+            escaneados.setdefault(extraer_n_pallet(datos), None)
+        except Exception as e:
+            escaneados[datos.strip()] = resultado("error", f"Error al procesar '{datos.strip()}': {str(e)}")
+
+    try:
+        liberaciones = conexion_bd.liberar_ubicaciones([n for n, error in escaneados.items() if error is None])
+    except ConnectionError as e:
+        return resultado("error", str(e), pallets=[], sin_conexion=True)
+
+    for n_pallet, id_pallet, carril, liberado, mensaje in liberaciones:
+        if liberado:
+            cache_almacen.invalidar(carril[0])
+            escaneados[n_pallet] = resultado(
+                "ok", f"Pallet ({n_pallet}) liberado.", n_pallet=n_pallet, id_pallet=id_pallet, tipo_almacen=carril[0]
+            )
+        else:
+            escaneados[n_pallet] = resultado("error", mensaje, n_pallet=n_pallet)
+    pallets = list(escaneados.values())
+
+    liberados = sum(1 for res in pallets if res["estado"] == "ok")
+    return resultado(
+        "ok" if liberados == len(pallets) else "error",
+        f"Se liberaron {liberados} de {len(pallets)} pallets.",
+        liberados=liberados,
+        pallets=pallets,
+    )
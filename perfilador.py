@@ -0,0 +1,168 @@
+# perfilador.py
+
+"""
+Perfilador por petición, opcional, para encontrar qué parte de un callback es lenta.
+
+Mientras dura una petición perfilada, un hilo toma muestras periódicas de la pila del
+hilo que la atiende (sys._current_frames). Al terminar se escriben dos archivos en
+DIRECTORIO_PERFILES:
+
+    <momento>_<nombre>.folded   Pilas colapsadas ("a;b;c 12"), la entrada de
+                                flamegraph.pl, speedscope o inferno.
+    <momento>_<nombre>.txt      Resumen con las TOP_FUNCIONES funciones con más
+                                muestras propias y acumuladas.
+
+Se activa con la variable de entorno PERFILADOR=1 (las siguientes peticiones de
+callbacks de Dash) o con la cabecera "X-Perfilar: 1" en una petición puntual; la
+cabecera solo se atiende si además PERFILADOR_CABECERA=1, para que un cliente
+cualquiera no pueda forzar el muestreo. Cada proceso toma como máximo
+MAXIMO_PERFILES perfiles (PERFILES_MAXIMO) y en el directorio se conservan solo los
+MAXIMO_PERFILES más recientes. La respuesta perfilada lleva en "X-Perfil" el nombre
+del archivo, no su ruta. Desactivado, el costo es una comparación por petición.
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from flask import g, request
+
+
+INTERVALO_MUESTREO = 0.001   # Segundos entre muestras
+TOP_FUNCIONES = 25
+DIRECTORIO_PERFILES = os.environ.get("PERFILES_DIR") or os.path.join(tempfile.gettempdir(), "perfiles_almacen")
+PERFILAR_CALLBACKS = os.environ.get("PERFILADOR") == "1"
+PERMITIR_CABECERA = os.environ.get("PERFILADOR_CABECERA") == "1"
+MAXIMO_PERFILES = int(os.environ.get("PERFILES_MAXIMO", "20"))
+
+RUTA_CALLBACKS = "/_dash-update-component"
+
+_lock = threading.Lock()
+_perfiles_tomados = 0
+
+
+class Muestreador:
+    """Toma muestras de la pila de un hilo en segundo plano y cuenta las pilas vistas."""
+
+    def __init__(self, id_hilo, intervalo=INTERVALO_MUESTREO):
+        self.id_hilo = id_hilo
+        self.intervalo = intervalo
+        self.pilas = Counter()
+        self._detener = threading.Event()
+        self._hilo = threading.Thread(target=self._muestrear, name="perfilador", daemon=True)
+
+    def iniciar(self):
+        self._hilo.start()
+
+    def detener(self):
+        self._detener.set()
+        self._hilo.join()
+        return self.pilas
+
+    def _muestrear(self):
+        while not self._detener.wait(self.intervalo):
+            marco = sys._current_frames().get(self.id_hilo)
+            pila = []
+            while marco is not None:
+                codigo = marco.f_code
+                pila.append(f"{codigo.co_name} ({os.path.basename(codigo.co_filename)}:{codigo.co_firstlineno})")
+                marco = marco.f_back
+            if pila:
+                self.pilas[tuple(reversed(pila))] += 1
+
+
+def pilas_colapsadas(pilas):
+    """Formato de pilas colapsadas: una línea "raíz;...;hoja cantidad" por pila."""
+    return "".join(f"{';'.join(pila)} {cantidad}\n" for pila, cantidad in pilas.most_common())
+
+
+def resumen(pilas, segundos, titulo, top=TOP_FUNCIONES):
+    """Resumen de texto con las funciones de más muestras propias y acumuladas."""
+    total = sum(pilas.values()) or 1
+    propias = Counter()
+    acumuladas = Counter()
+    for pila, cantidad in pilas.items():
+        propias[pila[-1]] += cantidad
+        for funcion in set(pila):
+            acumuladas[funcion] += cantidad
+
+    lineas = [titulo, f"Duración: {segundos * 1000:.1f} ms, {sum(pilas.values())} muestras", ""]
+    for nombre, contador in (("Tiempo propio", propias), ("Tiempo acumulado", acumuladas)):
+        lineas.append(f"{nombre} (top {top}):")
+        for funcion, cantidad in contador.most_common(top):
+            lineas.append(f"  {100 * cantidad / total:6.1f}%  {cantidad:6d}  {funcion}")
+        lineas.append("")
+    return "\n".join(lineas)
+
+
+def _nombre_peticion():
+    """Nombre corto para los archivos: la salida del callback de Dash o la ruta."""
+    if request.path == RUTA_CALLBACKS:
+        cuerpo = request.get_json(silent=True) or {}
+        nombre = cuerpo.get("output", "callback")
+    else:
+        nombre = request.path
+    return "".join(c if c.isalnum() or c in "-_." else "_" for c in nombre).strip("._")[:80] or "peticion"
+
+
+def _reservar_perfil():
+    """Descuenta un perfil del máximo del proceso; False si ya se tomaron todos."""
+    global _perfiles_tomados
+    with _lock:
+        if _perfiles_tomados >= MAXIMO_PERFILES:
+            return False
+        _perfiles_tomados += 1
+        if _perfiles_tomados == MAXIMO_PERFILES:
+            print(f"Perfilador: se tomaron {MAXIMO_PERFILES} perfiles; no se perfilarán más peticiones.")
+        return True
+
+
+def _podar_directorio():
+    """Borra los perfiles más antiguos para conservar solo los MAXIMO_PERFILES más recientes."""
+    perfiles = sorted(f[: -len(".folded")] for f in os.listdir(DIRECTORIO_PERFILES) if f.endswith(".folded"))
+    for nombre in perfiles[: max(0, len(perfiles) - MAXIMO_PERFILES)]:
+        for extension in (".folded", ".txt"):
+            try:
+                os.remove(os.path.join(DIRECTORIO_PERFILES, nombre + extension))
+            except OSError:
+                pass
+
+
+def instalar(servidor):
+    """Registra el perfilador en el servidor Flask de la aplicación."""
+
+    @servidor.before_request
+    def iniciar_perfil():
+        if not (
+            (PERMITIR_CABECERA and request.headers.get("X-Perfilar") == "1")
+            or (PERFILAR_CALLBACKS and request.path == RUTA_CALLBACKS)
+        ):
+            return
+        if not _reservar_perfil():
+            return
+        g.perfil = (Muestreador(threading.get_ident()), time.perf_counter())
+        g.perfil[0].iniciar()
+
+    @servidor.after_request
+    def terminar_perfil(response):
+        perfil = g.pop("perfil", None)
+        if perfil is None:
+            return response
+        muestreador, inicio = perfil
+        pilas = muestreador.detener()
+        segundos = time.perf_counter() - inicio
+
+        nombre = f"{datetime.now():%Y%m%d-%H%M%S-%f}_{_nombre_peticion()}"
+        os.makedirs(DIRECTORIO_PERFILES, exist_ok=True)
+        base = os.path.join(DIRECTORIO_PERFILES, nombre)
+        with open(base + ".folded", "w", encoding="utf-8") as f:
+            f.write(pilas_colapsadas(pilas))
+        with open(base + ".txt", "w", encoding="utf-8") as f:
+            f.write(resumen(pilas, segundos, f"{request.method} {request.path} ({nombre})"))
+        _podar_directorio()
+        response.headers["X-Perfil"] = nombre + ".folded"
+        return response
@@ -0,0 +1,114 @@
+# pronostico.py
+
+"""
+Pronóstico de llenado por rack y por cámara.
+
+A partir del registro de movimientos se calculan, por rack, las tasas de entrada
+(asignaciones) y de salida (liberaciones) por hora como el promedio de las últimas
+VENTANA_HORAS horas, contadas hasta el momento del cálculo y no hasta la última hora
+completa. Con la tasa neta y los espacios disponibles de los
+contadores de ocupación se proyecta en cuántas horas se llenará cada rack y la
+cámara completa.
+
+Las tasas se calculan por columnas (pandas) y se guardan TTL_TASAS segundos, ya que
+cambian lentamente; la proyección se rehace con cada lectura a partir de los
+contadores, sin consultar la base.
+"""
+
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+import movimientos
+from ocupacion import ocupacion_por_rack
+
+
+VENTANA_HORAS = 24        # Horas de historia para las tasas de entrada y salida
+TTL_TASAS = 60.0          # Segundos que se reutilizan las tasas calculadas
+
+COLUMNAS_TASAS = ["Entradas/h", "Salidas/h"]
+
+_lock = threading.Lock()
+_tasas = {}   # tipo_almacen -> (momento, DataFrame de tasas por rack)
+
+
+def calcular_tasas(momentos, operaciones, racks, ahora, ventana_horas=VENTANA_HORAS):
+    """
+    Tasas de entrada y salida por hora de cada rack: los movimientos de las
+    `ventana_horas` horas que terminan en `ahora` divididos por `ventana_horas`. La
+    ventana no se redondea a horas completas, así que la hora en curso pesa lo que
+    lleva transcurrido. Devuelve un DataFrame indexado por rack con las columnas
+    COLUMNAS_TASAS.
+    """
+    df = pd.DataFrame({
+        "momento": pd.to_datetime(pd.Series(momentos, dtype="object")),
+        "operacion": pd.Series(operaciones, dtype="object"),
+        "rack": pd.Series(racks, dtype="object"),
+    })
+    ahora = pd.Timestamp(ahora)
+    df = df[(df["momento"] > ahora - pd.Timedelta(hours=ventana_horas)) & (df["momento"] <= ahora)]
+    if df.empty:
+        return pd.DataFrame(columns=COLUMNAS_TASAS, dtype="float64")
+
+    conteos = df.groupby(["rack", "operacion"]).size().unstack("operacion", fill_value=0)
+    tasas = (conteos / ventana_horas).reindex(columns=["asignacion", "liberacion"], fill_value=0.0)
+    tasas.columns = COLUMNAS_TASAS
+    return tasas.fillna(0.0)
+
+
+def obtener_tasas(tipo_almacen):
+    """Tasas por rack de una cámara, recalculadas como máximo cada TTL_TASAS segundos."""
+    entrada = _tasas.get(tipo_almacen)
+    if entrada is not None and time.monotonic() - entrada[0] < TTL_TASAS:
+        return entrada[1]
+
+    ahora = datetime.now()
+    lectura = movimientos.entradas_salidas_desde(tipo_almacen, ahora - timedelta(hours=VENTANA_HORAS))
+    if lectura:
+        tasas = calcular_tasas(lectura.columna(0), lectura.columna(1), lectura.columna(2), ahora)
+    else:
+        tasas = pd.DataFrame(columns=COLUMNAS_TASAS, dtype="float64")
+    with _lock:
+        _tasas[tipo_almacen] = (time.monotonic(), tasas)
+    return tasas
+
+
+def pronosticar(tipo_almacen):
+    """
+    Pronóstico por rack y total de la cámara: DataFrame con Rack, Entradas/h,
+    Salidas/h, Neto/h, Disponibles y Horas (NaN si con las tasas actuales no se llena).
+    """
+    columnas = ["Rack", "Entradas/h", "Salidas/h", "Neto/h", "Disponibles", "Horas"]
+    racks = ocupacion_por_rack(tipo_almacen)
+    if not racks:
+        return pd.DataFrame(columns=columnas)
+    df = pd.DataFrame(
+        [(rack, total - ocupados) for rack, (ocupados, total) in sorted(racks.items())],
+        columns=["Rack", "Disponibles"],
+    )
+    tasas = obtener_tasas(tipo_almacen)
+    df = df.join(tasas, on="Rack").fillna({columna: 0.0 for columna in COLUMNAS_TASAS})
+
+    total = pd.DataFrame([{
+        "Rack": "Cámara",
+        "Disponibles": df["Disponibles"].sum(),
+        "Entradas/h": df["Entradas/h"].sum(),
+        "Salidas/h": df["Salidas/h"].sum(),
+    }])
+    df = pd.concat([df, total], ignore_index=True)
+    df["Neto/h"] = df["Entradas/h"] - df["Salidas/h"]
+    df["Horas"] = (df["Disponibles"] / df["Neto/h"].where(df["Neto/h"] > 0)).where(df["Disponibles"] > 0, 0.0)
+    return df[columnas]
+
+
+def describir_horas(horas):
+    """Texto para el panel: "en 5.5 h", "en 3.2 días", "lleno" o "sin llenado previsto"."""
+    if pd.isna(horas):
+        return "sin llenado previsto"
+    if horas <= 0:
+        return "lleno"
+    if horas < 48:
+        return f"en {horas:.1f} h"
+    return f"en {horas / 24:.1f} días"
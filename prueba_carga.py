@@ -0,0 +1,229 @@
+# prueba_carga.py
+
+"""
+Prueba de carga con varios escáneres operando a la vez.
+
+Simula N operadores que escanean pallets contra los mismos callbacks que usa la
+aplicación (manejar_ingresar_pallet, asignar_y_refrescar y handle_liberar_pallet),
+sobre la base local de bd_local.py. Para cada nivel de concurrencia informa el
+rendimiento (operaciones por segundo), la latencia (p50/p95/p99) y las tasas de
+rechazo, conflicto y excepción.
+
+Uso:
+    python prueba_carga.py --operadores 1,2,4,8 --duracion 20 --pensar 300
+"""
+
+import argparse
+import itertools
+import os
+import random
+import tempfile
+import threading
+import time
+
+import bd_local
+
+
+# Fragmentos de los mensajes que envuelven errores de pyodbc (bloqueos, timeouts, etc.)
+# o conflictos de versión agotados los reintentos
+MENSAJES_CONFLICTO = (
+    "Conflicto al",
+    "Error al ingresar pallet:",
+    "Error al asignar ubicación:",
+    "Error al liberar ubicación:",
+    "Error al buscar el NPallet:",
+)
+
+MEZCLA_POR_DEFECTO = "ingreso=0.4,asignacion=0.35,liberacion=0.25"
+
+
+def parsear_mezcla(texto):
+    """Convierte 'ingreso=0.4,asignacion=0.35,...' en un diccionario de pesos."""
+    mezcla = {}
+    for parte in texto.split(","):
+        operacion, peso = parte.split("=")
+        mezcla[operacion.strip()] = float(peso)
+    return mezcla
+
+
+def percentil(valores, p):
+    """Percentil p (0-100) de una lista ya ordenada."""
+    if not valores:
+        return 0.0
+    indice = min(len(valores) - 1, int(round(p / 100 * (len(valores) - 1))))
+    return valores[indice]
+
+
+def clasificar(feedback):
+    """Clasifica la respuesta de un callback en ok, rechazo o conflicto."""
+    color = getattr(feedback, "color", None)
+    mensaje = str(getattr(feedback, "children", feedback))
+    if color == "success":
+        return "ok"
+    if any(prefijo in mensaje for prefijo in MENSAJES_CONFLICTO):
+        return "conflicto"
+    return "rechazo"
+
+
+class Operador(threading.Thread):
+    """Un operador con escáner: piensa, elige una operación según la mezcla y la ejecuta."""
+
+    def __init__(self, app, ruta_bd, mezcla, pensar_ms, fin, contador, resultados, semilla):
+        super().__init__(daemon=True)
+        self.app = app
+        self.ruta_bd = ruta_bd
+        self.mezcla = mezcla
+        self.pensar_ms = pensar_ms
+        self.fin = fin
+        self.contador = contador
+        self.resultados = resultados
+        self.azar = random.Random(semilla)
+        self.ingresados = []
+        # Cada operador es un navegador distinto, con su propio identificador de sesión
+        self.sesion = f"operador-{semilla}"
+
+    def run(self):
+        # Conexión propia, fuera de la medición, para elegir pallets y carriles como lo haría un operador
+        auxiliar = bd_local.conectar_bd_local(self.ruta_bd)
+        try:
+            while time.monotonic() < self.fin:
+                if self.pensar_ms:
+                    time.sleep(self.azar.expovariate(1000.0 / self.pensar_ms))
+                operacion = self.azar.choices(list(self.mezcla), weights=list(self.mezcla.values()))[0]
+                self.ejecutar(operacion, auxiliar)
+        finally:
+            auxiliar.close()
+
+    def ejecutar(self, operacion, auxiliar):
+        if operacion == "asignacion" and not self.ingresados:
+            operacion = "ingreso"
+        argumentos = None
+        if operacion == "liberacion":
+            cursor = auxiliar.cursor()
+            cursor.execute(
+                "SELECT p.NPallet FROM ubicaciones u JOIN pallets p ON u.id_pallet_asignado = p.id_pallet "
+                "WHERE u.posicion_pallet = 1 ORDER BY RANDOM() LIMIT 1"
+            )
+            fila = next(iter(cursor.fetchall()), None)
+            if fila is None:
+                operacion = "ingreso"
+            else:
+                argumentos = fila[0]
+        if operacion == "asignacion":
+            cursor = auxiliar.cursor()
+            cursor.execute(
+                "SELECT tipo_almacen, piso, rack, letra FROM ubicaciones "
+                "WHERE id_pallet_asignado IS NULL ORDER BY RANDOM() LIMIT 1"
+            )
+            carril = next(iter(cursor.fetchall()), None)
+            if carril is None:
+                operacion = "ingreso"
+            else:
+                argumentos = (tuple(carril), self.ingresados.pop(self.azar.randrange(len(self.ingresados))))
+
+        inicio = time.perf_counter()
+        try:
+            if operacion == "ingreso":
+                n_pallet = f"{next(self.contador):08d}"
+                qr = f"Variedad{self.azar.randint(1, 5)},Descripcion,Mercado{self.azar.randint(1, 3)},20240101,{n_pallet}"
+                feedback, _ = self.app.manejar_ingresar_pallet(1, qr, self.sesion)
+                resultado = clasificar(feedback)
+                if resultado == "ok":
+                    self.ingresados.append(n_pallet)
+            elif operacion == "asignacion":
+                (tipo_almacen, piso, rack, letra), n_pallet = argumentos
+                feedback = self.app.asignar_y_refrescar(tipo_almacen, piso, rack, 1, letra, n_pallet, self.sesion)[0]
+                resultado = clasificar(feedback)
+            else:
+                feedback = self.app.handle_liberar_pallet(1, argumentos, self.sesion)
+                resultado = clasificar(feedback)
+        except Exception:
+            resultado = "excepcion"
+        self.resultados.append((operacion, resultado, time.perf_counter() - inicio))
+
+
+def ejecutar_nivel(app, operadores, duracion, mezcla, pensar_ms, semilla, directorio):
+    """Ejecuta un nivel de concurrencia sobre una base local nueva y devuelve sus resultados."""
+    ruta_bd = os.path.join(directorio, f"carga_{operadores}.db")
+    # Una sola cámara: la base local no admite asignaciones con varias (ver bd_local.crear_bd_local)
+    bd_local.crear_bd_local(ruta_bd)
+    bd_local.instalar(ruta_bd, app)
+
+    contador = itertools.count(10_000_000 + operadores * 1_000_000)
+    resultados = []
+    fin = time.monotonic() + duracion
+    hilos = [
+        Operador(app, ruta_bd, mezcla, pensar_ms, fin, contador, resultados, semilla + i)
+        for i in range(operadores)
+    ]
+    inicio = time.monotonic()
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    return resultados, time.monotonic() - inicio
+
+
+def resumir(operadores, resultados, segundos):
+    """Calcula rendimiento, latencias y tasas de error de un nivel."""
+    latencias = sorted(latencia for _, _, latencia in resultados)
+    total = len(resultados)
+    conteo = {"ok": 0, "rechazo": 0, "conflicto": 0, "excepcion": 0}
+    for _, resultado, _ in resultados:
+        conteo[resultado] += 1
+    return {
+        "operadores": operadores,
+        "operaciones": total,
+        "ops_por_segundo": total / segundos if segundos else 0.0,
+        "p50_ms": percentil(latencias, 50) * 1000,
+        "p95_ms": percentil(latencias, 95) * 1000,
+        "p99_ms": percentil(latencias, 99) * 1000,
+        "rechazos_pct": 100 * conteo["rechazo"] / total if total else 0.0,
+        "conflictos_pct": 100 * conteo["conflicto"] / total if total else 0.0,
+        "excepciones_pct": 100 * conteo["excepcion"] / total if total else 0.0,
+    }
+
+
+def imprimir_tabla(resumenes):
+    columnas = [
+        ("operadores", "Operadores", 10, "d"),
+        ("operaciones", "Ops", 7, "d"),
+        ("ops_por_segundo", "Ops/s", 8, ".1f"),
+        ("p50_ms", "p50 ms", 8, ".1f"),
+        ("p95_ms", "p95 ms", 8, ".1f"),
+        ("p99_ms", "p99 ms", 8, ".1f"),
+        ("rechazos_pct", "Rechazo%", 9, ".1f"),
+        ("conflictos_pct", "Conflicto%", 11, ".1f"),
+        ("excepciones_pct", "Excepción%", 11, ".1f"),
+    ]
+    print(" ".join(titulo.rjust(ancho) for _, titulo, ancho, _ in columnas))
+    for resumen in resumenes:
+        print(" ".join(f"{resumen[clave]:>{ancho}{formato}}" for clave, _, ancho, formato in columnas))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga con escáneres concurrentes.")
+    parser.add_argument("--operadores", default="1,2,4,8", help="Niveles de concurrencia separados por coma.")
+    parser.add_argument("--duracion", type=float, default=20.0, help="Segundos por nivel.")
+    parser.add_argument("--pensar", type=float, default=300.0, help="Tiempo medio de pensar entre escaneos (ms).")
+    parser.add_argument("--mezcla", default=MEZCLA_POR_DEFECTO, help="Pesos de ingreso, asignacion y liberacion.")
+    parser.add_argument("--semilla", type=int, default=1)
+    args = parser.parse_args()
+
+    # La base local se instala por nivel; no calentar contra la base real al importar
+    os.environ.setdefault("CALENTAMIENTO", "0")
+    import APP
+
+    mezcla = parsear_mezcla(args.mezcla)
+    resumenes = []
+    with tempfile.TemporaryDirectory() as directorio:
+        for operadores in [int(n) for n in args.operadores.split(",")]:
+            resultados, segundos = ejecutar_nivel(
+                APP, operadores, args.duracion, mezcla, args.pensar, args.semilla, directorio
+            )
+            resumenes.append(resumir(operadores, resultados, segundos))
+    imprimir_tabla(resumenes)
+
+
+if __name__ == "__main__":
+    main()
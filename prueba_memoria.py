@@ -0,0 +1,117 @@
+# prueba_memoria.py
+
+"""
+Prueba de memoria de la lectura de posiciones.
+
+Crea una base local (bd_local.py) con un almacén grande y ocupado en su mayoría, y
+mide con tracemalloc la memoria máxima de una actualización: la lectura del snapshot
+(conexion_bd.obtener_todas_las_posiciones) y el DataFrame que arman los callbacks.
+Compara contra la lectura anterior con fetchall y termina con código 1 si la lectura
+por lotes supera LIMITE_BYTES_POR_POSICION, para detectar regresiones.
+
+Uso:
+    python prueba_memoria.py --posiciones 50000 --arraysize 1000
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import tracemalloc
+
+import bd_local
+
+
+# Memoria máxima admitida por posición en la lectura por lotes (snapshot + DataFrame)
+LIMITE_BYTES_POR_POSICION = 750
+OCUPACION = 0.8
+
+LETRAS = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+
+
+def crear_almacen(ruta, posiciones):
+    """Base local con unas `posiciones` ubicaciones (2 racks, 10 pisos) ocupadas en un 80%."""
+    por_carril = max(1, posiciones // (2 * 10 * len(LETRAS)))
+    bd_local.crear_bd_local(ruta, pisos=10, racks=2, letras=LETRAS, posiciones=por_carril)
+    conn = sqlite3.connect(ruta)
+    try:
+        ids = [fila[0] for fila in conn.execute("SELECT id_ubicacion FROM ubicaciones ORDER BY id_ubicacion")]
+        ocupadas = ids[: int(len(ids) * OCUPACION)]
+        conn.executemany(
+            "INSERT INTO pallets (id_pallet, descripcion, Variedad, Mercado, fechafaena, NPallet) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            [
+                (i, f"Pallet {i}", f"Variedad {i % 40}", f"Mercado {i % 12}", f"202401{1 + i % 28:02d}", f"{i:08d}")
+                for i in range(1, len(ocupadas) + 1)
+            ],
+        )
+        conn.executemany(
+            "UPDATE ubicaciones SET id_pallet_asignado = ?, status_ubicacion = 'Ocupado' WHERE id_ubicacion = ?",
+            list(enumerate(ocupadas, start=1)),
+        )
+        conn.commit()
+        return len(ids)
+    finally:
+        conn.close()
+
+
+def medir(funcion):
+    """Ejecuta funcion() y devuelve (resultado, memoria máxima en bytes)."""
+    tracemalloc.start()
+    try:
+        resultado = funcion()
+        _, pico = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return resultado, pico
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memoria máxima de la lectura de posiciones.")
+    parser.add_argument("--posiciones", type=int, default=50_000)
+    parser.add_argument("--arraysize", type=int, default=None, help="Filas por fetchmany (BD_ARRAYSIZE).")
+    args = parser.parse_args()
+
+    # La base local se instala aquí; no calentar contra la base real al importar
+    os.environ.setdefault("CALENTAMIENTO", "0")
+    import conexion_bd
+    import APP
+
+    if args.arraysize:
+        conexion_bd.LECTURA_ARRAYSIZE = args.arraysize
+
+    with tempfile.TemporaryDirectory() as directorio:
+        ruta = os.path.join(directorio, "memoria.db")
+        total = crear_almacen(ruta, args.posiciones)
+        bd_local.instalar(ruta, APP)
+
+        def por_lotes():
+            posiciones = conexion_bd.obtener_todas_las_posiciones()
+            return posiciones, APP.dataframe_posiciones(posiciones)
+
+        def con_fetchall():
+            conn = conexion_bd.obtener_conexion(lectura=True)
+            try:
+                filas = conexion_bd.ejecutar(conn, "posiciones", (None, None)).fetchall()
+            finally:
+                conn.close()
+            return filas, APP.pd.DataFrame.from_records(filas, columns=APP.COLUMNAS_POSICIONES)
+
+        # Una lectura previa para que el cursor preparado y los imports no cuenten
+        por_lotes()
+        _, pico_lotes = medir(por_lotes)
+        _, pico_fetchall = medir(con_fetchall)
+        conexion_bd.vaciar_pool()
+
+    por_posicion = pico_lotes / total
+    print(f"Posiciones: {total}  (arraysize {conexion_bd.LECTURA_ARRAYSIZE})")
+    print(f"fetchall:  {pico_fetchall / 2**20:8.1f} MiB  ({pico_fetchall / total:6.0f} B/posición)")
+    print(f"por lotes: {pico_lotes / 2**20:8.1f} MiB  ({por_posicion:6.0f} B/posición)")
+    if por_posicion > LIMITE_BYTES_POR_POSICION:
+        print(f"ERROR: se supera el límite de {LIMITE_BYTES_POR_POSICION} B/posición.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+# prueba_payload.py
+
+"""
+Prueba del tamaño de las respuestas de los racks.
+
+Arma un rack sintético con la forma del DataFrame de posiciones, lo dibuja con las
+mismas funciones que los callbacks (vista_rack y generar_vista_rack) y serializa el
+resultado como lo hace Dash antes de enviarlo al navegador. Informa los bytes por
+posición del rack completo y del Patch que se envía cuando cambia un solo pallet, y
+termina con código 1 si se supera alguno de los límites, para detectar regresiones.
+Además de los tamaños pedidos, mide un rack de tabla con la forma habitual de una
+cámara (4 pisos, 8 letras y 6 posiciones).
+
+No usa la base de datos.
+
+Uso:
+    python prueba_payload.py --posiciones 400 --posiciones-mapa 4000
+"""
+
+import argparse
+import os
+import sys
+
+from dash._utils import to_json
+
+
+# Bytes máximos admitidos por posición en un rack dibujado completo. La tabla anterior,
+# con un html.Td y su estilo por celda, ocupaba 192 B por posición en el rack de 400
+# posiciones y 214 B en el de 4 x 8 x 6 (medidos con to_json, como aquí); el límite de
+# la tabla exige al menos 10 veces menos que eso.
+LIMITE_BYTES_TABLA = 19
+LIMITE_BYTES_MAPA = 50
+# Bytes máximos del Patch cuando cambia un solo pallet
+LIMITE_BYTES_PARCHE = 2000
+
+OCUPACION = 0.8
+LETRAS = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+
+
+def rack_sintetico(pd, posiciones, rack=1):
+    """DataFrame de posiciones de un rack con unas `posiciones` ubicaciones ocupadas en un 80%."""
+    letras = LETRAS[: max(1, min(len(LETRAS), posiciones // 20))]
+    por_letra = max(1, posiciones // len(letras))
+    pisos = -(-por_letra // 10)
+    return rack_con_forma(pd, pisos, letras, 10, rack).head(por_letra * len(letras))
+
+
+def rack_con_forma(pd, pisos, letras, posiciones, rack=1):
+    """DataFrame de posiciones de un rack de pisos x letras x posiciones, ocupado en un 80%."""
+    filas = []
+    for indice in range(pisos * len(letras) * posiciones):
+        letra = letras[indice % len(letras)]
+        lugar = indice // len(letras)
+        ocupada = indice % 10 < OCUPACION * 10
+        filas.append({
+            "Tipo Almacén": "Camara 1",
+            "Piso": 1 + lugar // posiciones,
+            "Rack": rack,
+            "Letra": letra,
+            "Posición Pallet": 1 + lugar % posiciones,
+            "NPallet": f"{indice + 1:08d}" if ocupada else "Libre",
+            "Variedad": f"Variedad {indice % 40}" if ocupada else None,
+            "Mercado": f"Mercado {indice % 12}" if ocupada else None,
+        })
+    return pd.DataFrame(filas)
+
+
+def medir(APP, df_rack):
+    """(bytes del rack completo, bytes del Patch tras cambiar un pallet) de un rack."""
+    completo = len(to_json(APP.generar_vista_rack(APP.vista_rack(df_rack), "Rack 1")).encode())
+
+    anterior = APP.vista_rack(df_rack)
+    cambiado = df_rack.copy()
+    libre = cambiado.index[cambiado["NPallet"] == "Libre"][0]
+    cambiado.loc[libre, ["NPallet", "Variedad", "Mercado"]] = ["99999999", "Variedad 1", "Mercado 1"]
+    parche = APP.parche_rack(anterior, APP.vista_rack(cambiado))
+    return completo, len(to_json(parche).encode())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bytes por posición de las respuestas de los racks.")
+    parser.add_argument("--posiciones", type=int, default=400, help="Posiciones del rack dibujado como tabla.")
+    parser.add_argument("--posiciones-mapa", type=int, default=4000, help="Posiciones del rack dibujado como mapa.")
+    args = parser.parse_args()
+
+    # Solo se usan las funciones de dibujo; no calentar contra la base al importar
+    os.environ.setdefault("CALENTAMIENTO", "0")
+    os.environ.setdefault("RECONCILIADOR", "0")
+    import APP
+
+    errores = []
+    print(f"{'Vista':>6} {'Posiciones':>11} {'Bytes':>10} {'B/posición':>11} {'Patch 1 pallet':>15}")
+    for tipo, df_rack, limite in (
+        ("tabla", rack_sintetico(APP.pd, min(args.posiciones, APP.UMBRAL_POSICIONES_MAPA - 1)), LIMITE_BYTES_TABLA),
+        ("tabla", rack_con_forma(APP.pd, 4, LETRAS[:8], 6), LIMITE_BYTES_TABLA),
+        ("mapa", rack_sintetico(APP.pd, max(args.posiciones_mapa, APP.UMBRAL_POSICIONES_MAPA)), LIMITE_BYTES_MAPA),
+    ):
+        completo, parche = medir(APP, df_rack)
+        por_posicion = completo / len(df_rack)
+        print(f"{tipo:>6} {len(df_rack):>11d} {completo:>10d} {por_posicion:>11.1f} {parche:>15d}")
+        if por_posicion > limite:
+            errores.append(f"{tipo} de {len(df_rack)}: {por_posicion:.1f} B/posición supera el límite de {limite}")
+        if parche > LIMITE_BYTES_PARCHE:
+            errores.append(f"{tipo} de {len(df_rack)}: el Patch de un pallet ocupa {parche} B (límite {LIMITE_BYTES_PARCHE})")
+
+    for error in errores:
+        print(f"ERROR: {error}")
+    if errores:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+# prueba_replica.py
+
+"""
+Prueba del enrutamiento de lecturas a la réplica.
+
+Crea dos bases locales (bd_local.py), la principal y su réplica, e instala ambas en
+conexion_bd. Comprueba que:
+
+    - las lecturas con lectura=True (cámaras, posiciones) se leen de la réplica, con
+      su atraso, y que la conexión de lectura no admite escrituras;
+    - las escrituras (ingreso y asignación de un pallet) van a la base principal;
+    - si la réplica no está disponible las lecturas usan la base principal, y se
+      vuelve a la réplica pasados ESPERA_REPLICA segundos.
+
+No usa la base de datos real. Termina con código 1 si alguna comprobación falla.
+
+Uso:
+    python prueba_replica.py
+"""
+
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+import pyodbc
+
+import bd_local
+
+
+ESPERA_REPLICA = 0.2   # Segundos sin intentar la réplica tras una falla, acortados para la prueba
+
+QR = "Variedad1,Descripcion,Mercado1,20240101,{n_pallet}"
+
+
+def contar(ruta, sql, params=()):
+    """Primera columna de la primera fila de una consulta, leída directamente del archivo."""
+    conn = sqlite3.connect(ruta)
+    try:
+        return conn.execute(sql, params).fetchone()[0]
+    finally:
+        conn.close()
+
+
+def agregar_camara(ruta, tipo_almacen):
+    """
+    Agrega una cámara de una sola posición, solo en la base indicada, en un carril
+    que no existe en las demás (la base local no asigna en carriles de varias cámaras).
+    """
+    conn = sqlite3.connect(ruta)
+    try:
+        conn.execute(
+            "INSERT INTO ubicaciones (ubicacion_key, tipo_almacen, piso, rack, letra, posicion_pallet) "
+            "VALUES (?, ?, 99, 1, 'A', 1)",
+            (f"{tipo_almacen}-99-1-A-1", tipo_almacen),
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def main():
+    # La base local se instala aquí; no calentar contra la base real al importar
+    os.environ.setdefault("CALENTAMIENTO", "0")
+    os.environ.setdefault("RECONCILIADOR", "0")
+    import conexion_bd
+    import movimientos
+    import operaciones
+
+    conexion_bd.ESPERA_REPLICA = ESPERA_REPLICA
+    errores = []
+
+    def comprobar(descripcion, condicion):
+        print(f"{'ok   ' if condicion else 'FALLA'} {descripcion}")
+        if not condicion:
+            errores.append(descripcion)
+
+    with tempfile.TemporaryDirectory() as directorio:
+        ruta = os.path.join(directorio, "principal.db")
+        ruta_lectura = os.path.join(directorio, "replica.db")
+        bd_local.crear_bd_local(ruta, tipos_almacen=("Camara 1",))
+        bd_local.replicar(ruta, ruta_lectura)
+        bd_local.instalar(ruta, ruta_lectura=ruta_lectura)
+
+        # Lecturas: la cámara agregada después de replicar solo está en la principal
+        agregar_camara(ruta, "Camara 2")
+        comprobar("las lecturas usan la réplica", conexion_bd.obtener_tipos_almacen() == ["Camara 1"])
+        bd_local.replicar(ruta, ruta_lectura)
+        comprobar(
+            "la réplica muestra los cambios replicados",
+            conexion_bd.obtener_tipos_almacen() == ["Camara 1", "Camara 2"],
+        )
+
+        conn = conexion_bd.obtener_conexion(lectura=True)
+        try:
+            conexion_bd.ejecutar(conn, "insertar_pallet_qr", (QR.format(n_pallet="99999999"),))
+            solo_lectura = False
+        except pyodbc.Error:
+            solo_lectura = True
+        finally:
+            conn.close()
+        comprobar("la conexión de lectura no admite escrituras", solo_lectura)
+
+        # Escrituras: van a la principal y la réplica no las ve hasta replicar
+        ingreso = operaciones.ingresar(QR.format(n_pallet="00000001"))
+        asignacion = operaciones.asignar("Camara 1", 1, 1, "A", "00000001")
+        comprobar(
+            "el ingreso y la asignación se confirman",
+            (ingreso["estado"], asignacion["estado"]) == ("ok", "ok"),
+        )
+        sql_asignado = (
+            "SELECT COUNT(*) FROM ubicaciones u JOIN pallets p ON p.id_pallet = u.id_pallet_asignado "
+            "WHERE p.NPallet = ?"
+        )
+        comprobar("las escrituras van a la base principal", contar(ruta, sql_asignado, ("00000001",)) == 1)
+        comprobar("la réplica no recibe escrituras", contar(ruta_lectura, "SELECT COUNT(*) FROM pallets") == 0)
+        posiciones = conexion_bd.obtener_todas_las_posiciones("Camara 1")
+        ocupadas = sum(1 for n_pallet in posiciones.columna(conexion_bd.COLUMNAS_POSICIONES.index("NPallet")) if n_pallet)
+        comprobar("las posiciones se leen de la réplica, con su atraso", ocupadas == 0)
+
+        # Réplica no disponible: se lee de la principal hasta pasada ESPERA_REPLICA
+        conexion_bd.vaciar_pool()
+        os.rename(ruta_lectura, ruta_lectura + ".caida")
+        agregar_camara(ruta, "Camara 3")
+        comprobar(
+            "sin réplica, las lecturas usan la base principal",
+            conexion_bd.obtener_tipos_almacen() == ["Camara 1", "Camara 2", "Camara 3"],
+        )
+        os.rename(ruta_lectura + ".caida", ruta_lectura)
+        comprobar(
+            "durante ESPERA_REPLICA no se vuelve a intentar la réplica",
+            conexion_bd.obtener_tipos_almacen() == ["Camara 1", "Camara 2", "Camara 3"],
+        )
+        time.sleep(ESPERA_REPLICA)
+        comprobar(
+            "pasada ESPERA_REPLICA se vuelve a la réplica",
+            conexion_bd.obtener_tipos_almacen() == ["Camara 1", "Camara 2"],
+        )
+        # Escribir los movimientos en cola antes de borrar las bases temporales
+        movimientos.obtener_registro().vaciar()
+        conexion_bd.vaciar_pool()
+
+    if errores:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
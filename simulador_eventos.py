@@ -0,0 +1,279 @@
+# simulador_eventos.py
+
+"""
+Simulador que reproduce un día de movimientos en el andén.
+
+Reproduce un flujo de eventos de ingreso, asignación y liberación por las mismas
+funciones que usan las páginas y la API de escáneres (operaciones.ingresar, asignar
+y liberar, que llaman a conexion_bd.ingresar_pallet, asignar_ubicacion y
+liberar_ubicacion) sobre la base local de bd_local.py. El flujo puede generarse con
+una semilla fija o leerse de un archivo JSON Lines, uno por línea:
+
+    {"segundo": 12.5, "operacion": "ingreso", "qr": "Variedad,Descripcion,Mercado,20240101,00000001"}
+    {"segundo": 80.0, "operacion": "asignacion", "n_pallet": "00000001",
+     "tipo_almacen": "Camara 1", "piso": 1, "rack": 2, "letra": "C"}
+    {"segundo": 95.2, "operacion": "liberacion", "n_pallet": "00000001"}
+
+"segundo" es el momento del evento desde el inicio del día. Con --velocidad 60 un
+día se reproduce en 24 minutos; con --velocidad 0 los eventos se envían sin pausa,
+para medir el rendimiento máximo. Al terminar se informa el rendimiento, la latencia
+por operación y si el estado final de la base coincide con el esperado.
+
+Uso:
+    python simulador_eventos.py --eventos 5000 --guardar dia.jsonl
+    python simulador_eventos.py --archivo dia.jsonl --velocidad 0
+"""
+
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+from collections import defaultdict
+
+import bd_local
+import conexion_bd
+import consistencia
+import movimientos
+from prueba_carga import percentil
+
+
+TIPO_ALMACEN = "Camara 1"
+SEGUNDOS_DIA = 10 * 3600   # Jornada del andén en los eventos generados
+
+# Peso de cada operación en los eventos generados
+MEZCLA_DIA = {"ingreso": 0.4, "asignacion": 0.35, "liberacion": 0.25}
+
+
+def generar_eventos(cantidad, carriles, semilla=1, segundos=SEGUNDOS_DIA):
+    """
+    Genera `cantidad` eventos válidos repartidos en `segundos`. carriles es
+    {(tipo_almacen, piso, rack, letra): capacidad}. Los pallets se asignan después de
+    ingresar y se liberan desde el frente de su carril, como en el andén.
+    """
+    azar = random.Random(semilla)
+    ocupacion = {carril: 0 for carril in carriles}
+    frentes = defaultdict(list)   # carril -> NPallet en orden de posición
+    por_asignar = []
+    eventos = []
+    momento = 0.0
+    numero = 0
+    for _ in range(cantidad):
+        momento += azar.expovariate(cantidad / segundos)
+        operacion = azar.choices(list(MEZCLA_DIA), weights=list(MEZCLA_DIA.values()))[0]
+        con_lugar = [carril for carril, ocupados in ocupacion.items() if ocupados < carriles[carril]]
+        ocupados = [carril for carril, pallets in frentes.items() if pallets]
+        if operacion == "asignacion" and not (por_asignar and con_lugar):
+            operacion = "ingreso"
+        if operacion == "liberacion" and not ocupados:
+            operacion = "ingreso"
+
+        evento = {"segundo": round(momento, 3), "operacion": operacion}
+        if operacion == "ingreso":
+            numero += 1
+            n_pallet = f"{numero:08d}"
+            evento["qr"] = (
+                f"Variedad{azar.randint(1, 8)},Descripcion,Mercado{azar.randint(1, 4)},"
+                f"202401{azar.randint(1, 28):02d},{n_pallet}"
+            )
+            por_asignar.append(n_pallet)
+        elif operacion == "asignacion":
+            n_pallet = por_asignar.pop(azar.randrange(len(por_asignar)))
+            carril = azar.choice(con_lugar)
+            ocupacion[carril] += 1
+            frentes[carril].append(n_pallet)
+            evento["n_pallet"] = n_pallet
+            evento.update(zip(("tipo_almacen", "piso", "rack", "letra"), carril))
+        else:
+            carril = azar.choice(ocupados)
+            ocupacion[carril] -= 1
+            evento["n_pallet"] = frentes[carril].pop(0)
+        eventos.append(evento)
+    return eventos
+
+
+def leer_eventos(ruta):
+    with open(ruta, encoding="utf-8") as f:
+        return [json.loads(linea) for linea in f if linea.strip()]
+
+
+def guardar_eventos(eventos, ruta):
+    with open(ruta, "w", encoding="utf-8") as f:
+        for evento in eventos:
+            f.write(json.dumps(evento, ensure_ascii=False) + "\n")
+
+
+def leer_carriles(conn):
+    """{(tipo_almacen, piso, rack, letra): capacidad} de la base."""
+    cursor = conn.cursor()
+    cursor.execute("SELECT tipo_almacen, piso, rack, letra, COUNT(*) FROM ubicaciones GROUP BY tipo_almacen, piso, rack, letra")
+    return {tuple(fila[:4]): fila[4] for fila in cursor.fetchall()}
+
+
+def aplicar(evento, operaciones):
+    """Envía un evento por la operación correspondiente y devuelve su resultado."""
+    operacion = evento["operacion"]
+    if operacion == "ingreso":
+        return operaciones.ingresar(evento["qr"])
+    if operacion == "asignacion":
+        return operaciones.asignar(
+            evento["tipo_almacen"], evento["piso"], evento["rack"], evento["letra"], evento["n_pallet"]
+        )
+    if operacion == "liberacion":
+        return operaciones.liberar(evento["n_pallet"])
+    raise ValueError(f"Operación desconocida: {operacion}")
+
+
+def reproducir(eventos, operaciones, velocidad=0.0):
+    """
+    Reproduce los eventos en orden respetando sus momentos divididos por `velocidad`
+    (0 = sin pausas). Devuelve (resultados, segundos, carriles esperados), donde
+    resultados es [(operacion, estado, latencia)] y carriles esperados es
+    {carril: [NPallet en orden de posición]} según las operaciones aceptadas.
+    """
+    esperados = defaultdict(list)
+    ubicacion = {}   # NPallet -> carril
+    resultados = []
+    inicio = time.monotonic()
+    for evento in eventos:
+        if velocidad:
+            espera = inicio + evento.get("segundo", 0.0) / velocidad - time.monotonic()
+            if espera > 0:
+                time.sleep(espera)
+        antes = time.perf_counter()
+        try:
+            estado = aplicar(evento, operaciones)["estado"]
+        except Exception as e:
+            print(f"Excepción en {evento}: {e}")
+            estado = "excepcion"
+        resultados.append((evento["operacion"], estado, time.perf_counter() - antes))
+
+        if estado != "ok":
+            continue
+        if evento["operacion"] == "asignacion":
+            carril = (evento["tipo_almacen"], evento["piso"], evento["rack"], evento["letra"])
+            esperados[carril].append(evento["n_pallet"])
+            ubicacion[evento["n_pallet"]] = carril
+        elif evento["operacion"] == "liberacion":
+            esperados[ubicacion.pop(evento["n_pallet"])].remove(evento["n_pallet"])
+    return resultados, time.monotonic() - inicio, esperados
+
+
+def verificar_estado(conn, esperados):
+    """
+    Compara el estado final de la base con el esperado y revisa sus invariantes
+    (los chequeos de consistencia.py).
+    Devuelve la lista de diferencias encontradas (vacía si es consistente).
+    """
+    cursor = conn.cursor()
+    diferencias = []
+
+    cursor.execute(
+        "SELECT u.tipo_almacen, u.piso, u.rack, u.letra, p.NPallet FROM ubicaciones u "
+        "JOIN pallets p ON p.id_pallet = u.id_pallet_asignado "
+        "ORDER BY u.tipo_almacen, u.piso, u.rack, u.letra, u.posicion_pallet"
+    )
+    reales = defaultdict(list)
+    for tipo_almacen, piso, rack, letra, n_pallet in cursor.fetchall():
+        reales[(tipo_almacen, piso, rack, letra)].append(n_pallet)
+    for carril in set(reales) | {carril for carril, pallets in esperados.items() if pallets}:
+        if reales.get(carril, []) != esperados.get(carril, []):
+            diferencias.append(f"Carril {carril}: base {reales.get(carril, [])}, esperado {esperados.get(carril, [])}")
+
+    for nombre, cantidad in consistencia.revisar(conn).items():
+        diferencias.append(f"{cantidad} {consistencia.CHEQUEOS[nombre][0]}")
+    return diferencias
+
+
+def resumir(resultados, segundos):
+    """Operaciones por segundo y latencias por operación."""
+    por_operacion = defaultdict(list)
+    estados = defaultdict(lambda: defaultdict(int))
+    for operacion, estado, latencia in resultados:
+        por_operacion[operacion].append(latencia)
+        estados[operacion][estado] += 1
+    filas = []
+    for operacion in sorted(por_operacion):
+        latencias = sorted(por_operacion[operacion])
+        filas.append({
+            "operacion": operacion,
+            "cantidad": len(latencias),
+            "ok": estados[operacion]["ok"],
+            "error": len(latencias) - estados[operacion]["ok"],
+            "p50_ms": percentil(latencias, 50) * 1000,
+            "p95_ms": percentil(latencias, 95) * 1000,
+            "p99_ms": percentil(latencias, 99) * 1000,
+        })
+    return {"ops_por_segundo": len(resultados) / segundos if segundos else 0.0, "operaciones": filas}
+
+
+def imprimir_resumen(resumen, segundos, diferencias):
+    print(f"{sum(f['cantidad'] for f in resumen['operaciones'])} eventos en {segundos:.1f} s "
+          f"({resumen['ops_por_segundo']:.1f} ops/s)")
+    print(f"{'Operación':>12} {'Cantidad':>9} {'Ok':>7} {'Error':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for fila in resumen["operaciones"]:
+        print(f"{fila['operacion']:>12} {fila['cantidad']:>9d} {fila['ok']:>7d} {fila['error']:>7d} "
+              f"{fila['p50_ms']:>8.1f} {fila['p95_ms']:>8.1f} {fila['p99_ms']:>8.1f}")
+    if diferencias:
+        print(f"Estado final INCONSISTENTE ({len(diferencias)} diferencias):")
+        for diferencia in diferencias[:20]:
+            print(f"  {diferencia}")
+    else:
+        print("Estado final consistente.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reproduce un día de eventos de escaneo sobre la base local.")
+    parser.add_argument("--archivo", help="Eventos a reproducir (JSON Lines). Sin archivo se generan.")
+    parser.add_argument("--eventos", type=int, default=2000, help="Eventos a generar.")
+    parser.add_argument("--semilla", type=int, default=1)
+    parser.add_argument("--guardar", help="Guarda los eventos generados en este archivo.")
+    parser.add_argument("--velocidad", type=float, default=0.0, help="Veces más rápido que el tiempo real (0 = sin pausas).")
+    parser.add_argument("--pisos", type=int, default=4)
+    parser.add_argument("--racks", type=int, default=2)
+    parser.add_argument("--letras", default="ABCDEFGH")
+    parser.add_argument("--posiciones", type=int, default=6)
+    args = parser.parse_args()
+
+    # La base local se instala aquí; no calentar contra la base real al importar
+    os.environ.setdefault("CALENTAMIENTO", "0")
+    import operaciones
+
+    with tempfile.TemporaryDirectory() as directorio:
+        ruta_bd = os.path.join(directorio, "simulacion.db")
+        bd_local.crear_bd_local(
+            ruta_bd, tipos_almacen=(TIPO_ALMACEN,), pisos=args.pisos, racks=args.racks,
+            letras=args.letras, posiciones=args.posiciones,
+        )
+        bd_local.instalar(ruta_bd)
+
+        if args.archivo:
+            eventos = leer_eventos(args.archivo)
+        else:
+            conn = conexion_bd.obtener_conexion()
+            try:
+                carriles = leer_carriles(conn)
+            finally:
+                conn.close()
+            eventos = generar_eventos(args.eventos, carriles, args.semilla)
+            if args.guardar:
+                guardar_eventos(eventos, args.guardar)
+
+        resultados, segundos, esperados = reproducir(eventos, operaciones, args.velocidad)
+        conn = conexion_bd.obtener_conexion()
+        try:
+            diferencias = verificar_estado(conn, esperados)
+        finally:
+            conn.close()
+        # Escribir los movimientos en cola antes de borrar la base temporal
+        movimientos.obtener_registro().vaciar()
+        conexion_bd.vaciar_pool()
+
+    imprimir_resumen(resumir(resultados, segundos), segundos, diferencias)
+    if diferencias:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()